@@ -1,3 +1,4 @@
+import asyncio
 from datetime import date, datetime,timedelta, timezone
 from typing import Annotated
 
@@ -7,10 +8,12 @@ from fastapi import (
     APIRouter,
     BackgroundTasks,
     Depends,
+    Header,
     HTTPException,
     Path,
     Query,
     Request,
+    Response,
 )
 
 from app.controllers import (
@@ -26,22 +29,36 @@ from app.controllers import (
 )
 from app.controllers.blacklist_sent_logs import BlacklistSentLogsController
 from app.library.helpers.entity_helper import get_company_branch_camera_id
-from app.library.helpers import get_blacklist_data
+from app.library.helpers import (
+    get_blacklist_data,
+    get_incident_blacklist_data,
+    get_watchlist_snapshot,
+)
+from app.library.watchlist_service import WatchlistMatcher
 from app.library.websocket_service.blacklist import BlacklistWebsocketService
 from app.models import Customers_Audit, Incidents, Incidents_Audit
 from app.models.incidents import BlacklistSentLogs
 from app.schemas.requests import (
     BlacklistIncidentRequest,
     DbHardwareSyncRequest,
+    MatchWatchlistRequest,
     RemoveBlacklistRequest,
     TelegramBlacklistIncidentRequest,
 )
-from app.schemas.responses import AddToBlacklistResponse, RemoveBlacklistResponse
+from app.schemas.responses import (
+    AddToBlacklistResponse,
+    BlacklistIncidentsPageResponse,
+    RemoveBlacklistResponse,
+    WatchlistMatchResponse,
+)
+from core.cache import Cache
 from core.config import config
+from core.database import unit_of_work
 from core.exceptions import BadRequestException, NotFoundException
 from core.factory import Factory
 from core.fastapi.dependencies import AuthenticationRequired
 from core.library import logger
+from core.utils.pagination import get_next_cursor
 
 blacklist_router = APIRouter()
 
@@ -96,6 +113,22 @@ async def get_blacklisted_customers(
             le=9223372036854775807,
         ),
     ] = None,
+    cursor: Annotated[
+        str | None,
+        Query(
+            description="Mention the next_cursor received with the previous page",
+        ),
+    ] = None,
+    pagination: Annotated[
+        str,
+        Query(
+            description="""
+                Offset based: offset,
+                Cursor based: cursor
+            """,
+            pattern="^(offset|cursor)$",
+        ),
+    ] = "offset",
     incidents_controller: IncidentsController = Depends(
         controller_factory.get_incidents_controller
     ),
@@ -117,7 +150,7 @@ async def get_blacklisted_customers(
             False if request.user.role_id != config.SUPER_USER_ROLE_ID else True
         )
 
-        return await blacklist_controller.get_blacklists(
+        blacklists = await blacklist_controller.get_blacklists(
             audit_controller=audit_controller,
             incidents_controller=incidents_controller,
             customer_data_controller=customer_data_controller,
@@ -128,8 +161,20 @@ async def get_blacklisted_customers(
             limit=limit,
             branch_id=branch_id,
             is_test_user=is_test_user,
+            cursor=cursor,
         )
 
+        if pagination == "cursor":
+            return BlacklistIncidentsPageResponse(
+                data=blacklists,
+                next_cursor=get_next_cursor(blacklists, limit),
+            )
+
+        return blacklists
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
     except Exception as e:
         logger.error(f"GET /blacklists/{branch_id} : {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -179,6 +224,47 @@ async def get_blacklists_count(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@blacklist_router.post(
+    "/{branch_id}/match",
+    tags=["Blacklists"],
+    dependencies=[Depends(AuthenticationRequired)],
+    response_model=list[list[WatchlistMatchResponse]],
+)
+async def match_watchlist(
+    branch_id: Annotated[int, Path(ge=1, le=9223372036854775807)],
+    match_request: MatchWatchlistRequest,
+):
+    """
+    Finds the k watchlisted customers of the branch closest to each of the
+    descriptors, one list per descriptor from the closest.
+    """
+    try:
+        if not config.WATCHLIST_MATCHER_ENABLED:
+            raise BadRequestException("Watchlist matching is disabled")
+
+        matches = await WatchlistMatcher().search(
+            branch_id=branch_id,
+            descriptors=match_request.descriptors,
+            k=match_request.k,
+            metric=match_request.metric,
+        )
+
+        return [
+            [
+                WatchlistMatchResponse(id=id, customer_id=customer_id, score=score)
+                for id, customer_id, score in descriptor_matches
+            ]
+            for descriptor_matches in matches
+        ]
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"POST /blacklists/{branch_id}/match : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @blacklist_router.post(
     "/",
     tags=["Blacklists"],
@@ -208,47 +294,52 @@ async def blacklist_incident(
     ),
 ):
     try:
-        incident, update_status = await incidents_controller.update_blacklist_status(
-            user_id=request.user.id, update_incident_request=blacklist_request
-        )
+        # status, audits and watchlist row are committed together, once
+        async with unit_of_work():
+            (
+                incident,
+                update_status,
+            ) = await incidents_controller.update_blacklist_status(
+                user_id=request.user.id, update_incident_request=blacklist_request
+            )
+
+            comments = blacklist_request.comments
+
+            if update_status is True:
+                await audit_controller.register(
+                    {
+                        "incident_id": incident.id,
+                        "action_type": blacklist_request.status,
+                        "status": Incidents_Audit.AuditStatus.ADDED,
+                        "comments": comments,
+                        "created_by": request.user.id,
+                        "created_at": datetime.now(pytz.utc),
+                        "updated_at": datetime.now(pytz.utc),
+                        "updated_by": request.user.id,
+                    }
+                )
 
-        comments = blacklist_request.comments
+                comments = None
 
-        if update_status is True:
             await audit_controller.register(
                 {
                     "incident_id": incident.id,
-                    "action_type": blacklist_request.status,
+                    "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
                     "status": Incidents_Audit.AuditStatus.ADDED,
                     "comments": comments,
                     "created_by": request.user.id,
+                    "updated_by": request.user.id,
                     "created_at": datetime.now(pytz.utc),
                     "updated_at": datetime.now(pytz.utc),
-                    "updated_by": request.user.id,
                 }
             )
 
-            comments = None
-
-        await audit_controller.register(
-            {
-                "incident_id": incident.id,
-                "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
-                "status": Incidents_Audit.AuditStatus.ADDED,
-                "comments": comments,
-                "created_by": request.user.id,
-                "updated_by": request.user.id,
-                "created_at": datetime.now(pytz.utc),
-                "updated_at": datetime.now(pytz.utc),
-            }
-        )
-
-        blacklist_obj = await blacklist_controller.register(
-            {
-                "incident_id": incident.id,
-                "created_at": datetime.now(pytz.utc),
-            }
-        )
+            blacklist_obj = await blacklist_controller.register(
+                {
+                    "incident_id": incident.id,
+                    "created_at": datetime.now(pytz.utc),
+                }
+            )
 
         url = f"{config.CUSTOMER_ANALYST_SERVICE_URL}/api/video_analyst/customer_black_list"
         payload = {
@@ -331,47 +422,52 @@ async def telegram_blacklist_incident(
             raise NotFoundException("No incident exists with this id")
 
         blacklist_request.id = incident_obj.id
-        incident, update_status = await incidents_controller.update_blacklist_status(
-            user_id=1, update_incident_request=blacklist_request
-        )
+        # status, audits and watchlist row are committed together, once
+        async with unit_of_work():
+            (
+                incident,
+                update_status,
+            ) = await incidents_controller.update_blacklist_status(
+                user_id=1, update_incident_request=blacklist_request
+            )
 
-        comments = blacklist_request.comments
+            comments = blacklist_request.comments
+
+            if update_status is True:
+                await audit_controller.register(
+                    {
+                        "incident_id": incident.id,
+                        "action_type": blacklist_request.status,
+                        "status": Incidents_Audit.AuditStatus.ADDED,
+                        "comments": comments,
+                        "created_by": 1,
+                        "created_at": datetime.now(pytz.utc),
+                        "updated_at": datetime.now(pytz.utc),
+                        "updated_by": 1,
+                    }
+                )
+
+                comments = None
 
-        if update_status is True:
             await audit_controller.register(
                 {
                     "incident_id": incident.id,
-                    "action_type": blacklist_request.status,
+                    "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
                     "status": Incidents_Audit.AuditStatus.ADDED,
                     "comments": comments,
                     "created_by": 1,
+                    "updated_by": 1,
                     "created_at": datetime.now(pytz.utc),
                     "updated_at": datetime.now(pytz.utc),
-                    "updated_by": 1,
                 }
             )
 
-            comments = None
-
-        await audit_controller.register(
-            {
-                "incident_id": incident.id,
-                "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
-                "status": Incidents_Audit.AuditStatus.ADDED,
-                "comments": comments,
-                "created_by": 1,
-                "updated_by": 1,
-                "created_at": datetime.now(pytz.utc),
-                "updated_at": datetime.now(pytz.utc),
-            }
-        )
-
-        blacklist_obj = await blacklist_controller.register(
-            {
-                "incident_id": incident.id,
-                "created_at": datetime.now(pytz.utc),
-            }
-        )
+            blacklist_obj = await blacklist_controller.register(
+                {
+                    "incident_id": incident.id,
+                    "created_at": datetime.now(pytz.utc),
+                }
+            )
 
         url = f"{config.CUSTOMER_ANALYST_SERVICE_URL}/api/video_analyst/customer_black_list"
         payload = {
@@ -720,3 +816,166 @@ async def db_hardware_sync(
     except Exception as e: 
         logger.log_err_with_line(e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@blacklist_router.get(
+    "/hardware/changes",
+    status_code=200,
+    tags=["Blacklists"],
+)
+async def get_hardware_watchlist_changes(
+    response: Response,
+    company_id: Annotated[str, Query(description="Company uuid")],
+    branch_id: Annotated[str, Query(description="Branch uuid")],
+    since: Annotated[
+        int,
+        Query(
+            ge=0,
+            description="Watchlist version the device is at, 0 for all of it",
+        ),
+    ] = 0,
+    if_none_match: Annotated[str | None, Header()] = None,
+    blacklistsentlogs_contoller: BlacklistSentLogsController = Depends(
+        controller_factory.get_blacklist_sent_logs_controller
+    ),
+):
+    """
+    Returns the watchlist changes of the branch since the version the device
+    is at, and the version to send next time. When the changes since that
+    version are no longer kept, full is set and add holds the whole watchlist.
+    The ETag is the current version, a device sending it back in If-None-Match
+    gets a 304 while the watchlist is unchanged.
+    """
+    try:
+        company_int_id, branch_int_id, _ = await get_company_branch_camera_id(
+            company_uuid=company_id, branch_uuid=branch_id, camera_uuid=None
+        )
+
+        if company_int_id is None or branch_int_id is None:
+            message = (
+                f"Invalid company or branch - company: {company_id}, "
+                f"branch: {branch_id}"
+            )
+            logger.error(message)
+            raise NotFoundException(message)
+
+        version = await blacklistsentlogs_contoller.get_watchlist_version(
+            branch_int_id
+        )
+        etag = f'"{version}"'
+
+        if if_none_match is not None and etag in [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        (
+            version,
+            full,
+            entries,
+            removed_entries,
+        ) = await blacklistsentlogs_contoller.get_watchlist_changes(
+            branch_id=branch_int_id, since_version=since
+        )
+
+        response.headers["ETag"] = f'"{version}"'
+
+        return {
+            "version": version,
+            "full": full,
+            "add": [
+                {
+                    **get_incident_blacklist_data(incident, customer),
+                    "company_id": company_id,
+                    "branch_id": branch_id,
+                }
+                for incident, customer in entries
+            ],
+            "remove": [
+                {"incident_id": entry.incident_id, "customer_id": entry.customer_id}
+                for entry in removed_entries
+            ],
+        }
+
+    except NotFoundException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"GET /blacklists/hardware/changes : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@blacklist_router.get(
+    "/hardware/snapshot",
+    status_code=200,
+    tags=["Blacklists"],
+)
+async def get_hardware_watchlist_snapshot(
+    company_id: Annotated[str, Query(description="Company uuid")],
+    branch_id: Annotated[str, Query(description="Branch uuid")],
+    dtype: Annotated[str, Query(pattern="^(float32|int8)$")] = "float32",
+    if_none_match: Annotated[str | None, Header()] = None,
+    blacklistsentlogs_contoller: BlacklistSentLogsController = Depends(
+        controller_factory.get_blacklist_sent_logs_controller
+    ),
+):
+    """
+    Returns the whole watchlist of the branch as a gzipped binary snapshot,
+    see core.utils.watchlist_snapshot, cached per version. Devices load it on
+    boot, then follow /hardware/changes from the X-Watchlist-Version header.
+    """
+    try:
+        company_int_id, branch_int_id, _ = await get_company_branch_camera_id(
+            company_uuid=company_id, branch_uuid=branch_id, camera_uuid=None
+        )
+
+        if company_int_id is None or branch_int_id is None:
+            message = (
+                f"Invalid company or branch - company: {company_id}, "
+                f"branch: {branch_id}"
+            )
+            logger.error(message)
+            raise NotFoundException(message)
+
+        version = await blacklistsentlogs_contoller.get_watchlist_version(
+            branch_int_id
+        )
+        headers = {"ETag": f'"{version}-{dtype}"', "X-Watchlist-Version": str(version)}
+
+        if if_none_match is not None and headers["ETag"] in [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]:
+            return Response(status_code=304, headers=headers)
+
+        snapshot = await Cache.get_watchlist_snapshot(
+            branch_id=branch_int_id, version=version, dtype=dtype
+        )
+
+        if snapshot is None:
+            entries = await blacklistsentlogs_contoller.get_watchlist_entries(
+                branch_int_id
+            )
+            # encoding and compressing megabytes would hold the event loop
+            snapshot = await asyncio.to_thread(
+                get_watchlist_snapshot, version, entries, dtype
+            )
+            await Cache.cache_watchlist_snapshot(
+                branch_id=branch_int_id,
+                version=version,
+                dtype=dtype,
+                snapshot=snapshot,
+                ttl=config.WATCHLIST_SNAPSHOT_TTL,
+            )
+
+        return Response(
+            content=snapshot,
+            media_type="application/octet-stream",
+            headers={**headers, "Content-Encoding": "gzip"},
+        )
+
+    except NotFoundException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"GET /blacklists/hardware/snapshot : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
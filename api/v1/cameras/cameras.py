@@ -24,7 +24,7 @@ async def create_camera_incident_test(
     ),
 ):
     try:
-        return firestore_controller.publish_camera_incident(
+        return await firestore_controller.publish_camera_incident(
             create_camera_incident_request.model_dump()
         )
 
@@ -12,6 +12,7 @@ from fastapi import (
     Query,
     Request,
 )
+from fastapi.responses import StreamingResponse
 
 from app.controllers import (
     CloudDBController,
@@ -19,20 +20,31 @@ from app.controllers import (
     Customers_Blacklist_Controller,
     CustomersAuditController,
 )
-from app.library.helpers import add_customer_data
+from app.library.customer_index_service import CustomerIndex
+from app.library.helpers import (
+    add_customer_data,
+    add_customers_data,
+    export_customers,
+)
 from app.library.websocket_service.blacklist import BlacklistWebsocketService
 from app.models import Customers_Audit
 from app.schemas.requests import (
     BlacklistCustomerRequest,
     CreateCustomerRequest,
     RemoveBlacklistRequest,
+    SearchCustomersRequest,
+)
+from app.schemas.responses import (
+    AddToBlacklistResponse,
+    CustomerMatchResponse,
+    RemoveBlacklistResponse,
 )
-from app.schemas.responses import AddToBlacklistResponse, RemoveBlacklistResponse
 from core.config import config
-from core.exceptions import BadRequestException
+from core.exceptions import BadRequestException, NotFoundException
 from core.factory import Factory
 from core.fastapi.dependencies import AuthenticationRequired
 from core.library import logger
+from core.utils.export import EXPORT_MEDIA_TYPES, check_export_format
 
 customer_router = APIRouter()
 
@@ -60,6 +72,29 @@ async def add_customer_from_ds(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@customer_router.post(
+    "/batch",
+    status_code=200,
+    tags=["Customers"],
+)
+async def add_customers_from_ds(
+    create_customer_requests: list[CreateCustomerRequest],
+):
+    try:
+        logger.info(f"Received {len(create_customer_requests)} customers")
+        customer_ids = await add_customers_data(
+            [request.model_dump() for request in create_customer_requests]
+        )
+        return {"status": "success", "created": len(customer_ids)}
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"POST /customers/batch : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @customer_router.post(
     "/test",
     status_code=200,
@@ -87,7 +122,13 @@ async def create_customers_test(
             "no_of_visits": 1,
         }
 
-        return await customer_controller.register(customer_data)
+        customer = await customer_controller.register(customer_data)
+
+        if customer is None:
+            raise BadRequestException("Error in finding company or branch or camera")
+
+        # the stored descriptors are bytes, which do not encode as JSON
+        return {"id": customer.id, "customer_id": customer.customer_id}
 
     except BadRequestException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
@@ -97,6 +138,104 @@ async def create_customers_test(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@customer_router.get(
+    "/export",
+    status_code=200,
+    tags=["Customers"],
+    dependencies=[Depends(AuthenticationRequired)],
+)
+async def export_company_customers(
+    company_id: Annotated[int, Query(ge=1, le=9223372036854775807)],
+    from_date: Annotated[
+        date,
+        Query(
+            description="Mention the start date in YYYY-MM-DD format",
+            example="2024-09-27",
+        ),
+    ],
+    to_date: Annotated[
+        date,
+        Query(
+            description="Mention the end date in YYYY-MM-DD format",
+            example="2024-09-30",
+        ),
+    ],
+    branch_ids: Annotated[
+        list[int] | None, Query(description="Mention the branch ids")
+    ] = None,
+    export_format: Annotated[
+        str,
+        Query(alias="format", pattern="^(csv|parquet)$"),
+    ] = "csv",
+):
+    try:
+        check_export_format(export_format)
+
+        # rows are streamed from a server-side cursor as they are encoded
+        return StreamingResponse(
+            export_customers(
+                export_format=export_format,
+                company_id=company_id,
+                branch_ids=branch_ids,
+                from_date=from_date,
+                to_date=to_date,
+            ),
+            media_type=EXPORT_MEDIA_TYPES[export_format],
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="customers_{company_id}_'
+                    f'{from_date}_{to_date}.{export_format}"'
+                )
+            },
+        )
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"GET /customers/export : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@customer_router.post(
+    "/search",
+    status_code=200,
+    tags=["Customers"],
+    dependencies=[Depends(AuthenticationRequired)],
+    response_model=list[list[CustomerMatchResponse]],
+)
+async def search_customers(search_request: SearchCustomersRequest):
+    """
+    Finds the k customers of the company closest to each of the descriptors,
+    one list per descriptor from the closest, to tell whether a face was seen
+    before in any of its branches.
+    """
+    try:
+        if not config.CUSTOMER_INDEX_ENABLED:
+            raise BadRequestException("Customer search is disabled")
+
+        matches = await CustomerIndex().search(
+            company_id=search_request.company_id,
+            descriptors=search_request.descriptors,
+            k=search_request.k,
+        )
+
+        return [
+            [
+                CustomerMatchResponse(id=id, customer_id=customer_id, distance=distance)
+                for id, customer_id, distance in descriptor_matches
+            ]
+            for descriptor_matches in matches
+        ]
+
+    except (BadRequestException, NotFoundException) as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"POST /customers/search : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @customer_router.get(
     "/{branch_id}",
     status_code=200,
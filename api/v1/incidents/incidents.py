@@ -13,6 +13,7 @@ from fastapi import (
     Query,
     Request,
 )
+from fastapi.responses import StreamingResponse
 
 from app.controllers import (
     CloudDBController,
@@ -26,7 +27,13 @@ from app.controllers import (
     IncidentsController,
 )
 from app.library.entity_service import entity
-from app.library.helpers import add_incident, send_notification
+from app.library.helpers import (
+    add_incident,
+    add_incidents,
+    export_incidents,
+    send_incidents_alerts,
+    send_notification,
+)
 from app.library.websocket_service.blacklist import BlacklistWebsocketService
 from app.models import Incidents, Incidents_Analyst_Audit, Incidents_Audit
 from app.schemas.requests import (
@@ -38,13 +45,20 @@ from app.schemas.requests import (
     ValidateIncidentRequest,
     ValidateIncidentTestRequest,
 )
-from app.schemas.responses import CreateIncidentResponse, UpdateIncidentResponse
+from app.schemas.responses import (
+    CreateIncidentBatchResponse,
+    CreateIncidentResponse,
+    IncidentsPageResponse,
+    UpdateIncidentResponse,
+)
 from app.utils.add_logo import VideoLogoOverlay
 from core.config import config
 from core.exceptions import BadRequestException, ForbiddenException, NotFoundException
 from core.factory import Factory
 from core.fastapi.dependencies import AuthenticationRequired
 from core.library import logger
+from core.utils.export import EXPORT_MEDIA_TYPES, check_export_format
+from core.utils.pagination import get_next_cursor
 
 incident_router = APIRouter()
 
@@ -123,6 +137,22 @@ async def get_incidents(
             description="Mention the field to be sorted",
         ),
     ] = None,
+    cursor: Annotated[
+        str | None,
+        Query(
+            description="Mention the next_cursor received with the previous page",
+        ),
+    ] = None,
+    pagination: Annotated[
+        str,
+        Query(
+            description="""
+                Offset based: offset,
+                Cursor based: cursor
+            """,
+            pattern="^(offset|cursor)$",
+        ),
+    ] = "offset",
     incidents_controller: IncidentsController = Depends(
         controller_factory.get_incidents_controller
     ),
@@ -141,7 +171,7 @@ async def get_incidents(
             False if request.user.role_id != config.SUPER_USER_ROLE_ID else True
         )
 
-        return await incidents_controller.get_incidents(
+        incidents = await incidents_controller.get_incidents(
             audit_controller=audit_controller,
             customer_audit_controller=customer_audit_controller,
             customer_data_controller=customer_data_controller,
@@ -153,8 +183,20 @@ async def get_incidents(
             sort=sort,
             branch_ids=branch_ids,
             is_test_user=is_test_user,
+            cursor=cursor,
         )
 
+        if pagination == "cursor":
+            return IncidentsPageResponse(
+                data=incidents,
+                next_cursor=get_next_cursor(incidents, limit),
+            )
+
+        return incidents
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
     except Exception as e:
         logger.error(f"GET /incidents/ : {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -303,6 +345,71 @@ async def get_incidents_count(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@incident_router.get(
+    "/export",
+    status_code=200,
+    tags=["Incidents"],
+    dependencies=[Depends(AuthenticationRequired)],
+)
+async def export_company_incidents(
+    request: Request,
+    company_id: Annotated[int, Query(ge=1, le=9223372036854775807)],
+    from_date: Annotated[
+        date,
+        Query(
+            description="Mention the start date in YYYY-MM-DD format",
+            example="2024-09-27",
+        ),
+    ],
+    to_date: Annotated[
+        date,
+        Query(
+            description="Mention the end date in YYYY-MM-DD format",
+            example="2024-09-30",
+        ),
+    ],
+    branch_ids: Annotated[
+        list[int] | None, Query(description="Mention the branch ids")
+    ] = None,
+    export_format: Annotated[
+        str,
+        Query(alias="format", pattern="^(csv|parquet)$"),
+    ] = "csv",
+):
+    try:
+        check_export_format(export_format)
+
+        is_test_user = (
+            False if request.user.role_id != config.SUPER_USER_ROLE_ID else True
+        )
+
+        # rows are streamed from a server-side cursor as they are encoded
+        return StreamingResponse(
+            export_incidents(
+                export_format=export_format,
+                company_id=company_id,
+                branch_ids=branch_ids,
+                from_date=from_date,
+                to_date=to_date,
+                is_test_user=is_test_user,
+            ),
+            media_type=EXPORT_MEDIA_TYPES[export_format],
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="incidents_{company_id}_'
+                    f'{from_date}_{to_date}.{export_format}"'
+                )
+            },
+        )
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        logger.error(f"GET /incidents/export : {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @incident_router.post(
     "/",
     tags=["Incidents"],
@@ -328,6 +435,45 @@ async def add_incident_from_ds(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@incident_router.post(
+    "/batch",
+    tags=["Incidents"],
+    response_model=list[CreateIncidentBatchResponse],
+)
+async def add_incidents_from_ds(
+    background_tasks: BackgroundTasks,
+    incident_requests: list[CreateIncidentRequest],
+):
+    try:
+        if len(incident_requests) > config.INCIDENTS_BATCH_MAX_SIZE:
+            raise BadRequestException(
+                f"At most {config.INCIDENTS_BATCH_MAX_SIZE} incidents can be sent"
+            )
+
+        logger.info(f"Received {len(incident_requests)} incidents")
+        results, alerts = await add_incidents(
+            [incident_request.model_dump() for incident_request in incident_requests]
+        )
+
+        # notifications, telegram alerts and queueing run after the response
+        background_tasks.add_task(send_incidents_alerts, alerts)
+
+        return results
+
+    except BadRequestException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    except Exception as e:
+        error_logs = {
+            "inci_ids": [
+                incident_request.inci_id for incident_request in incident_requests
+            ],
+            "error": str(e),
+        }
+        logger.error(f"POST /incidents/batch : {error_logs}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @incident_router.post(
     "/test",
     tags=["Incidents"],
@@ -341,7 +487,7 @@ async def create_incident_test(
     ),
 ):
     try:
-        incident_data = firestore_controller.publish_incident(
+        incident_data = await firestore_controller.publish_incident(
             incident_request.model_dump()
         )
 
@@ -1,4 +1,7 @@
 from datetime import datetime
+
+from sqlalchemy import Row
+
 from app.models import BlacklistSentLogs
 from app.repositories import BlacklistSentLogsRepository
 from core.controller import BaseController
@@ -19,4 +22,71 @@ class BlacklistSentLogsController(BaseController[BlacklistSentLogs]):
         )
         
     async def get_blacklist_logs(self,branch_id: int, created_at: datetime):
-         return await self.blacklist_sent_logs_repository.get_blacklist_log(branch_id=branch_id,created_at=created_at)
\ No newline at end of file
+         return await self.blacklist_sent_logs_repository.get_blacklist_log(branch_id=branch_id,created_at=created_at)
+
+    async def get_watchlist_version(self, branch_id: int) -> int:
+        return await self.blacklist_sent_logs_repository.get_watchlist_version(
+            branch_id
+        )
+
+    async def get_watchlist_changes(
+        self, branch_id: int, since_version: int
+    ) -> tuple[int, bool, list[Row], list[Row]]:
+        """
+        Folds the watchlist changes of the branch after since_version into the
+        entries to add and to remove, each incident keeping its last change.
+        Versions are consecutive, so when the change right after since_version
+        was purged, or since_version is unknown, the whole watchlist is sent.
+        :return: the version the client is at after applying the changes,
+            whether they replace its watchlist, the Incidents and Customers rows
+            to add and the incident_id and customer_id rows to remove.
+        """
+        repository = self.blacklist_sent_logs_repository
+        version = await repository.get_watchlist_version(branch_id)
+
+        if since_version == version:
+            return version, False, [], []
+
+        changes = []
+        if since_version < version:
+            changes = await repository.get_watchlist_changes(
+                branch_id=branch_id, after_version=since_version
+            )
+
+        if not changes or changes[0].version != since_version + 1:
+            entries = await repository.get_watchlist_entries(branch_id=branch_id)
+            return version, True, entries, []
+
+        added = {}
+        removed = set()
+
+        for change in changes:
+            if change.incident_id is None:
+                continue
+
+            if change.action_type == BlacklistSentLogs.ActionTypes.ADD:
+                added[change.incident_id] = change.blacklist_id
+                removed.discard(change.incident_id)
+
+            elif change.action_type == BlacklistSentLogs.ActionTypes.REMOVE:
+                added.pop(change.incident_id, None)
+                removed.add(change.incident_id)
+
+        # blacklist entries removed since are left out, their removal is
+        # in the changes of a later version
+        entries = await repository.get_watchlist_entries(
+            branch_id=branch_id, blacklist_ids=list(added.values())
+        )
+        removed_entries = await repository.get_removed_entries(list(removed))
+
+        # the changes may end past the version read above
+        return changes[-1].version, False, entries, removed_entries
+
+    async def get_watchlist_entries(self, branch_id: int) -> list[Row]:
+        """
+        Get the blacklisted incidents of the branch with their customer. Read
+        after the version, they are at least as recent as it.
+        """
+        return await self.blacklist_sent_logs_repository.get_watchlist_entries(
+            branch_id=branch_id
+        )
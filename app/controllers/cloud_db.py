@@ -12,7 +12,7 @@ from app.controllers.incidents_blacklist import Incidents_Blacklist_Controller
 from app.library.entity_service import entity
 from app.library.helpers import (
     add_camera_incident,
-    add_customer_data,
+    add_customers_data,
     add_incident,
     get_blacklist_data,
     update_incident,
@@ -70,11 +70,14 @@ class CloudDBController:
                         document_id = document.result()
 
                         if document_id:
-                            self.cloudDB_handler.update_document(
-                                collection=FIREBASE_INCIDENTS_COLLECTION,
-                                document=f"inci_id-{document_id}",
-                                data={"status": Incidents.IncidentStatus.NONE},
-                            )
+                            asyncio.run_coroutine_threadsafe(
+                                self.cloudDB_handler.update_document(
+                                    collection=FIREBASE_INCIDENTS_COLLECTION,
+                                    document=f"inci_id-{document_id}",
+                                    data={"status": Incidents.IncidentStatus.NONE},
+                                ),
+                                self.event_loop,
+                            ).result()
 
                     elif change.type.name == "REMOVED":
                         pass
@@ -125,20 +128,18 @@ class CloudDBController:
                 return
 
             try:
-                for change in changes:
-                    if change.type.name == "ADDED":
-                        data = change.document.to_dict()
-                        data = change.document
-                        asyncio.run_coroutine_threadsafe(
-                            add_customer_data(data),
-                            self.event_loop,
-                        )
-
-                    elif change.type.name == "MODIFIED":
-                        pass
-
-                    elif change.type.name == "REMOVED":
-                        pass
+                # all the customers of a snapshot are stored in one batch
+                added_documents = [
+                    change.document
+                    for change in changes
+                    if change.type.name == "ADDED"
+                ]
+
+                if added_documents:
+                    asyncio.run_coroutine_threadsafe(
+                        add_customers_data(added_documents),
+                        self.event_loop,
+                    )
 
             except Exception as e:
                 logger.info(f"Error while processing customer data snapshot: {str(e)}")
@@ -196,7 +197,7 @@ class CloudDBController:
 
         return {"status": "No active listeners"}
 
-    def publish_incident(self, incident_request: dict):
+    async def publish_incident(self, incident_request: dict):
         test_company_id = config.TEST_COMPANY_ID
         test_store_id = config.TEST_STORE_ID
         camera_id = config.TEST_CAMERA_ID
@@ -248,7 +249,7 @@ class CloudDBController:
         )
         incident_request["firestore_created_at"] = firestore.SERVER_TIMESTAMP
 
-        self.cloudDB_handler.write_to_document(
+        await self.cloudDB_handler.write_to_document(
             collection=FIREBASE_INCIDENTS_COLLECTION,
             document=f"inci_id-{incident_id}",
             data=incident_request,
@@ -256,7 +257,7 @@ class CloudDBController:
 
         return incident_request
 
-    def publish_camera_incident(self, camera_incident_request: dict):
+    async def publish_camera_incident(self, camera_incident_request: dict):
         test_store_id = config.TEST_STORE_ID
         test_company_id = config.TEST_COMPANY_ID
 
@@ -274,7 +275,7 @@ class CloudDBController:
         camera_incident_request["cam_id"] = config.TEST_CAMERA_ID
         camera_incident_request["cam_inci_id"] = uuid.uuid4().__str__()
 
-        self.cloudDB_handler.write_to_document(
+        await self.cloudDB_handler.write_to_document(
             collection=collection_path,
             document=document_id,
             data=camera_incident_request,
@@ -308,7 +309,7 @@ class CloudDBController:
 
             collection = f"{FIREBASE_BLACKLIST_INCIDENTS_COLLECTION}/{company_uuid}/{branch_uuid}"
 
-            self.cloudDB_handler.write_to_document(
+            await self.cloudDB_handler.write_to_document(
                 collection=collection,
                 document=document,
                 data=blacklist_data,
@@ -364,7 +365,7 @@ class CloudDBController:
 
             collection = f"{FIREBASE_BLACKLIST_INCIDENTS_COLLECTION}/{company_uuid}/{branch_uuid}"
 
-            self.cloudDB_handler.delete_document(
+            await self.cloudDB_handler.delete_document(
                 collection=collection,
                 document=document,
             )
@@ -15,6 +15,9 @@ class Customers_Blacklist_Controller(BaseController[Customers_Blacklist]):
     ) -> Customers_Blacklist | None:
         return await self.blacklist_repository.get_by_id(id=id, join_=join_)
 
+    async def get_customer_id(self, id: int) -> int | None:
+        return await self.blacklist_repository.get_customer_id(id=id)
+
     async def remove_from_blacklist(
         self,
         customer_id: int,
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import date, datetime, timedelta
 
 import pytz
@@ -9,6 +10,7 @@ from app.schemas.responses import CustomerData, GetCustomersResponse
 from core.controller import BaseController
 from core.database import Propagation, Transactional
 from core.library.logging import logger
+from core.utils.descriptors import encode_descriptor
 
 
 def modify_time_range(date_obj: date, hour: int, minute: int, second: int = 0):
@@ -50,6 +52,51 @@ time_intervals = {
 }
 
 
+def get_customer_data(
+    id: int,
+    pic_url: str,
+    analyst_blacklisted: bool,
+    app_blacklisted: bool,
+    visited_time: datetime,
+) -> CustomerData:
+    return CustomerData(
+        customer_id=id,
+        pic_url=pic_url,
+        analyst_blacklisted=analyst_blacklisted,
+        app_blacklisted=app_blacklisted,
+        created_at=visited_time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def get_customer_attributes(
+    add_customer_request: dict, company_id: int, branch_id: int, camera_id: int
+) -> dict:
+    if add_customer_request.get("created_at"):
+        try:
+            visited_time = datetime.strptime(
+                add_customer_request["created_at"], "%Y-%m-%d %H:%M:%S"
+            )
+
+        except Exception:
+            visited_time = datetime.now()
+
+    else:
+        visited_time = datetime.now()
+
+    return {
+        "customer_id": add_customer_request.get("cust_id"),
+        "company_id": company_id,
+        "branch_id": branch_id,
+        "camera_id": camera_id,
+        "descriptor_1": encode_descriptor(add_customer_request.get("descriptor_1")),
+        "descriptor_2": encode_descriptor(add_customer_request.get("descriptor_2")),
+        "pic_url": add_customer_request.get("pic_url"),
+        "no_of_visits": add_customer_request.get("no_of_visits"),
+        "visited_time": visited_time,
+        "created_at": datetime.now(pytz.utc),
+    }
+
+
 class CustomerDataController(BaseController[Customers]):
     def __init__(self, customer_data_repository: CustomerDataRepository):
         super().__init__(model=Customers, repository=customer_data_repository)
@@ -64,6 +111,9 @@ class CustomerDataController(BaseController[Customers]):
     async def get_by_customer_id(self, customer_id: str) -> Customers | None:
         return await self.customer_data_repository.get_by_customer_id(customer_id)
 
+    async def get_by_customer_ids(self, customer_ids: list[str]) -> list[Customers]:
+        return await self.customer_data_repository.get_by_customer_ids(customer_ids)
+
     async def get_branch_customers(
         self,
         branch_id: int,
@@ -82,27 +132,41 @@ class CustomerDataController(BaseController[Customers]):
             limit=limit,
         )
 
-        customer_data = []
-        for (
-            id,
-            pic_url,
-            analyst_blacklisted,
-            app_blacklisted,
-            visited_time,
-        ) in customers:
-            visited_time = visited_time.strftime("%Y-%m-%d %H:%M:%S")
-
-            customer_data.append(
-                CustomerData(
-                    customer_id=id,
-                    pic_url=pic_url,
-                    analyst_blacklisted=analyst_blacklisted,
-                    app_blacklisted=app_blacklisted,
-                    created_at=visited_time,
-                )
-            )
+        return [get_customer_data(*customer) for customer in customers]
 
-        return customer_data
+    async def get_bucketed_customers(
+        self,
+        branch_id: int,
+        from_date: date,
+        to_date: date,
+        bucket: str,
+        is_blacklisted: bool | None,
+        offset: int | None,
+        limit: int | None,
+    ) -> dict[datetime, list[CustomerData]]:
+        """
+        Returns the customers of from_date to to_date grouped by the start of
+        their hour or day bucket, in a single query.
+        """
+        from_datetime = modify_time_range(date_obj=from_date, hour=0, minute=0)
+        to_datetime = modify_time_range(date_obj=to_date, hour=0, minute=0)
+        to_datetime += timedelta(days=1)
+
+        customers = await self.customer_data_repository.get_bucketed_customers(
+            branch_id=branch_id,
+            from_date=from_datetime,
+            to_date=to_datetime,
+            bucket=bucket,
+            is_blacklisted=is_blacklisted,
+            offset=offset,
+            limit=limit,
+        )
+
+        buckets = {}
+        for bucket_start, *customer in customers:
+            buckets.setdefault(bucket_start, []).append(get_customer_data(*customer))
+
+        return buckets
 
     async def get_customers_by_date_and_branch(
         self,
@@ -197,28 +261,25 @@ class CustomerDataController(BaseController[Customers]):
         if from_date == to_date:
             # if no lazy load (initial request)
             if type == 0:
-                for key, value in time_intervals.items():
-                    customer_data = await self.get_customers_by_date_and_branch(
-                        branch_id=branch_id,
-                        from_date=from_date,
-                        to_date=to_date,
-                        from_hour=value[0][0],
-                        from_minute=value[0][1],
-                        to_hour=value[1][0],
-                        to_minute=value[1][1],
-                        is_blacklisted=is_blacklisted,
-                        offset=offset,
-                        limit=limit,
-                    )
+                buckets = await self.get_bucketed_customers(
+                    branch_id=branch_id,
+                    from_date=from_date,
+                    to_date=to_date,
+                    bucket="hour",
+                    is_blacklisted=is_blacklisted,
+                    offset=offset,
+                    limit=limit,
+                )
 
-                    if customer_data:
-                        response.append(
-                            GetCustomersResponse(
-                                interval="Time: ",
-                                label=key,
-                                data=customer_data,
-                            )
+                labels = list(time_intervals)
+                for bucket_start, customer_data in buckets.items():
+                    response.append(
+                        GetCustomersResponse(
+                            interval="Time: ",
+                            label=labels[bucket_start.hour],
+                            data=customer_data,
                         )
+                    )
 
                 return response
 
@@ -274,33 +335,25 @@ class CustomerDataController(BaseController[Customers]):
 
         # if multiple days are selected
         else:
-            response = []
-            current_date = to_date
-
-            while current_date >= from_date:
-                customer_data = await self.get_customers_by_date_and_branch(
-                    branch_id=branch_id,
-                    from_date=current_date,
-                    to_date=current_date,
-                    from_hour=0,
-                    from_minute=0,
-                    to_hour=23,
-                    to_minute=59,
-                    is_blacklisted=is_blacklisted,
-                    offset=offset,
-                    limit=limit,
-                )
+            buckets = await self.get_bucketed_customers(
+                branch_id=branch_id,
+                from_date=from_date,
+                to_date=to_date,
+                bucket="day",
+                is_blacklisted=is_blacklisted,
+                offset=offset,
+                limit=limit,
+            )
 
-                if customer_data:
-                    response.append(
-                        GetCustomersResponse(
-                            interval="Date: ",
-                            label=current_date.strftime("%d %b, %Y"),
-                            data=customer_data,
-                        )
+            # latest day first
+            for bucket_start, customer_data in reversed(buckets.items()):
+                response.append(
+                    GetCustomersResponse(
+                        interval="Date: ",
+                        label=bucket_start.strftime("%d %b, %Y"),
+                        data=customer_data,
                     )
-
-                current_date -= timedelta(days=1)
+                )
 
             return response
 
@@ -316,31 +369,69 @@ class CustomerDataController(BaseController[Customers]):
             logger.error("Error in finding company or branch or camera")
             return
 
-        company_id, branch_id, camera_id = company_branch_camera_response
-
-        if add_customer_request.get("created_at"):
-            try:
-                visited_time = datetime.strptime(
-                    add_customer_request["created_at"], "%Y-%m-%d %H:%M:%S"
-                )
+        return await self.customer_data_repository.create(
+            get_customer_attributes(
+                add_customer_request, *company_branch_camera_response
+            )
+        )
 
-            except Exception:
-                visited_time = datetime.now()
+    @Transactional(propagation=Propagation.REQUIRED)
+    async def register_many(self, add_customer_requests: list[dict]) -> list[str]:
+        """
+        Inserts the customers that are not stored yet in a single statement.
+        Company, branch and camera ids are resolved once per distinct
+        combination, customers that cannot be resolved are skipped.
+        :return: the customer_ids that were inserted.
+        """
+        repository = self.customer_data_repository
+        existing_customer_ids = await repository.get_existing_customer_ids(
+            [request.get("cust_id") for request in add_customer_requests]
+        )
 
-        else:
-            visited_time = datetime.now()
+        add_customer_requests = {
+            request.get("cust_id"): request
+            for request in add_customer_requests
+            if request.get("cust_id") not in existing_customer_ids
+        }
 
-        customer_data = {
-            "customer_id": add_customer_request.get("cust_id"),
-            "company_id": company_id,
-            "branch_id": branch_id,
-            "camera_id": camera_id,
-            "descriptor_1": add_customer_request.get("descriptor_1"),
-            "descriptor_2": add_customer_request.get("descriptor_2"),
-            "pic_url": add_customer_request.get("pic_url"),
-            "no_of_visits": add_customer_request.get("no_of_visits"),
-            "visited_time": visited_time,
-            "created_at": datetime.now(pytz.utc),
+        entity_keys = {
+            (request.get("com_id"), request.get("st_id"), request.get("cam_id"))
+            for request in add_customer_requests.values()
         }
+        entity_responses = await asyncio.gather(
+            *(
+                get_company_branch_camera_id(
+                    company_uuid=company_uuid,
+                    branch_uuid=branch_uuid,
+                    camera_uuid=camera_uuid,
+                )
+                for company_uuid, branch_uuid, camera_uuid in entity_keys
+            )
+        )
+        entity_ids = dict(zip(entity_keys, entity_responses))
+
+        customers = []
+        for customer_id, request in add_customer_requests.items():
+            company_branch_camera_response = entity_ids[
+                (request.get("com_id"), request.get("st_id"), request.get("cam_id"))
+            ]
+
+            if (
+                company_branch_camera_response is None
+                or None in company_branch_camera_response
+            ):
+                logger.error(
+                    f"Error in finding company or branch or camera of {customer_id}"
+                )
+                continue
+
+            # a malformed descriptor would otherwise fail the whole batch
+            try:
+                customers.append(
+                    get_customer_attributes(request, *company_branch_camera_response)
+                )
+
+            except ValueError as e:
+                logger.error(f"Invalid descriptor of {customer_id}: {str(e)}")
 
-        return await self.customer_data_repository.create(customer_data)
+        return await repository.create_many(customers)
@@ -1,10 +1,17 @@
+from collections import defaultdict
 from datetime import date, datetime
 
 import pytz
+from sqlalchemy import Row
+from sqlalchemy.exc import IntegrityError
 
 from app.library import entity
-from app.models import Incidents
-from app.repositories import IncidentsRepository
+from app.models import Incidents, IncidentViews
+from app.repositories import (
+    IncidentDailyCountsRepository,
+    IncidentsRepository,
+    IncidentViewsRepository,
+)
 from app.schemas.requests import (
     BlacklistIncidentRequest,
     UpdateIncidentRequest,
@@ -20,10 +27,11 @@ from app.schemas.responses import (
 from core.cache import Cache
 from core.config import config
 from core.controller import BaseController
-from core.database import Propagation, Transactional
+from core.database import Propagation, Transactional, unit_of_work
 from core.exceptions import BadRequestException
 from core.library.logging import logger
 from core.utils.datetime import convert_from_utc, get_duration_from_current_time
+from core.utils.pagination import decode_cursor
 
 TIMEZONE = config.TIMEZONE
 
@@ -46,16 +54,157 @@ async def get_branch_name(branch_id: int):
     return await entity.get_branch_name(branch_id)
 
 
+def get_incident_response(document: dict, branch_timezone: str) -> IncidentResponse:
+    """
+    Builds the IncidentResponse of a stored document, with its durations from
+    the current time.
+    """
+    response = IncidentResponse.model_validate(document)
+
+    response.duration = get_duration_from_current_time(
+        response.incident_time, branch_timezone
+    )
+    if response.prev_incident_time is not None:
+        response.prev_duration = get_duration_from_current_time(
+            response.prev_incident_time, branch_timezone
+        )
+
+    return response
+
+
+def get_cached_incidents_page(page: dict) -> list[IncidentResponse]:
+    """
+    Rebuilds a cached incidents page, with its durations from the current time.
+    """
+    branch_timezones = page["branch_timezones"]
+
+    return [
+        get_incident_response(incident, branch_timezones[str(incident["branch_id"])])
+        for incident in page["incidents"]
+    ]
+
+
+def get_incident_view(
+    incident: Incidents,
+    response: IncidentResponse,
+    branch_timezone: str,
+    view: IncidentViews | None,
+) -> dict:
+    """
+    Returns the IncidentViews row of a built response, for the version of the
+    view read before building it.
+    """
+    return {
+        "incident_id": incident.id,
+        "customer_id": incident.customer_id,
+        "previous_incident_id": incident.previous_incident_id,
+        "branch_timezone": branch_timezone,
+        "document": response.model_dump(
+            mode="json", exclude={"duration", "prev_duration"}
+        ),
+        "version": 0 if view is None else view.version,
+    }
+
+
+def get_incident_attributes(
+    register_incident_request: dict,
+    related_incident_id: int | None,
+    user_id: int | None = None,
+) -> dict:
+    if register_incident_request.get("created_at"):
+        try:
+            incident_logged_time = register_incident_request["created_at"].replace(
+                " at ", " "
+            )
+            incident_logged_time = datetime.strptime(
+                incident_logged_time, "%B %d, %Y %I:%M:%S %p UTC%z"
+            )
+
+        except Exception:
+            try:
+                incident_logged_time = datetime.strptime(
+                    incident_logged_time, "%Y-%m-%d %H:%M:%S"
+                )
+
+            except Exception as e:
+                logger.error(f"Error in incident logging time: {str(e)}")
+                incident_logged_time = None
+
+    else:
+        incident_logged_time = None
+
+    try:
+        incident_time = datetime.strptime(
+            register_incident_request["inci_time"], "%Y-%m-%d %H:%M:%S"
+        )
+
+    except Exception:
+        incident_time = datetime.strptime(
+            register_incident_request["inci_time"], "%B %d, %Y %H:%M:%S"
+        )
+
+    analyst_blacklisted = None
+    if (
+        register_incident_request["inci_type"]
+        == Incidents.IncidentType.PREVIOUSLY_BLACKLISTED
+    ):
+        analyst_blacklisted = True
+
+    return {
+        "incident_id": register_incident_request["inci_id"],
+        "camera_id": register_incident_request["camera_id"],
+        "company_id": register_incident_request["company_id"],
+        "branch_id": register_incident_request["branch_id"],
+        "thumbnail_url": register_incident_request.get("thumb_image"),
+        "name": register_incident_request["name"],
+        "incident_type": register_incident_request["inci_type"],
+        "no_of_visits": register_incident_request.get("no_of_visits", 1),
+        "incident_time": incident_time,
+        "incident_logged_time": incident_logged_time,
+        "comments": register_incident_request["comments"],
+        "photo_url": register_incident_request["pic_url"],
+        "video_url": register_incident_request["video_url"],
+        "previous_incident_id": related_incident_id,
+        "probable_customer_ids": register_incident_request.get("probable_cust_ids"),
+        "customer_id": register_incident_request.get("customer_id"),
+        "status": register_incident_request["status"],
+        "is_blacklisted": register_incident_request["is_blacklisted"],
+        "response": register_incident_request.get("response"),
+        "analyst_blacklisted": analyst_blacklisted,
+        "is_valid": register_incident_request.get("is_valid"),
+        "analyst_incident_type": register_incident_request["inci_type"],
+        "is_test": register_incident_request.get("is_test", False),
+        "match_score": register_incident_request.get("match_score"),
+        "updated_by": user_id,
+        "created_at": datetime.now(pytz.utc),
+        "updated_at": datetime.now(pytz.utc),
+    }
+
+
 class IncidentsController(BaseController[Incidents]):
-    def __init__(self, incidents_repository: IncidentsRepository):
+    def __init__(
+        self,
+        incidents_repository: IncidentsRepository,
+        daily_counts_repository: IncidentDailyCountsRepository | None = None,
+        incident_views_repository: IncidentViewsRepository | None = None,
+    ):
         super().__init__(model=Incidents, repository=incidents_repository)
         self.incidents_repository = incidents_repository
+        self.daily_counts_repository = daily_counts_repository
+        self.incident_views_repository = incident_views_repository
 
     async def get_incident_by_incident_id(self, incident_id: str) -> Incidents | None:
         return await self.incidents_repository.get_incident_by_incident_id(
             incident_id=incident_id
         )
 
+    async def get_incidents_by_incident_ids(
+        self, incident_ids: list[str]
+    ) -> list[Incidents]:
+        return await self.incidents_repository.get_incidents_by_incident_ids(
+            incident_ids=incident_ids
+        )
+
     async def get_incident_by_id(self, incident_id) -> Incidents:
         incident = await self.incidents_repository.get_by_id(id=incident_id)
 
@@ -64,6 +213,31 @@ class IncidentsController(BaseController[Incidents]):
 
         return incident
 
+    async def get_incident_views(
+        self, incident_ids: list[int]
+    ) -> dict[int, IncidentViews]:
+        if not config.INCIDENT_VIEWS_ENABLED or self.incident_views_repository is None:
+            return {}
+
+        return await self.incident_views_repository.get_by_incident_ids(
+            incident_ids=incident_ids
+        )
+
+    async def store_incident_views(self, views: list[dict]) -> None:
+        """
+        Stores the documents built on read, a failure only costs a rebuild on
+        the next read.
+        """
+        if not config.INCIDENT_VIEWS_ENABLED or self.incident_views_repository is None:
+            return
+
+        try:
+            async with unit_of_work():
+                await self.incident_views_repository.store(views)
+
+        except Exception as e:
+            logger.error(f"Failed to store incident views: {str(e)}")
+
     async def get_incidents_by_customer_id(
         self, incident: Incidents
     ) -> list[Incidents]:
@@ -80,16 +254,21 @@ class IncidentsController(BaseController[Incidents]):
     async def get_suspicious_incidents(
         self, incident: Incidents
     ) -> list[SuspiciousIncidentsResponse]:
-        customer_id = incident.customer_id
-
-        if customer_id is None:
-            return []
+        suspicious_incidents = await self.get_suspicious_incidents_by_incident(
+            incidents=[incident]
+        )
+        return suspicious_incidents.get(incident.id, [])
 
-        suspicious_incidents = await self.get_incidents_by_customer_id(incident)
+    async def get_suspicious_incidents_by_incident(
+        self, incidents: list[Incidents]
+    ) -> dict[int, list[SuspiciousIncidentsResponse]]:
+        related_incidents = await self.incidents_repository.get_related_incidents(
+            incidents=incidents
+        )
 
-        suspicious_incidents_response = []
-        for suspicious_incident in suspicious_incidents:
-            suspicious_incidents_response.append(
+        suspicious_incidents_response = {}
+        for incident_id, suspicious_incidents in related_incidents.items():
+            suspicious_incidents_response[incident_id] = [
                 SuspiciousIncidentsResponse(
                     incident_id=suspicious_incident.id,
                     video_url=suspicious_incident.video_url,
@@ -99,7 +278,8 @@ class IncidentsController(BaseController[Incidents]):
                     incident_time=suspicious_incident.incident_time,
                     comments=suspicious_incident.comments,
                 )
-            )
+                for suspicious_incident in suspicious_incidents
+            ]
 
         return suspicious_incidents_response
 
@@ -111,6 +291,15 @@ class IncidentsController(BaseController[Incidents]):
         to_date: date,
         is_test_user: bool = False,
     ):
+        if config.INCIDENT_COUNTS_ROLLUP_ENABLED:
+            return await self.get_incidents_count_from_rollup(
+                incident_filter=incident_filter,
+                branch_ids=branch_ids,
+                from_date=from_date,
+                to_date=to_date,
+                is_test_user=is_test_user,
+            )
+
         count = await self.incidents_repository.get_incidents_count(
             branch_ids=branch_ids,
             incident_filter=incident_filter,
@@ -163,6 +352,93 @@ class IncidentsController(BaseController[Incidents]):
 
         return response
 
+    async def get_incidents_count_from_rollup(
+        self,
+        incident_filter: list[int],
+        branch_ids: list[int],
+        from_date: date,
+        to_date: date,
+        is_test_user: bool = False,
+    ):
+        category_counts = await self.daily_counts_repository.get_category_counts(
+            branch_ids=branch_ids,
+            from_date=from_date,
+            to_date=to_date,
+            is_test_user=is_test_user,
+        )
+
+        counts = defaultdict(int)
+        for _, category, count in category_counts:
+            counts[category] += count
+
+        categories = [
+            category
+            for category in incident_filter or []
+            if category in Incidents.IncidentCategory.FILTERS
+        ]
+
+        if categories:
+            count = sum(counts[category] for category in set(categories))
+        else:
+            count = sum(counts.values())
+
+        response = {
+            "count": count,
+            "sensitive_theft_count": counts[Incidents.IncidentCategory.SENSITIVE],
+            "likely_theft_count": counts[Incidents.IncidentCategory.LIKELY_THEFT],
+            "blacklisted_count": counts[Incidents.IncidentCategory.BLACKLISTED],
+            "previously_blacklisted_count": counts[
+                Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED
+            ],
+        }
+
+        return response
+
+    async def get_branches_incidents_count_from_rollup(
+        self,
+        branch_ids: list[int],
+        from_date: date,
+        to_date: date,
+        is_test_user: bool = False,
+    ):
+        category_counts = await self.daily_counts_repository.get_category_counts(
+            branch_ids=branch_ids,
+            from_date=from_date,
+            to_date=to_date,
+            is_test_user=is_test_user,
+        )
+
+        branches = {
+            branch_id: {
+                "id": branch_id,
+                "likely_theft_count": 0,
+                "sensitive_theft_count": 0,
+                "blacklist_count": 0,
+            }
+            for branch_id in branch_ids
+        }
+
+        for branch_id, category, count in category_counts:
+            branch = branches[branch_id]
+
+            if category == Incidents.IncidentCategory.LIKELY_THEFT:
+                branch["likely_theft_count"] += count
+
+            elif category == Incidents.IncidentCategory.SENSITIVE:
+                branch["sensitive_theft_count"] += count
+
+            elif category in (
+                Incidents.IncidentCategory.BLACKLISTED,
+                Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED,
+            ):
+                branch["blacklist_count"] += count
+
+        return sorted(
+            branches.values(),
+            key=lambda branch: branch["likely_theft_count"],
+            reverse=True,
+        )
+
     async def get_branches_incidents_count(
         self,
         branch_ids: list[int],
@@ -170,14 +446,25 @@ class IncidentsController(BaseController[Incidents]):
         to_date: date,
         is_test_user: bool = False,
     ):
-        branch_incidents_count = (
-            await self.incidents_repository.get_branches_incidents_count(
-                from_date=from_date,
-                to_date=to_date,
-                branch_ids=branch_ids,
-                is_test_user=is_test_user,
+        if config.INCIDENT_COUNTS_ROLLUP_ENABLED:
+            branch_incidents_count = (
+                await self.get_branches_incidents_count_from_rollup(
+                    from_date=from_date,
+                    to_date=to_date,
+                    branch_ids=branch_ids,
+                    is_test_user=is_test_user,
+                )
+            )
+
+        else:
+            branch_incidents_count = (
+                await self.incidents_repository.get_branches_incidents_count(
+                    from_date=from_date,
+                    to_date=to_date,
+                    branch_ids=branch_ids,
+                    is_test_user=is_test_user,
+                )
             )
-        )
 
         response = []
         for branch in branch_incidents_count:
@@ -244,8 +531,39 @@ class IncidentsController(BaseController[Incidents]):
         sort: str | None,
         branch_ids: list[int],
         is_test_user: bool = False,
+        cursor: str | None = None,
     ) -> list[IncidentResponse]:
-        incidents = await self.incidents_repository.get_incidents(
+        # the default page apps poll is cached, and expired by the
+        # app.models.listeners when an incident of its branches changes
+        is_first_page = (
+            config.INCIDENTS_PAGE_CACHE_ENABLED
+            and limit
+            and not skip
+            and cursor is None
+            and sort is None
+            and from_date is None
+            and to_date is None
+        )
+
+        if is_first_page:
+            page, page_key = await Cache.get_incidents_page(
+                branch_ids=branch_ids,
+                incident_filter=incident_filter,
+                is_test_user=is_test_user,
+                limit=limit,
+            )
+
+            if page is not None:
+                return get_cached_incidents_page(page)
+
+        # the views are read by the same statement as the incidents, so a
+        # document rebuilt from them is dropped by store_incident_views if a
+        # change invalidated it meanwhile, as in get_incident_details
+        join_ = {"blacklists"}
+        if config.INCIDENT_VIEWS_ENABLED and self.incident_views_repository:
+            join_.add("views")
+
+        rows = await self.incidents_repository.get_incidents(
             skip=skip,
             limit=limit,
             sort=sort,
@@ -254,13 +572,49 @@ class IncidentsController(BaseController[Incidents]):
             from_date=from_date,
             to_date=to_date,
             is_test_user=is_test_user,
-            join_={"blacklists"},
+            cursor=decode_cursor(cursor) if cursor else None,
+            join_=join_,
         )
+        incidents = [(row.incident, row.blacklist) for row in rows]
 
         incidents_response = []
 
+        views = {}
+        if "views" in join_:
+            views = {
+                row.incident.id: row.view
+                for row in rows
+                if row.view.version is not None
+            }
+        built_views = {
+            incident_id: view
+            for incident_id, view in views.items()
+            if view.document is not None
+        }
+        rebuilt_views = []
+
+        suspicious_incidents_by_incident = (
+            await self.get_suspicious_incidents_by_incident(
+                incidents=[
+                    incident
+                    for incident, _ in incidents
+                    if incident.id not in built_views
+                ]
+            )
+        )
+
         profile_data = {}
+        branch_timezones = {}
         for incident, blacklist in incidents:
+            view = built_views.get(incident.id)
+
+            if view is not None:
+                branch_timezones[incident.branch_id] = view.branch_timezone
+                incidents_response.append(
+                    get_incident_response(view.document, view.branch_timezone)
+                )
+                continue
+
             prev_photo_url = None
             prev_incident_time = None
             prev_duration = None
@@ -307,20 +661,20 @@ class IncidentsController(BaseController[Incidents]):
 
             profile_data = profile
 
-            suspicious_incidents = await self.get_suspicious_incidents(
-                incident=incident
-            )
+            suspicious_incidents = suspicious_incidents_by_incident.get(incident.id, [])
 
             branch_name = await get_branch_name(branch_id=incident.branch_id)
 
             if branch_timezone is None:
                 branch_timezone = TIMEZONE
 
+            branch_timezones[incident.branch_id] = branch_timezone
+
             duration = get_duration_from_current_time(
                 incident.incident_time, branch_timezone
             )
 
-            if blacklist:
+            if blacklist.id is not None:
                 blacklisted_on = convert_from_utc(blacklist.created_at, branch_timezone)
                 prev_incident_id = blacklist.related_incident_id
 
@@ -356,9 +710,31 @@ class IncidentsController(BaseController[Incidents]):
                 response=incident.response,
             )
             incidents_response.append(response)
+            rebuilt_views.append(
+                get_incident_view(
+                    incident, response, branch_timezone, views.get(incident.id)
+                )
+            )
+
+        if rebuilt_views:
+            await self.store_incident_views(rebuilt_views)
+
+        if is_first_page:
+            await Cache.cache_incidents_page(
+                key=page_key,
+                page={
+                    "branch_timezones": branch_timezones,
+                    "incidents": [
+                        response.model_dump(mode="json")
+                        for response in incidents_response
+                    ],
+                },
+                ttl=config.INCIDENTS_PAGE_CACHE_TTL,
+            )
 
         return incidents_response
 
+    @Transactional(propagation=Propagation.REQUIRED)
     async def update_incident(
         self,
         user_id: int,
@@ -370,10 +746,9 @@ class IncidentsController(BaseController[Incidents]):
         incident.updated_by = user_id
         incident.updated_at = datetime.now(pytz.utc)
 
-        await self.incidents_repository.session.commit()
-
         return incident
 
+    @Transactional(propagation=Propagation.REQUIRED)
     async def remove_from_blacklists(
         self,
         incident_id: int,
@@ -392,7 +767,6 @@ class IncidentsController(BaseController[Incidents]):
                 if previous_incident.is_blacklisted:
                     previous_incident.is_blacklisted = False
                     previous_incident.updated_by = user_id
-                    await self.incidents_repository.session.commit()
                     return previous_incident
                 raise BadRequestException(
                     "Incident is not watchlisted or removed from watchlist"
@@ -408,8 +782,6 @@ class IncidentsController(BaseController[Incidents]):
             incident.is_blacklisted = False
             incident.updated_by = user_id
 
-            await self.incidents_repository.session.commit()
-
             return incident
 
     async def get_incident_details(
@@ -420,6 +792,12 @@ class IncidentsController(BaseController[Incidents]):
         customer_data_controller,
         customer_audit_controller,
     ):
+        views = await self.get_incident_views(incident_ids=[incident_id])
+        view = views.get(incident_id)
+
+        if view is not None and view.document is not None:
+            return get_incident_response(view.document, view.branch_timezone)
+
         incident = await self.get_incident_by_id(incident_id)
         branch_timezone = await get_branch_timezone(incident.branch_id)
 
@@ -514,6 +892,10 @@ class IncidentsController(BaseController[Incidents]):
             response=incident.response,
         )
 
+        await self.store_incident_views(
+            [get_incident_view(incident, response, branch_timezone, view)]
+        )
+
         return response
 
     async def map_customer(
@@ -555,6 +937,7 @@ class IncidentsController(BaseController[Incidents]):
 
         return incident_obj
 
+    @Transactional(propagation=Propagation.REQUIRED)
     async def update_blacklist_status(
         self, user_id: int, update_incident_request: BlacklistIncidentRequest
     ):
@@ -571,7 +954,6 @@ class IncidentsController(BaseController[Incidents]):
         incident.status = update_incident_request.status
         incident.updated_by = user_id
         incident.updated_at = datetime.now(pytz.utc)
-        await self.incidents_repository.session.commit()
 
         return incident, update_status
 
@@ -595,7 +977,7 @@ class IncidentsController(BaseController[Incidents]):
     async def get_blacklisted_incidents(
         self,
         branch_id: int,
-    ) -> list[Incidents]:
+    ) -> list[Row]:
         return await self.incidents_repository.get_blacklisted_incidents(branch_id)
 
     @Transactional(propagation=Propagation.REQUIRED)
@@ -604,39 +986,6 @@ class IncidentsController(BaseController[Incidents]):
     ) -> Incidents:
         related_incident_id = register_incident_request.get("prev_inci_id")
 
-        if register_incident_request.get("created_at"):
-            try:
-                incident_logged_time = register_incident_request["created_at"].replace(
-                    " at ", " "
-                )
-                incident_logged_time = datetime.strptime(
-                    incident_logged_time, "%B %d, %Y %I:%M:%S %p UTC%z"
-                )
-
-            except Exception:
-                try:
-                    incident_logged_time = datetime.strptime(
-                        incident_logged_time, "%Y-%m-%d %H:%M:%S"
-                    )
-
-                except Exception as e:
-                    logger.error(f"Error in incident logging time: {str(e)}")
-                    incident_logged_time = None
-
-        else:
-            incident_logged_time = None
-
-        try:
-            incident_time = datetime.strptime(
-                register_incident_request["inci_time"], "%Y-%m-%d %H:%M:%S"
-            )
-
-        except Exception:
-            incident_time = datetime.strptime(
-                register_incident_request["inci_time"], "%B %d, %Y %H:%M:%S"
-            )
-
-        analyst_blacklisted = None
         if related_incident_id:
             related_incident = await self.get_incident_by_incident_id(
                 incident_id=related_incident_id
@@ -649,40 +998,131 @@ class IncidentsController(BaseController[Incidents]):
 
             related_incident_id = related_incident.id
 
-        if (
-            register_incident_request["inci_type"]
-            == Incidents.IncidentType.PREVIOUSLY_BLACKLISTED
-        ):
-            analyst_blacklisted = True
-
-        incidents_data = {
-            "incident_id": register_incident_request["inci_id"],
-            "camera_id": register_incident_request["camera_id"],
-            "company_id": register_incident_request["company_id"],
-            "branch_id": register_incident_request["branch_id"],
-            "thumbnail_url": register_incident_request.get("thumb_image"),
-            "name": register_incident_request["name"],
-            "incident_type": register_incident_request["inci_type"],
-            "no_of_visits": register_incident_request.get("no_of_visits", 1),
-            "incident_time": incident_time,
-            "incident_logged_time": incident_logged_time,
-            "comments": register_incident_request["comments"],
-            "photo_url": register_incident_request["pic_url"],
-            "video_url": register_incident_request["video_url"],
-            "previous_incident_id": related_incident_id,
-            "probable_customer_ids": register_incident_request.get("probable_cust_ids"),
-            "customer_id": register_incident_request.get("customer_id"),
-            "status": register_incident_request["status"],
-            "is_blacklisted": register_incident_request["is_blacklisted"],
-            "response": register_incident_request.get("response"),
-            "analyst_blacklisted": analyst_blacklisted,
-            "is_valid": register_incident_request.get("is_valid"),
-            "analyst_incident_type": register_incident_request["inci_type"],
-            "is_test": register_incident_request.get("is_test", False),
-            "match_score": register_incident_request.get("match_score"),
-            "updated_by": user_id,
-            "created_at": datetime.now(pytz.utc),
-            "updated_at": datetime.now(pytz.utc),
+        return await self.incidents_repository.create(
+            get_incident_attributes(
+                register_incident_request,
+                related_incident_id=related_incident_id,
+                user_id=user_id,
+            )
+        )
+
+    async def create_incidents(
+        self, incidents_data: list[dict]
+    ) -> list[Incidents | None]:
+        """
+        Inserts the incidents in a single flush, under a savepoint. When it
+        fails, an incident_id stored meanwhile by a concurrent delivery for
+        instance, the incidents are inserted again one savepoint each.
+        :return: the created incidents in order, None for the ones that failed.
+        """
+        session = self.incidents_repository.session
+
+        try:
+            async with session.begin_nested():
+                incidents = await self.incidents_repository.create_all(
+                    incidents_data
+                )
+                await session.flush()
+
+            return incidents
+
+        except IntegrityError as e:
+            if len(incidents_data) == 1:
+                logger.error(f"Error in adding incident: {str(e)}")
+                return [None]
+
+        incidents = []
+        for data in incidents_data:
+            incidents += await self.create_incidents([data])
+
+        return incidents
+
+    @Transactional(propagation=Propagation.REQUIRED)
+    async def register_many(
+        self, register_incident_requests: list[dict]
+    ) -> tuple[list[Incidents | None], dict[str, int]]:
+        """
+        Inserts the incidents, after resolving their previous incidents with a
+        single query. Incidents whose previous incident comes earlier in the
+        batch are inserted in a later flush, once its id is known.
+        :return: the created incidents in request order, None for the ones
+            not created, and the ids of the ones already stored, by
+            incident_id.
+        """
+        related_incidents = await self.get_incidents_by_incident_ids(
+            [
+                request.get("prev_inci_id")
+                for request in register_incident_requests
+                if request.get("prev_inci_id")
+            ]
+        )
+        related_incidents = {
+            incident.incident_id: incident.id for incident in related_incidents
         }
 
-        return await self.incidents_repository.create(incidents_data)
+        incidents = [None] * len(register_incident_requests)
+        existing_incidents = {}
+        pending = list(range(len(register_incident_requests)))
+
+        while pending:
+            pending_incident_ids = {
+                register_incident_requests[index]["inci_id"] for index in pending
+            }
+            ready = []
+            waiting = []
+
+            for index in pending:
+                related_incident_id = register_incident_requests[index].get(
+                    "prev_inci_id"
+                )
+
+                if not related_incident_id or related_incident_id in related_incidents:
+                    ready.append(index)
+
+                elif related_incident_id in pending_incident_ids:
+                    waiting.append(index)
+
+                else:
+                    logger.error(
+                        "No incident exists with this previous incident incident_id"
+                    )
+
+            if not ready:
+                # previous incidents referencing each other
+                break
+
+            created = await self.create_incidents(
+                [
+                    get_incident_attributes(
+                        register_incident_requests[index],
+                        related_incident_id=related_incidents.get(
+                            register_incident_requests[index].get("prev_inci_id")
+                        ),
+                    )
+                    for index in ready
+                ]
+            )
+
+            failed_incident_ids = []
+            for index, incident in zip(ready, created):
+                incidents[index] = incident
+
+                if incident is None:
+                    failed_incident_ids.append(
+                        register_incident_requests[index]["inci_id"]
+                    )
+                else:
+                    related_incidents[incident.incident_id] = incident.id
+
+            if failed_incident_ids:
+                # failed on ux_incidents_incident_id_time, a concurrent delivery
+                # stored them first
+                for incident in await self.get_incidents_by_incident_ids(
+                    failed_incident_ids
+                ):
+                    existing_incidents[incident.incident_id] = incident.id
+                    related_incidents[incident.incident_id] = incident.id
+
+            pending = waiting
+
+        return incidents, existing_incidents
@@ -2,27 +2,39 @@ from datetime import date
 
 from app.controllers.incidents import get_branch_name, get_branch_timezone
 from app.models import Incidents, Incidents_Blacklist
-from app.repositories import Incidents_Blacklist_Repository
+from app.repositories import (
+    IncidentDailyCountsRepository,
+    Incidents_Blacklist_Repository,
+)
 from app.schemas.responses import BlacklistIncidentResponse
 from core.config import config
 from core.controller import BaseController
 from core.database import Propagation, Transactional
 from core.exceptions import BadRequestException
 from core.utils.datetime import convert_from_utc, get_duration_from_current_time
+from core.utils.pagination import decode_cursor
 
 TIMEZONE = config.TIMEZONE
 
 
 class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
-    def __init__(self, blacklist_repository: Incidents_Blacklist_Repository):
+    def __init__(
+        self,
+        blacklist_repository: Incidents_Blacklist_Repository,
+        daily_counts_repository: IncidentDailyCountsRepository | None = None,
+    ):
         super().__init__(model=Incidents_Blacklist, repository=blacklist_repository)
         self.blacklist_repository = blacklist_repository
+        self.daily_counts_repository = daily_counts_repository
 
     async def get_by_id(
         self, id: int, join_: set[str] | None = None
     ) -> Incidents_Blacklist | None:
         return await self.blacklist_repository.get_by_id(id=id, join_=join_)
 
+    async def get_customer_id(self, id: int) -> int | None:
+        return await self.blacklist_repository.get_customer_id(id=id)
+
     async def get_by_incident_id(
         self,
         incident_id: int,
@@ -31,6 +43,7 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
             incident_id=incident_id
         )
 
+    @Transactional(propagation=Propagation.REQUIRED)
     async def remove_from_blacklist(
         self,
         incident_id: int,
@@ -43,7 +56,6 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
             raise BadRequestException(message="No such incident exists")
 
         await self.blacklist_repository.session.delete(blacklist)
-        await self.blacklist_repository.session.commit()
 
         return blacklist.incident_id
 
@@ -59,6 +71,7 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
         limit: int,
         branch_id: int,
         is_test_user: bool = False,
+        cursor: str | None = None,
     ):
         blacklisted_incidents = await self.blacklist_repository.get_blacklists(
             from_date=from_date,
@@ -67,11 +80,18 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
             limit=limit,
             branch_id=branch_id,
             is_test_user=is_test_user,
+            cursor=decode_cursor(cursor) if cursor else None,
             join_={"incidents"},
         )
 
         incidents_response = []
 
+        suspicious_incidents_by_incident = (
+            await incidents_controller.get_suspicious_incidents_by_incident(
+                incidents=[incident for _, incident in blacklisted_incidents]
+            )
+        )
+
         profile_data = {}
         for blacklist, incident in blacklisted_incidents:
             prev_photo_url = None
@@ -120,9 +140,7 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
 
             profile_data = profile
 
-            suspicious_incidents = await incidents_controller.get_suspicious_incidents(
-                incident=incident
-            )
+            suspicious_incidents = suspicious_incidents_by_incident.get(incident.id, [])
 
             branch_name = await get_branch_name(branch_id=incident.branch_id)
 
@@ -171,6 +189,24 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
         to_date: date | None,
         is_test_user: bool = False,
     ):
+        if config.INCIDENT_COUNTS_ROLLUP_ENABLED:
+            category_counts = await self.daily_counts_repository.get_category_counts(
+                branch_ids=[branch_id],
+                from_date=from_date,
+                to_date=to_date,
+                is_test_user=is_test_user,
+            )
+
+            return sum(
+                count
+                for _, category, count in category_counts
+                if category
+                in (
+                    Incidents.IncidentCategory.BLACKLISTED,
+                    Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED,
+                )
+            )
+
         return await self.blacklist_repository.get_blacklists_count(
             from_date=from_date,
             to_date=to_date,
@@ -179,6 +215,15 @@ class Incidents_Blacklist_Controller(BaseController[Incidents_Blacklist]):
             join_={"incidents"},
         )
 
+    @Transactional(propagation=Propagation.REQUIRED)
+    async def register_many(
+        self, register_blacklist_requests: list[dict]
+    ) -> list[Incidents_Blacklist]:
+        """
+        Blacklists newly created incidents, which cannot be blacklisted yet.
+        """
+        return await self.blacklist_repository.create_all(register_blacklist_requests)
+
     @Transactional(propagation=Propagation.REQUIRED)
     async def register(self, register_blacklist_request: dict) -> Incidents_Blacklist:
         blacklist = await self.blacklist_repository.get_by_incident_id(
@@ -14,3 +14,8 @@ class TestWatchlistedController(BaseController[TestWatchlistedCustomers]):
         self, customer_id: int
     ) -> TestWatchlistedCustomers | None:
         return await self.test_watchlist_repository.get_by_customer_id(customer_id)
+
+    async def get_by_customer_ids(
+        self, customer_ids: list[int]
+    ) -> list[TestWatchlistedCustomers]:
+        return await self.test_watchlist_repository.get_by_customer_ids(customer_ids)
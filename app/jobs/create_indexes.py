@@ -0,0 +1,41 @@
+"""
+Creates the indexes declared on the models that are missing from the database.
+
+    python -m app.jobs.create_indexes incidents customers
+
+Indexes on the partitioned incidents table are built on every partition
+while the table is locked for writes, so run it off-peak.
+"""
+
+import argparse
+import asyncio
+
+from app.models import Base
+from core.database.session import engines
+from core.library.logging import logger
+
+
+async def create_indexes(table_names: list[str]) -> None:
+    tables = [Base.metadata.tables[table_name] for table_name in table_names]
+
+    async with engines["writer"].begin() as connection:
+        for table in tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                await connection.run_sync(
+                    lambda sync_connection: index.create(
+                        sync_connection, checkfirst=True
+                    )
+                )
+                logger.info(f"Index {index.name} on {table.name} is in place")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("tables", nargs="+")
+    args = parser.parse_args()
+
+    asyncio.run(create_indexes(table_names=args.tables))
+
+
+if __name__ == "__main__":
+    main()
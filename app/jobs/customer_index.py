@@ -0,0 +1,165 @@
+"""
+Builds the customer index of companies, for the face search of their customers.
+
+    python -m app.jobs.customer_index --company-ids 3 7
+    python -m app.jobs.customer_index --company-ids 3 --nlist 4096
+
+The lists and the codes are learnt from a random sample of the company
+descriptors, then every descriptor is encoded, streamed in id order. The build
+is saved to a new directory that the current link of the company is swapped
+to, so searches keep using the previous build until then. Customers added
+during the build are appended to the new one after the swap.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import shutil
+import time
+from functools import partial
+
+import numpy as np
+
+from app.library.customer_index_service import CustomerIndex
+from app.models import Customers
+from app.repositories import CustomerDataRepository
+from core.config import config
+from core.database.session import async_session_factory
+from core.library.logging import logger
+from core.utils.descriptors import descriptors_to_array
+from core.utils.ivfpq import IVFPQIndex
+
+customer_data_repository = partial(CustomerDataRepository, Customers)
+
+
+def get_vectors(rows) -> tuple[np.ndarray, np.ndarray]:
+    ids = []
+    vectors = []
+
+    for row in rows:
+        descriptors = descriptors_to_array((row.descriptor_1, row.descriptor_2))
+        ids += [row.id] * len(descriptors)
+        vectors.append(descriptors)
+
+    if not ids:
+        return np.empty(0, dtype=np.int64), descriptors_to_array(())
+
+    return np.array(ids, dtype=np.int64), np.concatenate(vectors)
+
+
+async def encode_customers(
+    index: IVFPQIndex, company_id: int, after_id: int, chunk_size: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: the ids, lists and codes of the descriptors of the company
+        customers with an id above after_id.
+    """
+    ids, lists, codes = [], [], []
+
+    async with async_session_factory() as db_session:
+        repository = customer_data_repository(db_session=db_session)
+
+        async for rows in repository.stream_descriptors(
+            company_id=company_id, after_id=after_id, chunk_size=chunk_size
+        ):
+            chunk_ids, vectors = get_vectors(rows)
+            chunk_lists, chunk_codes = index.encode(vectors)
+
+            ids.append(chunk_ids)
+            lists.append(chunk_lists)
+            codes.append(chunk_codes)
+
+    if not ids:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty((0, index.m), dtype=np.uint8),
+        )
+
+    return np.concatenate(ids), np.concatenate(lists), np.concatenate(codes)
+
+
+async def build_company_index(
+    company_id: int, nlist: int | None, chunk_size: int
+) -> None:
+    async with async_session_factory() as db_session:
+        sample = await customer_data_repository(
+            db_session=db_session
+        ).get_descriptor_sample(
+            company_id=company_id, size=config.CUSTOMER_INDEX_TRAINING_SIZE
+        )
+
+    _, vectors = get_vectors(sample)
+    # about 4 * sqrt(n) lists, for the size of the sample
+    nlist = nlist or max(
+        1, min(len(vectors) // 39, 4 * int(math.sqrt(len(vectors))))
+    )
+
+    try:
+        index = IVFPQIndex.train(
+            vectors, nlist=nlist, m=config.CUSTOMER_INDEX_SUBQUANTIZERS
+        )
+
+    except ValueError as e:
+        logger.error(f"Cannot build the customer index of company {company_id}: {e}")
+        return
+
+    ids, lists, codes = await encode_customers(
+        index, company_id=company_id, after_id=0, chunk_size=chunk_size
+    )
+    index.fill(ids, lists, codes)
+
+    company_path = CustomerIndex.get_path(company_id).parent
+    build_path = company_path / "builds" / str(int(time.time()))
+    index.save(build_path)
+
+    # replaces the link at once, searches map the new build on their next call
+    link = company_path / "current.new"
+    link.unlink(missing_ok=True)
+    link.symlink_to(build_path.relative_to(company_path))
+    os.replace(link, company_path / "current")
+
+    # customers added during the build were appended to the previous one
+    ids, lists, codes = await encode_customers(
+        index,
+        company_id=company_id,
+        after_id=int(ids.max(initial=0)),
+        chunk_size=chunk_size,
+    )
+    if len(ids):
+        index.append_entries(ids, lists, codes)
+
+    for build in (company_path / "builds").iterdir():
+        if build != build_path:
+            shutil.rmtree(build, ignore_errors=True)
+
+    logger.info(
+        f"Built the customer index of company {company_id}: "
+        f"{len(index)} descriptors in {index.nlist} lists"
+    )
+
+
+async def build_customer_indexes(
+    company_ids: list[int], nlist: int | None, chunk_size: int
+) -> None:
+    for company_id in company_ids:
+        await build_company_index(company_id, nlist=nlist, chunk_size=chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--company-ids", type=int, nargs="+", required=True)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    asyncio.run(
+        build_customer_indexes(
+            company_ids=args.company_ids, nlist=args.nlist, chunk_size=args.chunk_size
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
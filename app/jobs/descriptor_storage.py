@@ -0,0 +1,189 @@
+"""
+Converts the customers descriptors from JSON text to float32 bytes.
+
+    python -m app.jobs.descriptor_storage copy --batch-size 1000
+    python -m app.jobs.descriptor_storage swap
+    python -m app.jobs.descriptor_storage drop
+
+copy adds descriptor_1_f32 and descriptor_2_f32 and fills them batch by batch,
+while the previous release keeps writing text. Each converted row keeps the
+md5 of the text it was converted from, so a row whose text changes afterwards
+is converted again, and an invalid descriptor, left NULL, is not retried. It
+can be stopped and rerun. swap locks customers, converts the rows written or
+changed since and renames the columns, descriptor_1 becoming descriptor_1_text
+and descriptor_1_f32 becoming descriptor_1, in one transaction. Deploy the
+release storing bytes right after it. drop removes the text columns once
+nothing reads them.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models import Customers
+from core.database.session import engines
+from core.library.logging import logger
+from core.utils.descriptors import encode_descriptor
+
+TABLE = Customers.__tablename__
+DESCRIPTOR_COLUMNS = ("descriptor_1", "descriptor_2")
+# md5 of the text descriptors the float32 ones were converted from
+SOURCE_COLUMN = "descriptors_f32_source"
+SOURCE = "md5(" + " || '|' || ".join(
+    f"coalesce({column}, '')" for column in DESCRIPTOR_COLUMNS
+) + ")"
+
+
+def convert_descriptor(customer_id: int, descriptor: str | None) -> bytes | None:
+    try:
+        return encode_descriptor(descriptor)
+
+    except ValueError as e:
+        logger.error(f"Invalid descriptor of customer {customer_id}: {str(e)}")
+        return None
+
+
+async def convert_batch(
+    connection: AsyncConnection, last_id: int, batch_size: int | None
+) -> tuple[int, int | None]:
+    """
+    Fills the float32 columns of the next rows after last_id whose text
+    descriptors were not converted yet, or changed since.
+    :return: the number of rows converted and the last id converted.
+    """
+    limit = "" if batch_size is None else " LIMIT :batch_size"
+
+    rows = (
+        await connection.execute(
+            text(
+                f"SELECT id, {', '.join(DESCRIPTOR_COLUMNS)}, {SOURCE} AS source "
+                f"FROM {TABLE} "
+                f"WHERE id > :last_id AND {SOURCE_COLUMN} IS DISTINCT FROM {SOURCE} "
+                f"ORDER BY id{limit}"
+            ),
+            {"last_id": last_id, "batch_size": batch_size},
+        )
+    ).all()
+
+    if not rows:
+        return 0, None
+
+    # the md5 selected with the text, a change committed meanwhile differs
+    assignments = ", ".join(
+        [f"{column}_f32 = :{column}" for column in DESCRIPTOR_COLUMNS]
+        + [f"{SOURCE_COLUMN} = :source"]
+    )
+    await connection.execute(
+        text(f"UPDATE {TABLE} SET {assignments} WHERE id = :id"),
+        [
+            {
+                "id": row.id,
+                "source": row.source,
+                **{
+                    column: convert_descriptor(row.id, getattr(row, column))
+                    for column in DESCRIPTOR_COLUMNS
+                },
+            }
+            for row in rows
+        ],
+    )
+
+    return len(rows), rows[-1].id
+
+
+async def get_column_type(connection: AsyncConnection, column: str) -> str | None:
+    result = await connection.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": TABLE, "column": column},
+    )
+    return result.scalar_one_or_none()
+
+
+async def copy_descriptors(batch_size: int, pause: float) -> None:
+    async with engines["writer"].begin() as connection:
+        for column in DESCRIPTOR_COLUMNS:
+            await connection.execute(
+                text(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {column}_f32 bytea")
+            )
+        await connection.execute(
+            text(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {SOURCE_COLUMN} text")
+        )
+
+    total = 0
+    last_id = 0
+    while True:
+        # one transaction per batch, so row locks are held briefly
+        async with engines["writer"].begin() as connection:
+            converted, last_id = await convert_batch(connection, last_id, batch_size)
+
+        total += converted
+        logger.info(f"Converted the descriptors of {total} customers")
+
+        if converted < batch_size:
+            break
+
+        await asyncio.sleep(pause)
+
+
+async def swap_descriptors() -> None:
+    async with engines["writer"].begin() as connection:
+        if await get_column_type(connection, "descriptor_1") == "bytea":
+            logger.info("Descriptors are already stored as float32")
+            return
+
+        # blocks writes until the renamed columns are committed
+        await connection.execute(
+            text(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        )
+
+        converted, _ = await convert_batch(connection, last_id=0, batch_size=None)
+        logger.info(f"Converted the descriptors of {converted} more customers")
+
+        for column in DESCRIPTOR_COLUMNS:
+            await connection.execute(
+                text(f"ALTER TABLE {TABLE} RENAME COLUMN {column} TO {column}_text")
+            )
+            await connection.execute(
+                text(f"ALTER TABLE {TABLE} RENAME COLUMN {column}_f32 TO {column}")
+            )
+        await connection.execute(
+            text(f"ALTER TABLE {TABLE} DROP COLUMN {SOURCE_COLUMN}")
+        )
+
+    logger.info("Descriptors are stored as float32")
+
+
+async def drop_text_descriptors() -> None:
+    async with engines["writer"].begin() as connection:
+        for column in DESCRIPTOR_COLUMNS:
+            await connection.execute(
+                text(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS {column}_text")
+            )
+
+    logger.info("Dropped the text descriptors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("step", choices=("copy", "swap", "drop"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.step == "copy":
+        asyncio.run(copy_descriptors(batch_size=args.batch_size, pause=args.pause))
+
+    elif args.step == "swap":
+        asyncio.run(swap_descriptors())
+
+    else:
+        asyncio.run(drop_text_descriptors())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Adds the generated category column and its index to an existing incidents table.
+
+    python -m app.jobs.incident_category
+
+Adding a stored generated column rewrites the table under an exclusive lock,
+so run it in a maintenance window and before
+'python -m app.jobs.incident_partitions migrate'.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from app.models import Incidents
+from core.database.session import engines
+from core.library.logging import logger
+
+CATEGORY_INDEX = "ix_branch_category_incident_time"
+
+
+async def add_category_column() -> None:
+    engine = engines["writer"]
+    table = Incidents.__table__
+
+    column = CreateColumn(table.c.category).compile(dialect=engine.dialect)
+    index = next(index for index in table.indexes if index.name == CATEGORY_INDEX)
+    index = CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)
+
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column}")
+        )
+        await connection.execute(text(str(index)))
+
+    logger.info(f"Added category column and {CATEGORY_INDEX} to {table.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.parse_args()
+
+    asyncio.run(add_category_column())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Rebuilds branch_incident_daily_counts from the incidents table.
+
+The rollup is kept up to date on every flush, this job only repairs drift
+(raw SQL writes, manual fixes) and backfills history:
+
+    python -m app.jobs.incident_counts --days 3
+    python -m app.jobs.incident_counts --from-date 2024-01-01 --to-date 2024-12-31
+
+It creates the table first if it is missing. Run it over the whole history of
+incidents before deploying the release that reads the counts from it; it can be
+run again.
+"""
+
+import argparse
+import asyncio
+from datetime import date, timedelta
+
+from app.models import BranchIncidentDailyCounts
+from app.repositories import IncidentDailyCountsRepository
+from core.database import session, standalone_session
+from core.database.session import engines
+from core.library.logging import logger
+
+
+async def create_incident_counts_table() -> None:
+    async with engines["writer"].begin() as connection:
+        await connection.run_sync(
+            lambda sync_connection: BranchIncidentDailyCounts.__table__.create(
+                sync_connection, checkfirst=True
+            )
+        )
+
+
+@standalone_session
+async def rebuild_incident_counts(from_date: date, to_date: date) -> None:
+    await create_incident_counts_table()
+
+    repository = IncidentDailyCountsRepository(
+        model=BranchIncidentDailyCounts, db_session=session
+    )
+
+    current_date = from_date
+    while current_date <= to_date:
+        # one day per transaction keeps the table lock short
+        await repository.rebuild(from_date=current_date, to_date=current_date)
+        await session.commit()
+
+        logger.info(f"Rebuilt incident counts for {current_date}")
+        current_date += timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--from-date", type=date.fromisoformat)
+    parser.add_argument("--to-date", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    to_date = args.to_date or date.today()
+    from_date = args.from_date or to_date - timedelta(days=args.days - 1)
+
+    asyncio.run(rebuild_incident_counts(from_date=from_date, to_date=to_date))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Manages the monthly range partitions of the incidents table.
+
+    python -m app.jobs.incident_partitions create --months-ahead 3
+    python -m app.jobs.incident_partitions archive --keep-months 24
+    python -m app.jobs.incident_partitions migrate --chunk-size 50000
+
+create should run from cron (daily is plenty) so the partitions of the coming
+months exist before incidents arrive, anything outside them lands in the
+default partition. archive detaches the partitions older than --keep-months
+and moves them to the archive schema, from where they can be dumped and
+dropped. migrate converts an existing unpartitioned incidents table once.
+"""
+
+import argparse
+import asyncio
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models import Incidents
+from core.database.session import engines
+from core.library.logging import logger
+
+TABLE = Incidents.__tablename__
+ARCHIVE_SCHEMA = "archive"
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_partition_name(month: date, table: str = TABLE) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def get_partition_month(partition_name: str, table: str = TABLE) -> date | None:
+    try:
+        return datetime.strptime(partition_name, f"{table}_%Y_%m").date()
+    except ValueError:
+        return None
+
+
+async def get_partition_names(connection: AsyncConnection, table: str) -> list[str]:
+    result = await connection.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+            """
+        ),
+        {"table": table},
+    )
+    return [row[0] for row in result]
+
+
+async def create_partitions(
+    connection: AsyncConnection,
+    from_month: date,
+    to_month: date,
+    table: str = TABLE,
+) -> None:
+    """
+    Creates the missing monthly partitions of table from from_month to to_month,
+    both inclusive, and its default partition.
+    """
+    await connection.execute(
+        text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    )
+
+    month = from_month
+    while month <= to_month:
+        partition_name = get_partition_name(month, table)
+        await connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            )
+        )
+        month = add_months(month, 1)
+
+
+async def create_future_partitions(months_ahead: int) -> None:
+    current_month = date.today().replace(day=1)
+
+    async with engines["writer"].begin() as connection:
+        await create_partitions(
+            connection,
+            from_month=current_month,
+            to_month=add_months(current_month, months_ahead),
+        )
+
+    logger.info(f"Created {TABLE} partitions up to {months_ahead} months ahead")
+
+
+async def archive_partitions(keep_months: int) -> None:
+    """
+    Detaches the partitions that end before the last keep_months months and
+    moves them to the archive schema.
+    """
+    cutoff_month = add_months(date.today().replace(day=1), -keep_months)
+
+    async with engines["writer"].begin() as connection:
+        await connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+
+        for partition_name in sorted(await get_partition_names(connection, TABLE)):
+            month = get_partition_month(partition_name)
+            if month is None or month >= cutoff_month:
+                continue
+
+            await connection.execute(
+                text(f"ALTER TABLE {TABLE} DETACH PARTITION {partition_name}")
+            )
+            await connection.execute(
+                text(f"ALTER TABLE {partition_name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            )
+            logger.info(f"Archived {partition_name} to {ARCHIVE_SCHEMA}")
+
+
+async def migrate(chunk_size: int, months_ahead: int) -> None:
+    """
+    Moves an unpartitioned incidents table into a partitioned one.
+
+    Rows are copied in id order, chunk by chunk, each in its own transaction,
+    so incidents stay writable meanwhile. A trigger logs the id of every row
+    inserted, updated or deleted from before the copy starts. The final
+    transaction locks incidents, copies the logged rows again, or drops them
+    when they were deleted, drops the foreign keys that reference incidents and
+    swaps the tables. The old table is kept as incidents_unpartitioned until it
+    is dropped by hand.
+    """
+    new_table = f"{TABLE}_partitioned"
+    old_table = f"{TABLE}_unpartitioned"
+    changes_table = f"{TABLE}_migration_changes"
+    indexes = [index.name for index in Incidents.__table__.indexes]
+    # generated columns are computed by the new table itself
+    columns = ", ".join(
+        column.name
+        for column in Incidents.__table__.columns
+        if column.computed is None
+    )
+
+    async with engines["writer"].begin() as connection:
+        if await get_partition_names(connection, TABLE):
+            logger.info(f"{TABLE} is already partitioned")
+            return
+
+        # committed before max_id is read, so every write the copy may miss is
+        # logged: creating the trigger waits for the writes in progress
+        await connection.execute(text(f"CREATE TABLE {changes_table} (id bigint)"))
+        await connection.execute(
+            text(
+                f"""
+                CREATE FUNCTION {changes_table}_log() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        INSERT INTO {changes_table} VALUES (OLD.id);
+                    ELSE
+                        INSERT INTO {changes_table} VALUES (NEW.id);
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+                """
+            )
+        )
+        await connection.execute(
+            text(
+                f"CREATE TRIGGER {changes_table}_log "
+                f"AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+                f"FOR EACH ROW EXECUTE FUNCTION {changes_table}_log()"
+            )
+        )
+
+    async with engines["writer"].begin() as connection:
+        min_time, max_id = (
+            await connection.execute(
+                text(f"SELECT min(incident_time), max(id) FROM {TABLE}")
+            )
+        ).one()
+
+        await connection.execute(
+            text(
+                f"CREATE TABLE {new_table} "
+                f"(LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+                f"INCLUDING GENERATED) "
+                f"PARTITION BY RANGE (incident_time)"
+            )
+        )
+        await connection.execute(
+            text(f"ALTER TABLE {new_table} ADD PRIMARY KEY (id, incident_time)")
+        )
+
+        # built before the copy, under temporary names, so the swap does not
+        # have to index the whole table while holding the lock
+        for index in Incidents.__table__.indexes:
+            index_columns = ", ".join(
+                str(expression.compile(compile_kwargs={"literal_binds": True}))
+                .replace(f"{TABLE}.", "")
+                for expression in index.expressions
+            )
+            index_where = index.dialect_options["postgresql"]["where"]
+            index_where = "" if index_where is None else f" WHERE {index_where}"
+            unique = "UNIQUE " if index.unique else ""
+            await connection.execute(
+                text(
+                    f"CREATE {unique}INDEX {index.name}_new "
+                    f"ON {new_table} ({index_columns}){index_where}"
+                )
+            )
+
+        current_month = date.today().replace(day=1)
+        await create_partitions(
+            connection,
+            from_month=(min_time or datetime.now()).date().replace(day=1),
+            to_month=add_months(current_month, months_ahead),
+            table=new_table,
+        )
+
+    last_id = 0
+    while max_id is not None and last_id < max_id:
+        async with engines["writer"].begin() as connection:
+            await connection.execute(
+                text(
+                    f"INSERT INTO {new_table} ({columns}) "
+                    f"SELECT {columns} FROM {TABLE} "
+                    f"WHERE id > :last_id AND id <= :next_id"
+                ),
+                {"last_id": last_id, "next_id": last_id + chunk_size},
+            )
+
+        last_id += chunk_size
+        logger.info(f"Copied {TABLE} rows up to id {min(last_id, max_id)}")
+
+    async with engines["writer"].begin() as connection:
+        await connection.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+
+        # rows deleted meanwhile are logged too and are not copied again
+        changed_ids = f"SELECT DISTINCT id FROM {changes_table}"
+        await connection.execute(
+            text(f"DELETE FROM {new_table} WHERE id IN ({changed_ids})")
+        )
+        await connection.execute(
+            text(
+                f"INSERT INTO {new_table} ({columns}) "
+                f"SELECT {columns} FROM {TABLE} WHERE id IN ({changed_ids})"
+            )
+        )
+
+        await connection.execute(text(f"DROP TRIGGER {changes_table}_log ON {TABLE}"))
+        await connection.execute(text(f"DROP FUNCTION {changes_table}_log()"))
+        await connection.execute(text(f"DROP TABLE {changes_table}"))
+
+        foreign_keys = await connection.execute(
+            text(
+                """
+                SELECT conrelid::regclass::text, conname
+                FROM pg_constraint
+                WHERE contype = 'f' AND confrelid = CAST(:table AS regclass)
+                """
+            ),
+            {"table": TABLE},
+        )
+        for referencing_table, constraint_name in foreign_keys.fetchall():
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {referencing_table} "
+                    f"DROP CONSTRAINT {constraint_name}"
+                )
+            )
+
+        await connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old_table}"))
+        await connection.execute(
+            text(
+                f"ALTER TABLE {old_table} "
+                f"RENAME CONSTRAINT {TABLE}_pkey TO {old_table}_pkey"
+            )
+        )
+        for index_name in indexes:
+            await connection.execute(
+                text(f"ALTER INDEX IF EXISTS {index_name} RENAME TO {index_name}_old")
+            )
+
+        await connection.execute(text(f"ALTER TABLE {new_table} RENAME TO {TABLE}"))
+        await connection.execute(
+            text(
+                f"ALTER TABLE {TABLE} "
+                f"RENAME CONSTRAINT {new_table}_pkey TO {TABLE}_pkey"
+            )
+        )
+        for index_name in indexes:
+            await connection.execute(
+                text(f"ALTER INDEX {index_name}_new RENAME TO {index_name}")
+            )
+
+        for partition_name in await get_partition_names(connection, TABLE):
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {partition_name} "
+                    f"RENAME TO {partition_name.replace(new_table, TABLE, 1)}"
+                )
+            )
+
+        await connection.execute(
+            text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        )
+
+    logger.info(f"Partitioned {TABLE}, the old table is kept as {old_table}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create")
+    create_parser.add_argument("--months-ahead", type=int, default=3)
+
+    archive_parser = subparsers.add_parser("archive")
+    archive_parser.add_argument("--keep-months", type=int, default=24)
+
+    migrate_parser = subparsers.add_parser("migrate")
+    migrate_parser.add_argument("--chunk-size", type=int, default=50000)
+    migrate_parser.add_argument("--months-ahead", type=int, default=3)
+
+    args = parser.parse_args()
+
+    if args.command == "create":
+        asyncio.run(create_future_partitions(months_ahead=args.months_ahead))
+
+    elif args.command == "archive":
+        asyncio.run(archive_partitions(keep_months=args.keep_months))
+
+    elif args.command == "migrate":
+        asyncio.run(
+            migrate(chunk_size=args.chunk_size, months_ahead=args.months_ahead)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Clears incident_views documents, for the next read of each incident to rebuild it.
+
+    python -m app.jobs.incident_views
+    python -m app.jobs.incident_views --branch-ids 12 14
+    python -m app.jobs.incident_views --backfill --chunk-size 50000
+
+The views are cleared on every flush that changes what they are built from.
+This job covers what the database does not see: branch names and timezones,
+user profiles, and raw SQL writes. A change can only invalidate a view that
+exists, new incidents get theirs when they are flushed, so --backfill first
+adds the empty views of the incidents stored before incident_views, or by raw
+SQL. It can be run again.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import Incidents, IncidentViews
+from core.database.session import engines
+from core.library.logging import logger
+
+
+async def backfill_incident_views(chunk_size: int) -> None:
+    async with engines["writer"].connect() as connection:
+        max_id = (
+            await connection.execute(select(func.max(Incidents.id)))
+        ).scalar_one()
+
+    last_id = 0
+    added = 0
+    while max_id is not None and last_id < max_id:
+        query = insert(IncidentViews).from_select(
+            ["incident_id", "customer_id", "previous_incident_id"],
+            select(
+                Incidents.id, Incidents.customer_id, Incidents.previous_incident_id
+            ).filter(Incidents.id > last_id, Incidents.id <= last_id + chunk_size),
+        )
+        query = query.on_conflict_do_nothing(index_elements=[IncidentViews.incident_id])
+
+        async with engines["writer"].begin() as connection:
+            added += (await connection.execute(query)).rowcount
+
+        last_id += chunk_size
+
+    logger.info(f"Added {added} incident views")
+
+
+async def clear_incident_views(branch_ids: list[int] | None) -> None:
+    query = update(IncidentViews).values(
+        document=None, version=IncidentViews.version + 1
+    )
+    query = query.filter(IncidentViews.document.is_not(None))
+
+    if branch_ids:
+        query = query.filter(
+            IncidentViews.incident_id == Incidents.id,
+            Incidents.branch_id.in_(branch_ids),
+        )
+
+    async with engines["writer"].begin() as connection:
+        result = await connection.execute(query)
+
+    logger.info(f"Cleared {result.rowcount} incident views")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--branch-ids", type=int, nargs="*")
+    parser.add_argument("--backfill", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.backfill:
+        asyncio.run(backfill_incident_views(chunk_size=args.chunk_size))
+
+    else:
+        asyncio.run(clear_incident_views(branch_ids=args.branch_ids))
+
+
+if __name__ == "__main__":
+    main()
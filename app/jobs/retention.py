@@ -0,0 +1,255 @@
+"""
+Deletes or archives the rows of high-churn tables that are past their retention.
+
+    python -m app.jobs.retention
+    python -m app.jobs.retention error_logs test_incidents --dry-run
+    python -m app.jobs.retention --batch-size 500 --pause 1
+
+Each policy removes up to --batch-size rows per transaction and sleeps --pause
+seconds between batches, so replicas and concurrent writers keep up. Archived
+rows are moved to the archive schema. Run 'python -m app.jobs.create_indexes'
+for the tables first, the batches look rows up through their created_at or
+is_test indexes. Deleted rows leave free space that autovacuum makes reusable,
+the reported bytes are the size of the removed row data.
+
+Test incidents are purged without updating branch_incident_daily_counts, run
+'python -m app.jobs.incident_counts' over the purged days to drop them from
+the test counts.
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import BigInteger
+
+from app.models import (
+    BlacklistSentLogs,
+    Customers,
+    ErrorLogs,
+    Evidence,
+    Incidents,
+    Incidents_Analyst_Audit,
+    Incidents_Audit,
+    Incidents_Blacklist,
+    IncidentValidationMetrics,
+    IncidentViews,
+)
+from core.config import config
+from core.database.session import engines
+from core.library.logging import logger
+
+ARCHIVE_SCHEMA = "archive"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    table: str
+    # rows matching condition are removed, :cutoff is bound to now - days
+    condition: str
+    days: int
+    archive: bool = False
+    # (table, column) pairs of rows referencing the removed ids, which are
+    # deleted first as no foreign key cascades to them
+    dependents: tuple[tuple[str, str], ...] = ()
+
+
+RETENTION_POLICIES = {
+    "blacklist_sent_logs": RetentionPolicy(
+        table=BlacklistSentLogs.__tablename__,
+        condition="created_at < :cutoff",
+        days=config.BLACKLIST_SENT_LOGS_RETENTION_DAYS,
+    ),
+    "error_logs": RetentionPolicy(
+        table=ErrorLogs.__tablename__,
+        condition="created_at < :cutoff",
+        days=config.ERROR_LOGS_RETENTION_DAYS,
+    ),
+    "incident_analyst_review_logs": RetentionPolicy(
+        table=IncidentValidationMetrics.__tablename__,
+        condition="created_at < :cutoff",
+        days=config.REVIEW_LOGS_RETENTION_DAYS,
+        archive=True,
+    ),
+    "test_incidents": RetentionPolicy(
+        table=Incidents.__tablename__,
+        condition="is_test AND incident_time < :cutoff",
+        days=config.TEST_DATA_RETENTION_DAYS,
+        dependents=(
+            (Incidents_Blacklist.__tablename__, "incident_id"),
+            (Incidents_Audit.__tablename__, "incident_id"),
+            (Incidents_Analyst_Audit.__tablename__, "incident_id"),
+            (IncidentValidationMetrics.__tablename__, "incident_id"),
+            (Evidence.__tablename__, "incident_id"),
+            (IncidentViews.__tablename__, "incident_id"),
+            (BlacklistSentLogs.__tablename__, "incident_id"),
+        ),
+    ),
+    # after test_incidents, so the customers' incidents are gone and their
+    # delete does not cascade to incidents; audits, blacklists and watchlists
+    # of customers cascade
+    "test_customers": RetentionPolicy(
+        table=Customers.__tablename__,
+        condition=(
+            "is_test AND created_at < :cutoff AND NOT EXISTS "
+            "(SELECT 1 FROM incidents WHERE incidents.customer_id = customers.id)"
+        ),
+        days=config.TEST_DATA_RETENTION_DAYS,
+    ),
+}
+
+
+async def count_expired(policy: RetentionPolicy, cutoff: datetime) -> tuple[int, int]:
+    async with engines["reader"].connect() as connection:
+        result = await connection.execute(
+            text(
+                f"SELECT count(*), coalesce(sum(pg_column_size(t.*)), 0) "
+                f"FROM {policy.table} t WHERE {policy.condition}"
+            ),
+            {"cutoff": cutoff},
+        )
+        return tuple(result.one())
+
+
+async def remove_batch(
+    policy: RetentionPolicy, cutoff: datetime, batch_size: int
+) -> tuple[int, int]:
+    """
+    Removes up to batch_size expired rows of policy.table and their dependents
+    in a single transaction.
+    :return: the number of rows removed and the size of their data in bytes.
+    """
+    async with engines["writer"].begin() as connection:
+        ids = (
+            await connection.execute(
+                text(
+                    f"SELECT id FROM {policy.table} WHERE {policy.condition} "
+                    f"LIMIT :batch_size"
+                ),
+                {"cutoff": cutoff, "batch_size": batch_size},
+            )
+        ).scalars().all()
+
+        if not ids:
+            return 0, 0
+
+        ids_param = bindparam("ids", type_=ARRAY(BigInteger))
+
+        for dependent_table, dependent_column in policy.dependents:
+            await connection.execute(
+                text(
+                    f"DELETE FROM {dependent_table} "
+                    f"WHERE {dependent_column} = ANY(:ids)"
+                ).bindparams(ids_param),
+                {"ids": ids},
+            )
+
+        removed = (
+            f"DELETE FROM {policy.table} t WHERE t.id = ANY(:ids) RETURNING t.*"
+        )
+        archived = (
+            f", archived AS (INSERT INTO {ARCHIVE_SCHEMA}.{policy.table} "
+            f"SELECT * FROM removed)"
+            if policy.archive
+            else ""
+        )
+        result = await connection.execute(
+            text(
+                f"WITH removed AS ({removed}){archived} "
+                f"SELECT count(*), coalesce(sum(pg_column_size(removed.*)), 0) "
+                f"FROM removed"
+            ).bindparams(ids_param),
+            {"ids": ids},
+        )
+        return tuple(result.one())
+
+
+async def apply_policy(
+    name: str, batch_size: int, pause: float, dry_run: bool
+) -> tuple[int, int]:
+    policy = RETENTION_POLICIES[name]
+    cutoff = datetime.now(pytz.utc) - timedelta(days=policy.days)
+
+    if dry_run:
+        rows, size = await count_expired(policy, cutoff)
+        logger.info(
+            f"{name}: {rows} rows, {size} bytes older than {policy.days} days"
+        )
+        return rows, size
+
+    if policy.archive:
+        async with engines["writer"].begin() as connection:
+            await connection.execute(
+                text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+            )
+            await connection.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{policy.table} "
+                    f"(LIKE {policy.table} INCLUDING DEFAULTS)"
+                )
+            )
+
+    total_rows = total_size = 0
+    while True:
+        rows, size = await remove_batch(policy, cutoff, batch_size)
+        total_rows += rows
+        total_size += size
+
+        if rows < batch_size:
+            break
+
+        await asyncio.sleep(pause)
+
+    action = "archived" if policy.archive else "deleted"
+    logger.info(f"{name}: {action} {total_rows} rows, {total_size} bytes")
+    return total_rows, total_size
+
+
+async def apply_policies(
+    names: list[str], batch_size: int, pause: float, dry_run: bool
+) -> None:
+    total_rows = total_size = 0
+
+    for name in names:
+        rows, size = await apply_policy(
+            name, batch_size=batch_size, pause=pause, dry_run=dry_run
+        )
+        total_rows += rows
+        total_size += size
+
+    logger.info(
+        f"Retention {'would reclaim' if dry_run else 'reclaimed'} "
+        f"{total_rows} rows, {total_size} bytes"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "policies",
+        nargs="*",
+        choices=list(RETENTION_POLICIES),
+        default=list(RETENTION_POLICIES),
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.5)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(
+        apply_policies(
+            # in RETENTION_POLICIES order, whatever the order they were given in
+            [name for name in RETENTION_POLICIES if name in args.policies],
+            batch_size=args.batch_size,
+            pause=args.pause,
+            dry_run=args.dry_run,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Groups the customers of each branch by person, for their number of visits.
+
+    python -m app.jobs.visit_clusters --days 30
+    python -m app.jobs.visit_clusters --branch-ids 3 7 --workers 2
+
+Every customer row is a visit. The customers of a branch visiting within the
+last days without a visit group yet are compared, chunk by chunk in id order,
+with the descriptors of the customers already grouped in that window and then
+with each other. A customer joins the group of the closest one within the
+threshold, euclidean between descriptors, or starts its own group, numbered
+with its id. Each chunk stores the groups and recounts no_of_visits for every
+customer of the groups it touched, in one transaction, so an interrupted run
+resumes where it stopped, then expires the cached watchlist entries of those
+customers. Branches are clustered in parallel, one process each.
+Adds customers.visit_group_id first; it can be run again.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.models import Customers
+from app.repositories import CustomerDataRepository
+from core.cache import Cache
+from core.config import config
+from core.database.session import async_session_factory, engines
+from core.library.logging import logger
+from core.utils.descriptors import descriptors_to_array
+from core.utils.ivfpq import squared_distances
+
+customer_data_repository = partial(CustomerDataRepository, Customers)
+
+
+class Block(NamedTuple):
+    """
+    Descriptors of grouped customers, with the visit group of each one.
+    """
+
+    vectors: np.ndarray
+    norms: np.ndarray
+    groups: np.ndarray
+
+
+def get_vectors(rows) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: the ids of the customers with a descriptor, the index among them of
+        the customer of each descriptor, and the descriptors.
+    """
+    ids = []
+    owners = []
+    vectors = []
+
+    for row in rows:
+        descriptors = descriptors_to_array((row.descriptor_1, row.descriptor_2))
+        if len(descriptors):
+            owners += [len(ids)] * len(descriptors)
+            ids.append(row.id)
+            vectors.append(descriptors)
+
+    if not ids:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            descriptors_to_array(()),
+        )
+
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array(owners, dtype=np.int64),
+        np.concatenate(vectors),
+    )
+
+
+def get_block(vectors: np.ndarray, groups: np.ndarray) -> Block:
+    return Block(vectors, np.einsum("ij,ij->i", vectors, vectors), groups)
+
+
+def assign_groups(
+    blocks: list[Block],
+    ids: np.ndarray,
+    owners: np.ndarray,
+    vectors: np.ndarray,
+    threshold: float,
+) -> np.ndarray:
+    """
+    Visit group of each customer of a chunk, the customers being in id order.
+    Distances are computed one block at a time, so memory stays within a chunk
+    by block matrix however many customers the branch has.
+    """
+    limit = threshold**2
+    closest = np.full(len(vectors), np.inf, dtype=np.float32)
+    closest_groups = np.full(len(vectors), -1, dtype=np.int64)
+
+    for block in blocks:
+        distances = squared_distances(vectors, block.vectors, block.norms)
+        nearest = distances.argmin(axis=1)
+        nearest_distances = distances[np.arange(len(vectors)), nearest]
+
+        closer = nearest_distances < closest
+        closest[closer] = nearest_distances[closer]
+        closest_groups[closer] = block.groups[nearest[closer]]
+
+    # the closest descriptor of each customer, the first of its rows once sorted
+    order = np.lexsort((closest, owners))
+    first = order[np.r_[True, owners[order][1:] != owners[order][:-1]]]
+    groups = np.where(closest[first] <= limit, closest_groups[first], -1)
+
+    # then the customers of the chunk against each other
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    distances = squared_distances(vectors, vectors)
+    distances = np.minimum.reduceat(distances, starts, axis=0)
+    distances = np.minimum.reduceat(distances, starts, axis=1)
+
+    for i in range(len(ids)):
+        if groups[i] >= 0:
+            continue
+
+        close = np.flatnonzero(distances[i, :i] <= limit)
+        if len(close):
+            groups[i] = groups[close[distances[i, close].argmin()]]
+        else:
+            groups[i] = ids[i]
+
+    return groups
+
+
+async def cluster_branch(
+    branch_id: int, since: datetime, threshold: float, chunk_size: int
+) -> int:
+    """
+    :return: the number of customers grouped.
+    """
+    blocks = []
+    grouped = 0
+
+    async with async_session_factory() as db_session:
+        repository = customer_data_repository(db_session=db_session)
+
+        async for rows in repository.stream_visit_descriptors(
+            branch_id=branch_id, since=since, chunk_size=chunk_size
+        ):
+            groups = {row.id: row.visit_group_id for row in rows}
+            ids, owners, vectors = get_vectors(rows)
+            if len(ids):
+                block_groups = np.array([groups[id] for id in ids.tolist()])
+                blocks.append(get_block(vectors, block_groups[owners]))
+
+        after_id = 0
+        while True:
+            rows = await repository.get_unclustered_customers(
+                branch_id=branch_id, since=since, after_id=after_id, limit=chunk_size
+            )
+            if not rows:
+                break
+
+            # customers without a descriptor are a person of their own
+            groups = {row.id: row.id for row in rows}
+            ids, owners, vectors = get_vectors(rows)
+
+            if len(ids):
+                chunk_groups = assign_groups(blocks, ids, owners, vectors, threshold)
+                groups.update(zip(ids.tolist(), chunk_groups.tolist()))
+                blocks.append(get_block(vectors, chunk_groups[owners]))
+
+            recounted_ids = await repository.set_visit_groups(
+                branch_id=branch_id, groups=groups
+            )
+            await db_session.commit()
+
+            # bulk updates the listeners do not see, entries show no_of_visits
+            if config.WATCHLIST_ENTRY_CACHE_ENABLED:
+                await Cache.expire_watchlist_entries(set(recounted_ids))
+
+            grouped += len(rows)
+            after_id = rows[-1].id
+
+    logger.info(f"Grouped the visits of {grouped} customers of branch {branch_id}")
+    return grouped
+
+
+def run_cluster_branch(
+    branch_id: int, since: datetime, threshold: float, chunk_size: int
+) -> int:
+    """
+    Clusters a branch in a worker process, on an event loop of its own.
+    """
+
+    async def run() -> int:
+        try:
+            return await cluster_branch(branch_id, since, threshold, chunk_size)
+        finally:
+            # pooled connections cannot be reused by the next event loop
+            for engine in engines.values():
+                await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def prepare(branch_ids: list[int] | None, since: datetime) -> list[int]:
+    async with engines["writer"].begin() as connection:
+        await connection.execute(
+            text(
+                f"ALTER TABLE {Customers.__tablename__} "
+                "ADD COLUMN IF NOT EXISTS visit_group_id bigint"
+            )
+        )
+        for index in Customers.__table__.indexes:
+            if index.name in (
+                "ix_customers_branch_visit_group",
+                "ix_customers_branch_unclustered",
+            ):
+                await connection.run_sync(
+                    lambda sync_connection: index.create(
+                        sync_connection, checkfirst=True
+                    )
+                )
+
+    if branch_ids is None:
+        async with async_session_factory() as db_session:
+            branch_ids = await customer_data_repository(
+                db_session=db_session
+            ).get_unclustered_branch_ids(since=since)
+
+    for engine in engines.values():
+        await engine.dispose()
+
+    return branch_ids
+
+
+def cluster_visits(
+    branch_ids: list[int] | None,
+    since: datetime,
+    threshold: float,
+    chunk_size: int,
+    workers: int,
+) -> None:
+    branch_ids = asyncio.run(prepare(branch_ids, since))
+    logger.info(f"Grouping the visits of {len(branch_ids)} branches")
+
+    # spawned workers open their own connections instead of inheriting ours
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        grouped = sum(
+            executor.map(
+                partial(
+                    run_cluster_branch,
+                    since=since,
+                    threshold=threshold,
+                    chunk_size=chunk_size,
+                ),
+                branch_ids,
+            )
+        )
+
+    logger.info(f"Grouped the visits of {grouped} customers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--branch-ids", type=int, nargs="+")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    cluster_visits(
+        branch_ids=args.branch_ids,
+        since=datetime.now() - timedelta(days=args.days),
+        threshold=args.threshold,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
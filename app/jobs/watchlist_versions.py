@@ -0,0 +1,93 @@
+"""
+Numbers the blacklist sent logs of each branch, for the watchlist changes endpoint.
+
+    python -m app.jobs.watchlist_versions
+
+Adds blacklist_sent_logs.version and the watchlist_versions counters, then
+numbers the logs without a version 1, 2, 3... per branch in id order, after the
+last version of the branch, and moves the counters to the last one. The table
+is locked for writes meanwhile. Run it before deploying the release that sets
+the version on insert; it can be run again.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from app.models import BlacklistSentLogs, WatchlistVersions
+from core.database.session import engines
+from core.library.logging import logger
+
+TABLE = BlacklistSentLogs.__tablename__
+
+
+async def number_blacklist_sent_logs() -> None:
+    async with engines["writer"].begin() as connection:
+        await connection.run_sync(
+            lambda sync_connection: WatchlistVersions.__table__.create(
+                sync_connection, checkfirst=True
+            )
+        )
+        await connection.execute(
+            text(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS version bigint")
+        )
+        await connection.execute(
+            text(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        )
+
+        result = await connection.execute(
+            text(
+                f"""
+                UPDATE {TABLE} AS logs
+                SET version = numbered.version
+                FROM (
+                    SELECT
+                        id,
+                        coalesce(
+                            max(version) OVER (PARTITION BY branch_id), 0
+                        ) + row_number() OVER (
+                            PARTITION BY branch_id, version IS NULL ORDER BY id
+                        ) AS version,
+                        version IS NULL AS pending
+                    FROM {TABLE}
+                ) AS numbered
+                WHERE logs.id = numbered.id AND numbered.pending
+                """
+            )
+        )
+        logger.info(f"Numbered {result.rowcount} blacklist sent logs")
+
+        await connection.execute(
+            text(
+                f"""
+                INSERT INTO {WatchlistVersions.__tablename__} (branch_id, version)
+                SELECT branch_id, max(version) FROM {TABLE} GROUP BY branch_id
+                ON CONFLICT (branch_id) DO UPDATE
+                SET version = greatest(
+                    {WatchlistVersions.__tablename__}.version, excluded.version
+                )
+                """
+            )
+        )
+
+        for index in BlacklistSentLogs.__table__.indexes:
+            if index.name == "ix_blacklist_sent_logs_branch_version":
+                await connection.run_sync(
+                    lambda sync_connection: index.create(
+                        sync_connection, checkfirst=True
+                    )
+                )
+
+    logger.info("Blacklist sent logs are numbered per branch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.parse_args()
+
+    asyncio.run(number_blacklist_sent_logs())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from .index import CustomerIndex
+
+__all__ = [
+    "CustomerIndex",
+]
@@ -0,0 +1,145 @@
+import asyncio
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import Row
+
+from app.models import Customers
+from app.repositories import CustomerDataRepository
+from core.config import config
+from core.database.session import async_session_factory
+from core.exceptions import NotFoundException
+from core.library.logging import logger
+from core.utils.descriptors import descriptors_to_array
+from core.utils.ivfpq import IVFPQIndex
+
+customer_data_repository = partial(CustomerDataRepository, Customers)
+
+
+class CustomerIndex:
+    """
+    Searches the customers of a company by face, through an IVF-PQ index of
+    their descriptors built per company by app.jobs.customer_index. The index
+    of a company is mapped from disk on its first search and picks up the
+    customers appended to it since, by this process or another.
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(CustomerIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.shards: dict[int, IVFPQIndex] = {}
+            self._initialized = True
+
+    @staticmethod
+    def get_path(company_id: int) -> Path:
+        """
+        The link to the current build of the company index.
+        """
+        return Path(config.CUSTOMER_INDEX_DIR) / str(company_id) / "current"
+
+    def get_shard(self, company_id: int) -> IVFPQIndex | None:
+        path = self.get_path(company_id)
+        if not path.exists():
+            return None
+
+        build = path.resolve()
+        shard = self.shards.get(company_id)
+
+        if shard is None or shard.path != build:
+            shard = IVFPQIndex.load(build)
+            self.shards[company_id] = shard
+            logger.info(f"Loaded the customer index of company {company_id}")
+        else:
+            shard.refresh()
+
+        return shard
+
+    def add(self, customers: list[Customers]) -> None:
+        """
+        Appends the descriptors of new customers to the index of their company.
+        Companies without an index get them on their first build.
+        """
+        companies = {}
+        for customer in customers:
+            companies.setdefault(customer.company_id, []).append(customer)
+
+        for company_id, company_customers in companies.items():
+            shard = self.get_shard(company_id)
+            if shard is None:
+                continue
+
+            ids = []
+            vectors = []
+            for customer in company_customers:
+                descriptors = descriptors_to_array(
+                    (customer.descriptor_1, customer.descriptor_2)
+                )
+                ids += [customer.id] * len(descriptors)
+                vectors.append(descriptors)
+
+            if ids:
+                shard.append(np.array(ids, dtype=np.int64), np.concatenate(vectors))
+
+    async def get_descriptors(self, ids: list[int]) -> list[Row]:
+        async with async_session_factory() as db_session:
+            return await customer_data_repository(
+                db_session=db_session
+            ).get_descriptors(ids=ids)
+
+    async def search(
+        self, company_id: int, descriptors: list[list[float]], k: int
+    ) -> list[list[tuple[int, str, float]]]:
+        """
+        Finds the k customers of the company closest to each descriptor. The
+        index returns CUSTOMER_INDEX_RERANK_FACTOR times more candidates, ranked
+        again by their exact distance to the stored descriptors.
+        :return: for each descriptor, (id, customer_id, euclidean distance) from
+            the closest.
+        """
+        shard = self.get_shard(company_id)
+        if shard is None:
+            raise NotFoundException(f"No customer index for company {company_id}")
+
+        queries = np.asarray(descriptors, dtype=np.float32)
+        candidates, _ = await asyncio.to_thread(
+            shard.search,
+            queries,
+            k * config.CUSTOMER_INDEX_RERANK_FACTOR,
+            config.CUSTOMER_INDEX_NPROBE,
+        )
+
+        rows = await self.get_descriptors(
+            np.unique(candidates[candidates >= 0]).tolist()
+        )
+        customers = {
+            row.id: (
+                row.customer_id,
+                descriptors_to_array((row.descriptor_1, row.descriptor_2)),
+            )
+            for row in rows
+        }
+
+        matches = []
+        for query, query_candidates in zip(queries, candidates):
+            query_matches = []
+
+            for id in query_candidates[query_candidates >= 0].tolist():
+                # customers deleted since they were indexed have no row
+                if id not in customers or not len(customers[id][1]):
+                    continue
+
+                customer_id, vectors = customers[id]
+                distance = np.sqrt(((vectors - query) ** 2).sum(axis=1).min())
+                query_matches.append((id, customer_id, float(distance)))
+
+            query_matches.sort(key=lambda match: match[2])
+            matches.append(query_matches[:k])
+
+        return matches
@@ -1,10 +1,17 @@
 from .analyst_db_helper import create_incident
 from .camera_helper import add_camera_incident
-from .customer_helper import add_customer_data
+from .customer_helper import add_customer_data, add_customers_data
+from .export_helper import export_customers, export_incidents
 from .incident_helper import (
     add_incident,
+    add_incidents,
     add_to_blacklist,
     get_blacklist_data,
+    get_customer_blacklist_data,
+    get_incident_blacklist_data,
+    get_watchlist_entry,
+    get_watchlist_snapshot,
+    send_incidents_alerts,
     update_incident,
 )
 from .notification_helper import send_notification
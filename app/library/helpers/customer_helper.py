@@ -1,9 +1,12 @@
+import asyncio
 from functools import partial
 from uuid import uuid4
 
+from google.cloud.firestore_v1.base_document import DocumentSnapshot
 from google.cloud.firestore_v1.document import DocumentReference
 
 from app.controllers.customer_data import CustomerDataController
+from app.library.customer_index_service import CustomerIndex
 from app.models import Customers
 from app.repositories.customer_data import CustomerDataRepository
 from core.config import config
@@ -21,6 +24,24 @@ customer_data_repository = partial(CustomerDataRepository, Customers)
 
 cloudDB_handler = CloudDBHandler(get_cloudDB_client())
 
+CUSTOMERS_BATCH_SIZE = config.CUSTOMERS_BATCH_SIZE
+
+
+async def index_customers(customers: list[Customers]) -> None:
+    """
+    Appends new customers to the customer index of their company, without
+    failing the ingestion when the index cannot be written. Encoding and the
+    file writes run in a thread, off the event loop.
+    """
+    if not config.CUSTOMER_INDEX_ENABLED or not customers:
+        return
+
+    try:
+        await asyncio.to_thread(CustomerIndex().add, customers)
+
+    except Exception as e:
+        logger.error(f"Error in indexing customers: {str(e)}")
+
 
 async def add_customer_data(doc: DocumentReference | dict):
     try:
@@ -44,12 +65,15 @@ async def add_customer_data(doc: DocumentReference | dict):
                 data["existsInDB"] = True
                 customer_response = await customer_data_contoller.register(data)
 
+                if customer_response is not None:
+                    await index_customers([customer_response])
+
                 if (
                     customer_response is not None
                     and config.ENVIRONMENT == "production"
                     and isinstance(doc, DocumentReference)
                 ):
-                    cloudDB_handler.update_document(
+                    await cloudDB_handler.update_document(
                         collection=FIREBASE_CUSTOMER_DATA_COLLECTION,
                         document=doc.id,
                         data=data,
@@ -60,3 +84,70 @@ async def add_customer_data(doc: DocumentReference | dict):
 
     finally:
         reset_session_context(token)
+
+
+async def add_customers_data(docs: list[DocumentSnapshot | dict]) -> list[str]:
+    """
+    Stores the customers that are not stored yet, CUSTOMERS_BATCH_SIZE at a
+    time, each batch with a single insert, and flags the Firestore documents
+    of the inserted ones with existsInDB in batched writes.
+    :return: the customer_ids that were inserted.
+    """
+    customers = []
+    # Firestore document id of each customer_id, for the docs that have one
+    document_ids = {}
+
+    for doc in docs:
+        if isinstance(doc, dict):
+            data = doc
+
+        else:
+            data = doc.to_dict()
+            document_ids[data.get("cust_id")] = doc.id
+
+        customers.append(data)
+
+    inserted_customer_ids = []
+
+    session_id = str(uuid4())
+    token = set_session_context(session_id)
+    try:
+        async for db_session in get_session():
+            customer_data_contoller = CustomerDataController(
+                customer_data_repository=customer_data_repository(db_session=db_session)
+            )
+
+            for start in range(0, len(customers), CUSTOMERS_BATCH_SIZE):
+                batch_customer_ids = await customer_data_contoller.register_many(
+                    customers[start : start + CUSTOMERS_BATCH_SIZE]
+                )
+                inserted_customer_ids += batch_customer_ids
+
+                if config.CUSTOMER_INDEX_ENABLED and batch_customer_ids:
+                    await index_customers(
+                        await customer_data_contoller.get_by_customer_ids(
+                            batch_customer_ids
+                        )
+                    )
+
+    except Exception as e:
+        logger.error(f"Error in adding customers: {str(e)}")
+
+    finally:
+        reset_session_context(token)
+
+    if config.ENVIRONMENT == "production":
+        try:
+            await cloudDB_handler.update_documents(
+                collection=FIREBASE_CUSTOMER_DATA_COLLECTION,
+                documents={
+                    document_ids[customer_id]: {"existsInDB": True}
+                    for customer_id in inserted_customer_ids
+                    if customer_id in document_ids
+                },
+            )
+
+        except Exception as e:
+            logger.error(f"Error in flagging customers in Firestore: {str(e)}")
+
+    return inserted_customer_ids
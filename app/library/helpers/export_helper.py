@@ -0,0 +1,100 @@
+from datetime import date
+from functools import partial
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy import Row
+from sqlalchemy.types import String
+
+from app.controllers.incidents import get_branch_name
+from app.models import Customers, Incidents
+from app.repositories.customer_data import (
+    CUSTOMER_EXPORT_FIELDS,
+    CustomerDataRepository,
+)
+from app.repositories.incidents import INCIDENT_EXPORT_FIELDS, IncidentsRepository
+from core.config import config
+from core.database.session import async_session_factory
+from core.utils.export import stream_export
+
+EXPORT_CHUNK_SIZE = config.EXPORT_CHUNK_SIZE
+
+incidents_repository = partial(IncidentsRepository, Incidents)
+customer_data_repository = partial(CustomerDataRepository, Customers)
+
+# branch_name is added after the selected fields
+INCIDENT_EXPORT_COLUMNS = [
+    (field.key, field.type) for field in INCIDENT_EXPORT_FIELDS
+] + [("branch_name", String())]
+CUSTOMER_EXPORT_COLUMNS = [
+    (field.key, field.type) for field in CUSTOMER_EXPORT_FIELDS
+] + [("branch_name", String())]
+
+
+async def add_branch_names(
+    chunks: AsyncIterator[Sequence[Row]],
+) -> AsyncIterator[list[tuple]]:
+    """
+    Appends the branch name to each row, looking up each branch once.
+    """
+    branch_names = {}
+
+    async for rows in chunks:
+        for row in rows:
+            if row.branch_id not in branch_names:
+                branch_names[row.branch_id] = await get_branch_name(row.branch_id)
+
+        yield [(*row, branch_names[row.branch_id]) for row in rows]
+
+
+async def export_incidents(
+    export_format: str,
+    company_id: int,
+    branch_ids: list[int] | None,
+    from_date: date,
+    to_date: date,
+    is_test_user: bool,
+) -> AsyncIterator[bytes]:
+    """
+    Streams the company incidents of the date range as a CSV or Parquet file.
+    The export reads through its own session, so it can outlive the request.
+    """
+    async with async_session_factory() as db_session:
+        chunks = incidents_repository(db_session=db_session).stream_export_rows(
+            company_id=company_id,
+            branch_ids=branch_ids,
+            from_date=from_date,
+            to_date=to_date,
+            is_test_user=is_test_user,
+            chunk_size=EXPORT_CHUNK_SIZE,
+        )
+
+        async for data in stream_export(
+            export_format, add_branch_names(chunks), INCIDENT_EXPORT_COLUMNS
+        ):
+            yield data
+
+
+async def export_customers(
+    export_format: str,
+    company_id: int,
+    branch_ids: list[int] | None,
+    from_date: date,
+    to_date: date,
+) -> AsyncIterator[bytes]:
+    """
+    Streams the company customers of the date range as a CSV or Parquet file.
+    The export reads through its own session, so it can outlive the request.
+    """
+    async with async_session_factory() as db_session:
+        chunks = customer_data_repository(db_session=db_session).stream_export_rows(
+            company_id=company_id,
+            branch_ids=branch_ids,
+            from_date=from_date,
+            to_date=to_date,
+            chunk_size=EXPORT_CHUNK_SIZE,
+        )
+
+        async for data in stream_export(
+            export_format, add_branch_names(chunks), CUSTOMER_EXPORT_COLUMNS
+        ):
+            yield data
@@ -1,14 +1,17 @@
+import asyncio
+import gzip
 import time
+from collections import defaultdict
 from datetime import datetime
 from functools import partial
 from uuid import uuid4
 
+import numpy as np
 import pytz
-from google.cloud.firestore_v1.base_query import FieldFilter
 
 from app.controllers.customer_blacklist import Customers_Blacklist_Controller
 from app.controllers.customer_data import CustomerDataController
-from app.controllers.incidents import IncidentsController
+from app.controllers.incidents import IncidentsController, get_incident_attributes
 from app.controllers.incidents_audit import IncidentsAuditController
 from app.controllers.incidents_blacklist import Incidents_Blacklist_Controller
 from app.controllers.test_watchlist import TestWatchlistedController
@@ -34,13 +37,16 @@ from core.cache import Cache
 
 # from core.cache.redis_backend import RedisBackend
 from core.config import config
+from core.database import unit_of_work
 from core.database.session import (
     get_session,
     reset_session_context,
     set_session_context,
 )
 from core.library.logging import logger
+from core.utils.descriptors import descriptor_to_text, descriptors_to_array
 from core.utils.firebase import CloudDBHandler, get_cloudDB_client
+from core.utils.watchlist_snapshot import encode_watchlist_snapshot
 
 from .entity_helper import entity, get_company_branch_camera_id
 from .notification_helper import send_notification
@@ -78,34 +84,26 @@ async def add_to_firebase_blacklist_collection(
     blacklist_controller: Incidents_Blacklist_Controller,
     branch_id: str,
     company_id: str,
-    customer_id: str,
     related_incident: Incidents | None = None,
 ):
+    """
+    Publishes the watchlist entry of a blacklisted incident to the Firestore
+    collection of its branch, under the incident_id. Entries already published
+    are skipped from the Redis index, without a Firestore request.
+    """
     try:
-        documents = (
-            cloudDB_handler.firestore_db.collection(
-                FIREBASE_BLACKLIST_INCIDENTS_COLLECTION
-            )
-            .where(filter=FieldFilter("customer_id", "==", customer_id))
-            .where(filter=FieldFilter("company_id", "==", company_id))
-            .where(filter=FieldFilter("branch_id", "==", branch_id))
-            .get()
+        entry = await get_watchlist_entry(
+            blacklist_controller, blacklist_id, incident_obj=True
         )
 
-        if len(documents) > 0:
+        if entry is None:
             return
 
-        blacklists = await blacklist_controller.get_by_id(blacklist_id, {"customers"})
+        document = entry["data"]["incident_id"]
 
-        if blacklists is None:
-            logger.error(f"Blacklisted incident not found: {blacklist_id}")
+        if await Cache.is_watchlist_document_published(company_id, branch_id, document):
             return
 
-        blacklist, incident, customers = blacklists
-
-        incident_time = incident.incident_time
-        incident_time = incident_time.strftime("%Y-%m-%d %H:%M:%S")
-
         if related_incident is None:
             prev_incident_time = None
             prev_incident_id = None
@@ -117,30 +115,33 @@ async def add_to_firebase_blacklist_collection(
             prev_incident_id = related_incident.incident_id
 
         data = {
-            "incident_id": incident.incident_id,
-            "incident_time": incident_time,
-            "incident_status": incident.status,
-            "customer_id": customers.customer_id if customers else None,
-            "is_blacklisted": True,
-            "incident_url": incident.photo_url,
-            "descriptor_1": customers.descriptor_1 if customers else None,
-            "descriptor_2": customers.descriptor_2 if customers else None,
-            "prev_incident_id": prev_incident_id,
-            "prev_incident_time": prev_incident_time,
-            "no_of_visits": incident.no_of_visits,
-            "branch_id": branch_id,
-            "company_id": company_id,
+            field: value
+            for field, value in entry["data"].items()
+            if field not in ("id", "customer_int_id")
         }
+        data.update(
+            {
+                "prev_incident_id": prev_incident_id,
+                "prev_incident_time": prev_incident_time,
+                "branch_id": branch_id,
+                "company_id": company_id,
+            }
+        )
 
         collection = (
             f"{FIREBASE_BLACKLIST_INCIDENTS_COLLECTION}/{company_id}/{branch_id}"
         )
 
-        cloudDB_handler.write_to_document(
+        # an entry published before the index, or by a concurrent request, is
+        # left as is
+        await cloudDB_handler.create_document_if_absent(
             collection=collection,
-            document=incident.incident_id,
+            document=document,
             data=data,
         )
+        await Cache.add_published_watchlist_documents(
+            company_id, branch_id, [document]
+        )
 
     except Exception as e:
         logger.error(f"Error in adding to firebase blacklist collection: {str(e)}")
@@ -153,12 +154,93 @@ async def remove_from_firebase_blacklist_collection(
         collection = (
             f"{FIREBASE_BLACKLIST_INCIDENTS_COLLECTION}/{company_id}/{branch_id}"
         )
-        cloudDB_handler.delete_document(collection=collection, document=document_id)
+        await cloudDB_handler.delete_document(
+            collection=collection, document=document_id
+        )
+        await Cache.remove_published_watchlist_documents(
+            company_id, branch_id, [document_id]
+        )
 
     except Exception as e:
         logger.info(f"Error in removing from firebase blacklist collection: {str(e)}")
 
 
+async def send_incident_alerts(
+    incident: Incidents,
+    data: dict,
+    customer_obj: Customers | None,
+    except_user_ids: list[int] | None = None,
+):
+    """
+    Sends the notifications and telegram alerts of a stored incident and
+    queues it for the analysts.
+    """
+    if data.get("is_blacklisted"):
+        await send_notification(
+            branch_id=data.get("branch_id"),
+            except_user_ids=except_user_ids,
+            template=config.PREVIOUSLY_BLACKLISTED_TEMPLATE,
+            incident=incident,
+            group=config.PREVIOUSLY_BLACKLISTED,
+            notification_group_type=NOTIFICATION_GROUP_TYPE_BLACKLISTED_PERSON,
+            alert=True,
+            channel_id=config.NOTIFICATION_CHANNEL_BLACKLIST_ALERT,
+            sound_name=config.NOTIFICATION_SOUND_BLACKLIST_ALERT,
+        )
+
+        if (
+            config.TELEGRAM_WAS_ON_WATCHLIST_ENABLED == 1
+            and customer_obj
+            and customer_obj.is_test is not True
+        ):
+            telegram_service = TelegramService()
+
+            response = await telegram_service.send_was_on_watchlist_alert(data)
+
+            if not response.ok:
+                logger.error(
+                    f"Error in sending telegram message: {response.status_code} - {response.text}"
+                )
+
+    else:
+        await send_notification(
+            branch_id=data.get("branch_id"),
+            template=config.SENSITIVE_ALERT_TEMPLATE,
+            incident=incident,
+            group=config.SENSITIVE,
+            notification_group_type=config.NOTIFICATION_GROUP_TYPE_SENSITIVE_ALERT,
+            channel_id=config.NOTIFICATION_CHANNEL_SENSITIVE_ALERT,
+            sound_name=config.NOTIFICATION_SOUND_SENSITIVE_ALERT,
+        )
+
+        if config.QUEUEING_ENABLED and not (
+            config.ENVIRONMENT.lower() == "production"
+            and data.get("branch_id") == config.TEST_STORE_ID
+        ):
+            # send incidents to queueing service for analyst portal
+            queue_service = AnalystQueueingService()
+            await queue_service.add_to_incidents_queue(incident.id)
+
+        if config.TELEGRAM_SENSITIVE_ALERT_ENABLED:
+            # send alert in telegram
+            telegram_service = TelegramService()
+            response = await telegram_service.send_sensitive_incidents_alert(data)
+
+
+async def send_incidents_alerts(alerts: list[dict]):
+    """
+    Sends the alerts returned by add_incidents, one incident at a time.
+    """
+    for alert in alerts:
+        try:
+            await send_incident_alerts(**alert)
+
+        except Exception as e:
+            logger.error(
+                f"Error in sending alerts for incident {alert['incident'].id}: {str(e)}"
+            )
+
+
 async def add_incident(data: dict):
     start = time.time()
     logger.info(
@@ -191,6 +273,13 @@ async def add_incident(data: dict):
             #     audit_repository=audit_repository(db_session=db_session),
             # )
 
+            # a retried delivery, ux_incidents_incident_id_time rejects it anyway
+            if await incident_controller.get_incident_by_incident_id(
+                incident_id=data.get("inci_id")
+            ):
+                logger.info(f"Incident {data.get('inci_id')} is already stored")
+                return
+
             company_branch_camera_response = await get_company_branch_camera_id(
                 company_uuid=data.get("com_id"),
                 branch_uuid=data.get("st_id"),
@@ -246,8 +335,6 @@ async def add_incident(data: dict):
                     f"time taken for inserting incident with id: {incident.id} is {time.time() - start}"
                 )
 
-                incident_id = incident.id
-
                 except_user_ids = None
                 if customer_obj is not None:
                     test_customers = await test_watchlist_controller.get_by_customer_id(
@@ -257,21 +344,9 @@ async def add_incident(data: dict):
                         test_customer.user_id for test_customer in test_customers
                     ]
 
-                await send_notification(
-                    branch_id=branch_id,
-                    except_user_ids=except_user_ids,
-                    template=config.PREVIOUSLY_BLACKLISTED_TEMPLATE,
-                    incident=incident,
-                    group=config.PREVIOUSLY_BLACKLISTED,
-                    notification_group_type=NOTIFICATION_GROUP_TYPE_BLACKLISTED_PERSON,
-                    alert=True,
-                    channel_id=config.NOTIFICATION_CHANNEL_BLACKLIST_ALERT,
-                    sound_name=config.NOTIFICATION_SOUND_BLACKLIST_ALERT,
-                )
-
                 await blacklist_controller.register(
                     {
-                        "incident_id": incident_id,
+                        "incident_id": incident.id,
                         "related_incident_id": related_incident_id,
                         "created_at": datetime.now(pytz.utc),
                     }
@@ -280,19 +355,12 @@ async def add_incident(data: dict):
                     f"time taken for inserting blacklisted incident with id: {incident.id} is {time.time() - start}"
                 )
 
-                if (
-                    config.TELEGRAM_WAS_ON_WATCHLIST_ENABLED == 1
-                    and customer_obj
-                    and customer_obj.is_test is not True
-                ):
-                    telegram_service = TelegramService()
-
-                    response = await telegram_service.send_was_on_watchlist_alert(data)
-
-                    if not response.ok:
-                        logger.error(
-                            f"Error in sending telegram message: {response.status_code} - {response.text}"
-                        )
+                await send_incident_alerts(
+                    incident=incident,
+                    data=data,
+                    customer_obj=customer_obj,
+                    except_user_ids=except_user_ids,
+                )
 
             else:
                 incident = await incident_controller.register(data)
@@ -300,31 +368,10 @@ async def add_incident(data: dict):
                     f"time taken for inserting incident with id: {incident.id} is {time.time() - start}"
                 )
 
-                await send_notification(
-                    branch_id=branch_id,
-                    template=config.SENSITIVE_ALERT_TEMPLATE,
-                    incident=incident,
-                    group=config.SENSITIVE,
-                    notification_group_type=config.NOTIFICATION_GROUP_TYPE_SENSITIVE_ALERT,
-                    channel_id=config.NOTIFICATION_CHANNEL_SENSITIVE_ALERT,
-                    sound_name=config.NOTIFICATION_SOUND_SENSITIVE_ALERT,
+                await send_incident_alerts(
+                    incident=incident, data=data, customer_obj=customer_obj
                 )
 
-                if config.QUEUEING_ENABLED and not (
-                    config.ENVIRONMENT.lower() == "production"
-                    and data.get("branch_id") == config.TEST_STORE_ID
-                ):
-                    # send incidents to queueing service for analyst portal
-                    queue_service = AnalystQueueingService()
-                    await queue_service.add_to_incidents_queue(incident.id)
-
-                if config.TELEGRAM_SENSITIVE_ALERT_ENABLED:
-                    # send alert in telegram
-                    telegram_service = TelegramService()
-                    response = await telegram_service.send_sensitive_incidents_alert(
-                        data
-                    )
-
             logger.info(
                 f"Processing ends at {datetime.now(pytz.utc)} for incident id {data.get('inci_id')}."
                 f"Total processing time: {time.time() - start}"
@@ -358,6 +405,194 @@ async def add_incident(data: dict):
         reset_session_context(token)
 
 
+async def add_incidents(
+    incidents_data: list[dict],
+) -> tuple[list[dict], list[dict]]:
+    """
+    Stores a batch of incidents from the DS pipeline. Company, branch and
+    camera ids, customers, test watchlists and previous incidents are resolved
+    with one lookup each, and the incidents and their blacklist entries are
+    inserted and committed together. Incidents already stored, retried or
+    concurrent deliveries, are reported as existing, and an incident that
+    cannot be resolved, parsed or stored fails alone.
+    :return: the status of each incident, in request order, and the alerts of
+        the stored ones, to be sent with send_incidents_alerts.
+    """
+    results = [
+        {"inci_id": data.get("inci_id"), "status": "failed"}
+        for data in incidents_data
+    ]
+    alerts = []
+
+    session_id = str(uuid4())
+    token = set_session_context(session_id)
+    try:
+        async for db_session in get_session():
+            incident_controller = IncidentsController(
+                incidents_repository=incidents_repository(db_session=db_session),
+            )
+            blacklist_controller = Incidents_Blacklist_Controller(
+                blacklist_repository=blacklist_repository(db_session=db_session),
+            )
+            customer_controller = CustomerDataController(
+                customer_data_repository=customer_data_repository(
+                    db_session=db_session
+                ),
+            )
+            test_watchlist_controller = TestWatchlistedController(
+                test_watchlist_repository=test_watchlist_repository(
+                    db_session=db_session,
+                ),
+            )
+
+            entity_keys = {
+                (data.get("com_id"), data.get("st_id"), data.get("cam_id"))
+                for data in incidents_data
+            }
+            entity_responses = await asyncio.gather(
+                *(
+                    get_company_branch_camera_id(
+                        company_uuid=company_uuid,
+                        branch_uuid=branch_uuid,
+                        camera_uuid=camera_uuid,
+                    )
+                    for company_uuid, branch_uuid, camera_uuid in entity_keys
+                )
+            )
+            entity_ids = dict(zip(entity_keys, entity_responses))
+
+            customers = await customer_controller.get_by_customer_ids(
+                [data.get("cust_id") for data in incidents_data if data.get("cust_id")]
+            )
+            customers = {customer.customer_id: customer for customer in customers}
+
+            test_customers = await test_watchlist_controller.get_by_customer_ids(
+                [customer.id for customer in customers.values()]
+            )
+            except_user_ids = defaultdict(list)
+            for test_customer in test_customers:
+                except_user_ids[test_customer.customer_id].append(test_customer.user_id)
+
+            existing_incidents = {
+                incident.incident_id: incident.id
+                for incident in await incident_controller.get_incidents_by_incident_ids(
+                    [data.get("inci_id") for data in incidents_data]
+                )
+            }
+            batch_incident_ids = set()
+
+            resolved = []
+            for result, data in zip(results, incidents_data):
+                incident_id = data.get("inci_id")
+
+                if incident_id in existing_incidents:
+                    result["id"] = existing_incidents[incident_id]
+                    result["status"] = "existing"
+                    continue
+
+                if incident_id in batch_incident_ids:
+                    result["detail"] = "Incident repeated in this batch"
+                    continue
+
+                company_branch_camera_response = entity_ids[
+                    (data.get("com_id"), data.get("st_id"), data.get("cam_id"))
+                ]
+
+                if (
+                    company_branch_camera_response is None
+                    or None in company_branch_camera_response
+                ):
+                    result["detail"] = "Error in finding company or branch or camera"
+                    continue
+
+                company_id, branch_id, camera_id = company_branch_camera_response
+
+                data["company_id"] = company_id
+                data["branch_id"] = branch_id
+                data["camera_id"] = camera_id
+
+                customer_id = data.get("cust_id")
+                customer_obj = None
+
+                if customer_id is None:
+                    data["customer_id"] = None
+
+                else:
+                    customer_obj = customers.get(customer_id)
+
+                    if customer_obj is None:
+                        result["detail"] = (
+                            f"No customer exists with this id: {customer_id}"
+                        )
+                        continue
+
+                    if customer_obj.is_test:
+                        data["is_test"] = True
+
+                    data["customer_id"] = customer_obj.id
+
+                # a malformed incident would otherwise fail the whole batch
+                try:
+                    get_incident_attributes(data, related_incident_id=None)
+
+                except (KeyError, TypeError, ValueError) as e:
+                    result["detail"] = f"Invalid incident data: {e!r}"
+                    continue
+
+                batch_incident_ids.add(incident_id)
+                resolved.append((result, data, customer_obj))
+
+            async with unit_of_work():
+                incidents, existing_incidents = (
+                    await incident_controller.register_many(
+                        [data for _, data, _ in resolved]
+                    )
+                )
+
+                blacklist_requests = []
+                for (result, data, customer_obj), incident in zip(resolved, incidents):
+                    if data["inci_id"] in existing_incidents:
+                        result["id"] = existing_incidents[data["inci_id"]]
+                        result["status"] = "existing"
+                        continue
+
+                    if incident is None:
+                        result["detail"] = (
+                            "No incident exists with this previous incident "
+                            "incident_id, or it could not be stored"
+                        )
+                        continue
+
+                    result["id"] = incident.id
+                    result["status"] = "created"
+
+                    alert = {
+                        "incident": incident,
+                        "data": data,
+                        "customer_obj": customer_obj,
+                    }
+
+                    if data.get("is_blacklisted"):
+                        blacklist_requests.append(
+                            {
+                                "incident_id": incident.id,
+                                "related_incident_id": incident.previous_incident_id,
+                                "created_at": datetime.now(pytz.utc),
+                            }
+                        )
+                        if customer_obj is not None:
+                            alert["except_user_ids"] = except_user_ids[customer_obj.id]
+
+                    alerts.append(alert)
+
+                await blacklist_controller.register_many(blacklist_requests)
+
+    finally:
+        reset_session_context(token)
+
+    return results, alerts
+
+
 async def update_incident(data: dict):
     try:
         session_id = str(uuid4())
@@ -426,26 +661,26 @@ async def update_incident(data: dict):
                 incident_status == Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED
                 and not is_blacklisted
             ):
-                incident.status = Incidents.IncidentStatus.NONE
-                incident.is_blacklisted = False
-                incident.updated_by = data.get("user_id")
-                incident.updated_at = datetime.now(pytz.utc)
-                await db_session.commit()
-
-                await audit_controller.register(
-                    {
-                        "incident_id": incident.id,
-                        "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
-                        "status": Incidents_Audit.AuditStatus.REMOVED,
-                        "comments": audit_comments,
-                        "created_by": data.get("user_id"),
-                        "updated_by": data.get("user_id"),
-                        "created_at": datetime.now(pytz.utc),
-                        "updated_at": datetime.now(pytz.utc),
-                    }
-                )
+                async with unit_of_work():
+                    incident.status = Incidents.IncidentStatus.NONE
+                    incident.is_blacklisted = False
+                    incident.updated_by = data.get("user_id")
+                    incident.updated_at = datetime.now(pytz.utc)
+
+                    await audit_controller.register(
+                        {
+                            "incident_id": incident.id,
+                            "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
+                            "status": Incidents_Audit.AuditStatus.REMOVED,
+                            "comments": audit_comments,
+                            "created_by": data.get("user_id"),
+                            "updated_by": data.get("user_id"),
+                            "created_at": datetime.now(pytz.utc),
+                            "updated_at": datetime.now(pytz.utc),
+                        }
+                    )
 
-                await blacklist_controller.remove_from_blacklist(incident.id)
+                    await blacklist_controller.remove_from_blacklist(incident.id)
 
                 await remove_from_firebase_blacklist_collection(
                     document_id=incident.incident_id,
@@ -460,23 +695,23 @@ async def update_incident(data: dict):
                 if incident_status == Incidents.IncidentStatus.NO_ACTION:
                     audit_comments = None
 
-                incident.status = incident_status
-                incident.updated_by = data.get("user_id")
-                incident.updated_at = datetime.now(pytz.utc)
-                await db_session.commit()
-
-                await audit_controller.register(
-                    {
-                        "incident_id": incident.id,
-                        "action_type": data.get("status"),
-                        "status": Incidents_Audit.AuditStatus.ADDED,
-                        "comments": audit_comments,
-                        "created_by": data.get("user_id"),
-                        "updated_by": data.get("user_id"),
-                        "created_at": datetime.now(pytz.utc),
-                        "updated_at": datetime.now(pytz.utc),
-                    }
-                )
+                async with unit_of_work():
+                    incident.status = incident_status
+                    incident.updated_by = data.get("user_id")
+                    incident.updated_at = datetime.now(pytz.utc)
+
+                    await audit_controller.register(
+                        {
+                            "incident_id": incident.id,
+                            "action_type": data.get("status"),
+                            "status": Incidents_Audit.AuditStatus.ADDED,
+                            "comments": audit_comments,
+                            "created_by": data.get("user_id"),
+                            "updated_by": data.get("user_id"),
+                            "created_at": datetime.now(pytz.utc),
+                            "updated_at": datetime.now(pytz.utc),
+                        }
+                    )
 
                 if incident_status == Incidents.IncidentStatus.ESCAPE_THEFT:
                     await send_notification(
@@ -500,25 +735,25 @@ async def update_incident(data: dict):
 
             # removing from blacklist
             elif not is_blacklisted and incident.is_blacklisted:
-                incident.is_blacklisted = False
-                incident.updated_by = data.get("user_id")
-                incident.updated_at = datetime.now(pytz.utc)
-                await db_session.commit()
-
-                await audit_controller.register(
-                    {
-                        "incident_id": incident.id,
-                        "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
-                        "status": Incidents_Audit.AuditStatus.REMOVED,
-                        "comments": audit_comments,
-                        "created_by": data.get("user_id"),
-                        "updated_by": data.get("user_id"),
-                        "created_at": datetime.now(pytz.utc),
-                        "updated_at": datetime.now(pytz.utc),
-                    }
-                )
+                async with unit_of_work():
+                    incident.is_blacklisted = False
+                    incident.updated_by = data.get("user_id")
+                    incident.updated_at = datetime.now(pytz.utc)
+
+                    await audit_controller.register(
+                        {
+                            "incident_id": incident.id,
+                            "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
+                            "status": Incidents_Audit.AuditStatus.REMOVED,
+                            "comments": audit_comments,
+                            "created_by": data.get("user_id"),
+                            "updated_by": data.get("user_id"),
+                            "created_at": datetime.now(pytz.utc),
+                            "updated_at": datetime.now(pytz.utc),
+                        }
+                    )
 
-                await blacklist_controller.remove_from_blacklist(incident.id)
+                    await blacklist_controller.remove_from_blacklist(incident.id)
 
                 await remove_from_firebase_blacklist_collection(
                     document_id=incident.incident_id,
@@ -558,11 +793,31 @@ async def add_to_blacklist(data: dict):
             if branch_info:
                 branch_id = branch_info["branch_id"]
 
-            if incident.status != incident_status:
+            async with unit_of_work():
+                if incident.status != incident_status:
+                    await audit_controller.register(
+                        {
+                            "incident_id": incident.id,
+                            "action_type": incident_status,
+                            "status": Incidents_Audit.AuditStatus.ADDED,
+                            "comments": audit_comments,
+                            "created_by": user_id,
+                            "updated_by": user_id,
+                            "created_at": datetime.now(pytz.utc),
+                            "updated_at": datetime.now(pytz.utc),
+                        }
+                    )
+                    audit_comments = None
+
+                incident.is_blacklisted = True
+                incident.status = incident_status
+                incident.updated_by = user_id
+                incident.updated_at = datetime.now(pytz.utc)
+
                 await audit_controller.register(
                     {
                         "incident_id": incident.id,
-                        "action_type": incident_status,
+                        "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
                         "status": Incidents_Audit.AuditStatus.ADDED,
                         "comments": audit_comments,
                         "created_by": user_id,
@@ -571,26 +826,13 @@ async def add_to_blacklist(data: dict):
                         "updated_at": datetime.now(pytz.utc),
                     }
                 )
-                audit_comments = None
-
-            incident.is_blacklisted = True
-            incident.status = incident_status
-            incident.updated_by = user_id
-            incident.updated_at = datetime.now(pytz.utc)
-            await db_session.commit()
-
-            await audit_controller.register(
-                {
-                    "incident_id": incident.id,
-                    "action_type": Incidents_Audit.AuditAction.BLACKLISTED,
-                    "status": Incidents_Audit.AuditStatus.ADDED,
-                    "comments": audit_comments,
-                    "created_by": user_id,
-                    "updated_by": user_id,
-                    "created_at": datetime.now(pytz.utc),
-                    "updated_at": datetime.now(pytz.utc),
-                }
-            )
+
+                blacklist_obj = await blacklist_controller.register(
+                    {
+                        "incident_id": incident.id,
+                        "created_at": datetime.now(pytz.utc),
+                    }
+                )
 
             await send_notification(
                 branch_id=branch_id,
@@ -601,13 +843,6 @@ async def add_to_blacklist(data: dict):
                 except_user_ids=[data.get("user_id")],
             )
 
-            blacklist_obj = await blacklist_controller.register(
-                {
-                    "incident_id": incident.id,
-                    "created_at": datetime.now(pytz.utc),
-                }
-            )
-
             await add_to_firebase_blacklist_collection(
                 blacklist_id=blacklist_obj.id,
                 blacklist_controller=blacklist_controller,
@@ -622,81 +857,176 @@ async def add_to_blacklist(data: dict):
         reset_session_context(token)
 
 
-async def get_blacklist_data(
+def get_incident_blacklist_data(incident: Incidents, customers: Customers) -> dict:
+    """
+    The watchlist entry of a blacklisted incident, as sent to the branches,
+    without the company and branch uuids.
+    """
+    return {
+        "id": incident.id,
+        "incident_id": incident.incident_id,
+        "incident_time": incident.incident_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "incident_status": incident.status,
+        "customer_id": customers.customer_id,
+        "customer_int_id": customers.id,
+        "is_blacklisted": True,
+        "incident_url": incident.photo_url,
+        "descriptor_1": descriptor_to_text(customers.descriptor_1),
+        "descriptor_2": descriptor_to_text(customers.descriptor_2),
+        "no_of_visits": incident.no_of_visits,
+        "prev_incident_id": None,
+        "prev_incident_time": None,
+    }
+
+
+def get_watchlist_snapshot(
+    version: int, entries: list[tuple[Incidents, Customers]], dtype: str
+) -> bytes:
+    """
+    The gzipped binary snapshot of a watchlist, one row per descriptor of the
+    customer of each blacklisted incident, see core.utils.watchlist_snapshot.
+    """
+    ids = []
+    customer_ids = []
+    incident_uuids = []
+    customer_uuids = []
+    matrices = []
+
+    for incident, customers in entries:
+        matrix = descriptors_to_array((customers.descriptor_1, customers.descriptor_2))
+
+        ids += [incident.id] * len(matrix)
+        customer_ids += [customers.id] * len(matrix)
+        incident_uuids += [incident.incident_id] * len(matrix)
+        customer_uuids += [customers.customer_id] * len(matrix)
+        matrices.append(matrix)
+
+    snapshot = encode_watchlist_snapshot(
+        version=version,
+        ids=np.array(ids, dtype=np.int64),
+        customer_ids=np.array(customer_ids, dtype=np.int64),
+        matrix=np.concatenate([descriptors_to_array(()), *matrices]),
+        incident_uuids=incident_uuids,
+        customer_uuids=customer_uuids,
+        dtype=dtype,
+    )
+    return gzip.compress(snapshot, compresslevel=6)
+
+
+def get_customer_blacklist_data(customers: Customers | None) -> dict:
+    """
+    The watchlist entry of a blacklisted customer, as sent to the branches,
+    without the company and branch uuids.
+    """
+    return {
+        "incident_id": None,
+        "incident_time": None,
+        "incident_status": None,
+        "customer_id": customers.customer_id if customers else None,
+        "is_blacklisted": True,
+        "incident_url": None,
+        "descriptor_1": (
+            descriptor_to_text(customers.descriptor_1) if customers else None
+        ),
+        "descriptor_2": (
+            descriptor_to_text(customers.descriptor_2) if customers else None
+        ),
+        "no_of_visits": customers.no_of_visits if customers else None,
+        "prev_incident_id": None,
+        "prev_incident_time": None,
+    }
+
+
+async def get_watchlist_entry(
     blacklist_controller: Incidents_Blacklist_Controller
     | Customers_Blacklist_Controller,
     blacklist_id: int,
     incident_obj: bool,
-    customer_obj: bool,
-) -> dict:
-    if incident_obj:
-        blacklists = await blacklist_controller.get_by_id(blacklist_id, {"customers"})
-
-        logger.info(blacklists)
-
-        if blacklists is None:
-            logger.error(f"Blacklisted incident not found: {blacklist_id}")
-            return
+) -> dict | None:
+    """
+    The watchlist entry of an incident or customer blacklist entry, cached until
+    its customer or one of the customer incidents changes, so pushing it again
+    reads neither the database nor the descriptors.
+    :return: data, the entry without the company and branch uuids, with the
+        company_id and branch_id it belongs to.
+    """
+    kind = "incidents" if incident_obj else "customers"
+    customer_id = None
+    version = None
+
+    if config.WATCHLIST_ENTRY_CACHE_ENABLED:
+        entry = await Cache.get_watchlist_entry(kind, blacklist_id)
+        if entry is not None:
+            return entry
+
+        # read before the entry is built, so a change committed meanwhile
+        # expires the entry cached under this version
+        customer_id = await blacklist_controller.get_customer_id(blacklist_id)
+        if customer_id is not None:
+            version = await Cache.get_watchlist_entry_version(customer_id)
+
+    blacklists = await blacklist_controller.get_by_id(blacklist_id, {"customers"})
+
+    if blacklists is None:
+        logger.error(f"Blacklisted incident not found: {blacklist_id}")
+        return None
 
+    if incident_obj:
         blacklist, incident, customers = blacklists
 
-        incident_time = incident.incident_time
-        incident_time = incident_time.strftime("%Y-%m-%d %H:%M:%S")
-
         if incident.customer_id is None:
             logger.error(
                 f"Customer id not selected for incident: {incident.incident_id}"
             )
-            return
+            return None
 
-        customer_id = customers.customer_id
-        descriptor_1 = customers.descriptor_1
-        descriptor_2 = customers.descriptor_2
+        data = get_incident_blacklist_data(incident, customers)
+        owner = incident
 
-        data = {
-            "id": incident.id,
-            "incident_id": incident.incident_id,
-            "incident_time": incident_time,
-            "incident_status": incident.status,
-            "customer_id": customer_id,
-            "customer_int_id": customers.id,
-            "is_blacklisted": True,
-            "incident_url": incident.photo_url,
-            "descriptor_1": descriptor_1,
-            "descriptor_2": descriptor_2,
-            "no_of_visits": incident.no_of_visits,
-            "prev_incident_id": None,
-            "prev_incident_time": None,
-        }
+    else:
+        blacklist, customers = blacklists
 
-        branch_id = str(incident.branch_id)
-        company_id = str(incident.company_id)
+        data = get_customer_blacklist_data(customers)
+        owner = customers
 
-    elif customer_obj:
-        blacklists = await blacklist_controller.get_by_id(blacklist_id, {"customers"})
+    entry = {
+        "data": data,
+        "company_id": owner.company_id,
+        "branch_id": owner.branch_id,
+    }
 
-        if blacklists is None:
-            logger.error(f"Blacklisted incident not found: {blacklist_id}")
-            return
+    if version is not None and customers is not None and customers.id == customer_id:
+        entry["customer_id"] = customer_id
+        entry["version"] = version
 
-        blacklist, customers = blacklists
+        await Cache.cache_watchlist_entry(
+            kind, blacklist_id, entry=entry, ttl=config.WATCHLIST_ENTRY_TTL
+        )
 
-        data = {
-            "incident_id": None,
-            "incident_time": None,
-            "incident_status": None,
-            "customer_id": customers.customer_id if customers else None,
-            "is_blacklisted": True,
-            "incident_url": None,
-            "descriptor_1": customers.descriptor_1 if customers else None,
-            "descriptor_2": customers.descriptor_2 if customers else None,
-            "no_of_visits": customers.no_of_visits if customers else None,
-            "prev_incident_id": None,
-            "prev_incident_time": None,
-        }
+    return entry
+
+
+async def get_blacklist_data(
+    blacklist_controller: Incidents_Blacklist_Controller
+    | Customers_Blacklist_Controller,
+    blacklist_id: int,
+    incident_obj: bool,
+    customer_obj: bool,
+) -> dict:
+    if not (incident_obj or customer_obj):
+        return
+
+    entry = await get_watchlist_entry(
+        blacklist_controller, blacklist_id, incident_obj=incident_obj
+    )
+
+    if entry is None:
+        return
+
+    data = dict(entry["data"])
 
-        branch_id = str(customers.branch_id)
-        company_id = str(customers.company_id)
+    branch_id = str(entry["branch_id"])
+    company_id = str(entry["company_id"])
 
     branches = await Cache.get_all_branches()
 
@@ -0,0 +1,5 @@
+from .matcher import WatchlistMatcher
+
+__all__ = [
+    "WatchlistMatcher",
+]
@@ -0,0 +1,225 @@
+import asyncio
+from collections import defaultdict
+from functools import partial
+from typing import Literal
+
+import numpy as np
+from sqlalchemy import Row
+
+from app.models import Customers
+from app.repositories import CustomerDataRepository
+from core.cache import Cache
+from core.database.session import async_session_factory
+from core.library.logging import logger
+from core.utils.descriptors import DESCRIPTOR_LENGTH, descriptors_to_array
+
+customer_data_repository = partial(CustomerDataRepository, Customers)
+
+# a watchlist this many versions behind is reloaded rather than patched
+MAX_PATCHED_VERSIONS = 100
+
+
+class BranchWatchlist:
+    """
+    The descriptors of a branch watchlist as a float32 matrix, with the one or
+    two rows of each customer next to each other. It is not changed once built,
+    updates build a new one, so searches can run on it outside the event loop.
+    """
+
+    def __init__(self, version: int, customers: dict[int, tuple[str, np.ndarray]]):
+        self.version = version
+        self.customers = customers
+
+        ids = list(customers)
+        blocks = [customers[id][1] for id in ids]
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.customer_ids = [customers[id][0] for id in ids]
+
+        if blocks:
+            self.vectors = np.concatenate(blocks)
+            self.starts = np.cumsum([0] + [len(block) for block in blocks[:-1]])
+        else:
+            self.vectors = np.empty((0, DESCRIPTOR_LENGTH), dtype=np.float32)
+            self.starts = np.empty(0, dtype=np.int64)
+
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.unit_vectors = self.vectors / np.maximum(norms, 1e-12)
+        self.squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+    @staticmethod
+    def get_descriptors(row: Row) -> np.ndarray | None:
+        descriptors = descriptors_to_array((row.descriptor_1, row.descriptor_2))
+        return descriptors if len(descriptors) else None
+
+    @classmethod
+    def load(cls, version: int, rows: list[Row]) -> "BranchWatchlist":
+        customers = {}
+
+        for row in rows:
+            descriptors = cls.get_descriptors(row)
+            if descriptors is not None:
+                customers[row.id] = (row.customer_id, descriptors)
+
+        return cls(version, customers)
+
+    def update(
+        self, version: int, customer_ids: set[int], rows: list[Row]
+    ) -> "BranchWatchlist":
+        """
+        Builds the watchlist with the entries of customer_ids replaced by rows,
+        the ones without a row having left the watchlist.
+        """
+        customers = {
+            id: customer
+            for id, customer in self.customers.items()
+            if id not in customer_ids
+        }
+
+        for row in rows:
+            descriptors = self.get_descriptors(row)
+            if descriptors is not None:
+                customers[row.id] = (row.customer_id, descriptors)
+
+        return BranchWatchlist(version, customers)
+
+    def search(
+        self, queries: np.ndarray, k: int, metric: Literal["cosine", "euclidean"]
+    ) -> list[list[tuple[int, str, float]]]:
+        """
+        Finds the k closest customers to each query descriptor, by the best of
+        their descriptors.
+        :return: for each query, (id, customer_id, score) from the closest, the
+            score being a cosine similarity or a euclidean distance.
+        """
+        if not len(self.ids):
+            return [[] for _ in queries]
+
+        if metric == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            similarities = (queries / np.maximum(norms, 1e-12)) @ self.unit_vectors.T
+            scores = np.maximum.reduceat(similarities, self.starts, axis=1)
+            order = -scores
+        else:
+            # |q - v|² = |q|² + |v|² - 2 q·v, one matrix product for the batch
+            distances = (
+                np.einsum("ij,ij->i", queries, queries)[:, None]
+                + self.squared_norms[None, :]
+                - 2 * (queries @ self.vectors.T)
+            )
+            distances = np.minimum.reduceat(distances, self.starts, axis=1)
+            scores = np.sqrt(np.maximum(distances, 0))
+            order = scores
+
+        k = min(k, len(self.ids))
+        closest = np.argpartition(order, k - 1, axis=1)[:, :k]
+        closest = np.take_along_axis(
+            closest,
+            np.take_along_axis(order, closest, axis=1).argsort(axis=1),
+            axis=1,
+        )
+
+        return [
+            [
+                (int(self.ids[i]), self.customer_ids[i], float(scores[query, i]))
+                for i in indexes
+            ]
+            for query, indexes in enumerate(closest)
+        ]
+
+
+class WatchlistMatcher:
+    """
+    Keeps the watchlist of each searched branch in memory. Every committed
+    watchlist change bumps the branch version in the cache with the customers
+    it changed, see app.models.listeners, so each worker only reloads those.
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(WatchlistMatcher, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.watchlists: dict[int, BranchWatchlist] = {}
+            self.locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+            self._initialized = True
+
+    async def get_watchlisted_customers(
+        self, branch_id: int, customer_ids: list[int] | None = None
+    ) -> list[Row]:
+        async with async_session_factory() as db_session:
+            return await customer_data_repository(
+                db_session=db_session
+            ).get_watchlisted_customers(branch_id=branch_id, customer_ids=customer_ids)
+
+    async def get_changed_customers(
+        self, branch_id: int, from_version: int, to_version: int
+    ) -> set[int] | None:
+        """
+        :return: the customers changed since from_version, or None when the
+            watchlist has to be reloaded.
+        """
+        if not 0 < to_version - from_version <= MAX_PATCHED_VERSIONS:
+            return None
+
+        changes = await Cache.get_watchlist_changes(
+            branch_id=branch_id, from_version=from_version, to_version=to_version
+        )
+        if any(customer_ids is None for customer_ids in changes):
+            return None
+
+        return {id for customer_ids in changes for id in customer_ids}
+
+    async def get_watchlist(self, branch_id: int) -> BranchWatchlist:
+        version = await Cache.get_watchlist_version(branch_id)
+
+        watchlist = self.watchlists.get(branch_id)
+        if watchlist is not None and watchlist.version == version:
+            return watchlist
+
+        async with self.locks[branch_id]:
+            watchlist = self.watchlists.get(branch_id)
+            if watchlist is not None and watchlist.version == version:
+                return watchlist
+
+            customer_ids = None
+            if watchlist is not None:
+                customer_ids = await self.get_changed_customers(
+                    branch_id, from_version=watchlist.version, to_version=version
+                )
+
+            # the version is read before the rows, a change committed in
+            # between is applied again on the next search
+            if customer_ids is None:
+                rows = await self.get_watchlisted_customers(branch_id)
+                watchlist = BranchWatchlist.load(version, rows)
+                logger.info(
+                    f"Loaded the watchlist of branch {branch_id}: "
+                    f"{len(watchlist.ids)} customers"
+                )
+            else:
+                rows = await self.get_watchlisted_customers(
+                    branch_id, customer_ids=list(customer_ids)
+                )
+                watchlist = watchlist.update(version, customer_ids, rows)
+
+            self.watchlists[branch_id] = watchlist
+
+        return watchlist
+
+    async def search(
+        self,
+        branch_id: int,
+        descriptors: list[list[float]],
+        k: int,
+        metric: Literal["cosine", "euclidean"],
+    ) -> list[list[tuple[int, str, float]]]:
+        watchlist = await self.get_watchlist(branch_id)
+        queries = np.asarray(descriptors, dtype=np.float32)
+
+        # numpy releases the GIL in the matrix products
+        return await asyncio.to_thread(watchlist.search, queries, k, metric)
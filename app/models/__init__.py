@@ -2,6 +2,7 @@ from core.database import Base
 
 from .incidents import (
     BlacklistSentLogs,
+    BranchIncidentDailyCounts,
     Customers,
     Customers_Audit,
     Customers_Blacklist,
@@ -12,5 +13,8 @@ from .incidents import (
     Incidents_Audit,
     Incidents_Blacklist,
     IncidentValidationMetrics,
+    IncidentViews,
     TestWatchlistedCustomers,
+    WatchlistVersions,
 )
+from .listeners import update_branch_incident_daily_counts
@@ -4,25 +4,57 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
+    Date,
     DateTime,
     Float,
     ForeignKey,
     Index,
     Integer,
     Interval,
+    LargeBinary,
     SmallInteger,
     String,
     Text,
     UniqueConstraint,
+    and_,
+    case,
     desc,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from core.config import config
 from core.database.session import Base
 
 
+def _category_value_matches(actual, expected) -> bool:
+    if expected is None or isinstance(expected, bool):
+        return actual is expected
+    return actual == expected
+
+
+def _category_case(rules: tuple, default: int, columns: dict):
+    """
+    Builds the SQL CASE for the category column from Incidents.CATEGORY_RULES.
+    """
+
+    def condition(field, expected):
+        if expected is None or isinstance(expected, bool):
+            return columns[field].is_(expected)
+        return columns[field] == expected
+
+    return case(
+        *(
+            (and_(*(condition(field, value) for field, value in conditions)), category)
+            for conditions, category in rules
+        ),
+        else_=default,
+    )
+
+
 class Incidents(Base):
     __tablename__ = "incidents"
 
@@ -63,14 +95,56 @@ class Incidents(Base):
         INVALID = 0
         VALID = 1
 
+    class IncidentCategory:
+        """
+        IncidentCategory is the listing/count bucket an incident falls in.
+        Derived from status, watchlist flags and analyst validation.
+        """
+
+        NONE = 0
+        BLACKLISTED = config.BLACKLISTED
+        SENSITIVE = config.SENSITIVE
+        LIKELY_THEFT = config.LIKELY_THEFT
+        PREVIOUSLY_BLACKLISTED = config.PREVIOUSLY_BLACKLISTED
+
+        # the incident_filter values accepted by the listing and count endpoints
+        FILTERS = (BLACKLISTED, SENSITIVE, LIKELY_THEFT, PREVIOUSLY_BLACKLISTED)
+
+    # Defines both the category column and get_category: an incident falls in
+    # the category of the first rule whose (field, value) conditions all hold.
+    CATEGORY_RULES = (
+        ((("status", None),), IncidentCategory.NONE),
+        (
+            (
+                ("status", IncidentStatus.PREVIOUSLY_BLACKLISTED),
+                ("is_blacklisted", True),
+            ),
+            IncidentCategory.PREVIOUSLY_BLACKLISTED,
+        ),
+        (
+            (("status", IncidentStatus.PREVIOUSLY_BLACKLISTED),),
+            IncidentCategory.NONE,
+        ),
+        (
+            (("is_blacklisted", True), ("analyst_blacklisted", True)),
+            IncidentCategory.BLACKLISTED,
+        ),
+        (
+            (("is_valid", AnalystValidationChoices.VALID),),
+            IncidentCategory.LIKELY_THEFT,
+        ),
+    )
+    CATEGORY_DEFAULT = IncidentCategory.SENSITIVE
+
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(String, unique=True, index=True)
+    # indexed by ux_incidents_incident_id_time
+    incident_id = Column(String)
     company_id = Column(BigInteger, nullable=False)
     branch_id = Column(BigInteger, nullable=False)
     camera_id = Column(BigInteger)
     name = Column(String, nullable=False)
     incident_type = Column(Integer)
-    incident_time = Column(DateTime(timezone=False), nullable=False)
+    incident_time = Column(DateTime(timezone=False), primary_key=True, nullable=False)
     incident_logged_time = Column(DateTime(timezone=True))
     match_score = Column(Float, nullable=True)
     comments = Column(String, nullable=True)
@@ -105,13 +179,148 @@ class Incidents(Base):
         onupdate=func.now(),
     )
     updated_by = Column(BigInteger, nullable=True)
+    category = Column(
+        SmallInteger,
+        Computed(
+            _category_case(
+                CATEGORY_RULES,
+                CATEGORY_DEFAULT,
+                {
+                    "status": status,
+                    "is_blacklisted": is_blacklisted,
+                    "analyst_blacklisted": analyst_blacklisted,
+                    "is_valid": is_valid,
+                },
+            ),
+            persisted=True,
+        ),
+    )
 
     blacklists = relationship(
-        "Incidents_Blacklist", back_populates="incident", lazy="selectin"
+        "Incidents_Blacklist",
+        primaryjoin="Incidents.id == foreign(Incidents_Blacklist.incident_id)",
+        back_populates="incident",
+        lazy="selectin",
     )
 
+    @classmethod
+    def get_category(
+        cls,
+        status: int | None,
+        is_blacklisted: bool | None,
+        analyst_blacklisted: bool | None,
+        is_valid: int | None,
+    ) -> int:
+        """
+        Returns the IncidentCategory for the given incident fields.
+        Evaluates CATEGORY_RULES like the category column does, for incidents
+        that are not flushed yet.
+        """
+        values = {
+            "status": status,
+            "is_blacklisted": is_blacklisted,
+            "analyst_blacklisted": analyst_blacklisted,
+            "is_valid": is_valid,
+        }
+        for conditions, category in cls.CATEGORY_RULES:
+            if all(
+                _category_value_matches(values[field], value)
+                for field, value in conditions
+            ):
+                return category
+
+        return cls.CATEGORY_DEFAULT
+
+    # Range partitioned by month on incident_time, partitions are managed by
+    # app.jobs.incident_partitions. Postgres requires the partition key in every
+    # unique constraint, so the table key is (id, incident_time) while the ORM
+    # still identifies incidents by id alone, and no table can reference
+    # incidents with a foreign key.
+    __table_args__ = (
+        Index(
+            "ix_branch_incident_time",
+            "branch_id",
+            desc("incident_time"),
+            desc("id"),
+        ),
+        Index(
+            "ix_branch_category_incident_time",
+            "branch_id",
+            "category",
+            desc("incident_time"),
+        ),
+        Index(
+            "ix_incidents_customer_incident_time",
+            "customer_id",
+            desc("incident_time"),
+        ),
+        # the DS pipeline delivers an incident with the same incident_id and
+        # incident_time when it retries, the closest to a unique incident_id
+        # a partitioned table allows
+        Index(
+            "ux_incidents_incident_id_time",
+            "incident_id",
+            "incident_time",
+            unique=True,
+        ),
+        # test incidents are purged by app.jobs.retention
+        Index(
+            "ix_incidents_test_incident_time",
+            "incident_time",
+            postgresql_where=text("is_test"),
+        ),
+        {"postgresql_partition_by": "RANGE (incident_time)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class BranchIncidentDailyCounts(Base):
+    __tablename__ = "branch_incident_daily_counts"
     __table_args__ = (
-        Index("ix_branch_incident_time", "branch_id", desc("incident_time")),
+        UniqueConstraint(
+            "branch_id",
+            "day",
+            "category",
+            "is_test",
+            name="uq_branch_day_category_test",
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    branch_id = Column(BigInteger, nullable=False)
+    day = Column(Date, nullable=False)
+    category = Column(SmallInteger, nullable=False)
+    is_test = Column(Boolean, nullable=False, default=False)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
+    )
+
+
+class IncidentViews(Base):
+    """
+    The IncidentResponse of an incident, without its durations, built from the
+    incident, its blacklist entry, customer, audits, suspicious incidents and
+    branch. The listeners clear document and bump version whenever one of
+    those changes, the next read rebuilds it.
+    """
+
+    __tablename__ = "incident_views"
+
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, primary_key=True)
+    # the incidents whose changes the document depends on, besides its own
+    customer_id = Column(BigInteger, index=True)
+    previous_incident_id = Column(BigInteger, index=True)
+    branch_timezone = Column(String)
+    document = Column(JSONB(none_as_null=True))
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
     )
 
 
@@ -131,12 +340,8 @@ class Incidents_Audit(Base):
         DECLINED = 4
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(
-        BigInteger,
-        ForeignKey("incidents.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True,
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=False, index=True)
     action_type = Column(Integer)
     status = Column(Integer, nullable=False)
     comments = Column(String)
@@ -168,12 +373,8 @@ class Incidents_Analyst_Audit(Base):
         DECLINED = 4
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(
-        BigInteger,
-        ForeignKey("incidents.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True,
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=False, index=True)
     action_type = Column(Integer)
     status = Column(Integer, nullable=False)
     comments = Column(String)
@@ -192,16 +393,17 @@ class Incidents_Blacklist(Base):
     __tablename__ = "blacklists"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(
-        BigInteger,
-        ForeignKey("incidents.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True,
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), default=func.now())
     related_incident_id = Column(BigInteger, nullable=True)
 
-    incident = relationship("Incidents", back_populates="blacklists", lazy="selectin")
+    incident = relationship(
+        "Incidents",
+        primaryjoin="Incidents.id == foreign(Incidents_Blacklist.incident_id)",
+        back_populates="blacklists",
+        lazy="selectin",
+    )
 
 
 class Customers(Base):
@@ -212,16 +414,36 @@ class Customers(Base):
     company_id = Column(BigInteger, nullable=False)
     branch_id = Column(BigInteger, nullable=False)
     camera_id = Column(BigInteger, nullable=False)
-    descriptor_1 = Column(String)
-    descriptor_2 = Column(String)
+    # float32 values, see core.utils.descriptors
+    descriptor_1 = Column(LargeBinary)
+    descriptor_2 = Column(LargeBinary)
     pic_url = Column(String)
     no_of_visits = Column(Integer)
+    # id of the first customer of the same person at the branch, set by
+    # app.jobs.visit_clusters
+    visit_group_id = Column(BigInteger, nullable=True)
     is_test = Column(Boolean, default=False)
     analyst_blacklisted = Column(Boolean, default=False)
     app_blacklisted = Column(Boolean, default=False)
     visited_time = Column(DateTime(timezone=False))
     created_at = Column(DateTime(timezone=True), default=func.now())
 
+    __table_args__ = (
+        Index("ix_customers_branch_visit_group", "branch_id", "visit_group_id"),
+        Index(
+            "ix_customers_branch_unclustered",
+            "branch_id",
+            "id",
+            postgresql_where=text("visit_group_id IS NULL"),
+        ),
+        # test customers are purged by app.jobs.retention
+        Index(
+            "ix_customers_test_created_at",
+            "created_at",
+            postgresql_where=text("is_test"),
+        ),
+    )
+
 
 class Customers_Audit(Base):
     __tablename__ = "customer_audit"
@@ -272,19 +494,39 @@ class BlacklistSentLogs(Base):
     action_type = Column(SmallInteger, nullable=False)
     company_id = Column(BigInteger, nullable=False)
     branch_id = Column(BigInteger, nullable=False)
-    incident_id = Column(
-        BigInteger,
-        ForeignKey("incidents.id", ondelete="CASCADE"),
-        nullable=True,
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=True)
     customer_id = Column(
         BigInteger, ForeignKey("customers.id", ondelete="CASCADE"), nullable=True
     )
 
     # can be either customer_blacklists id or blacklists id
     blacklist_id = Column(Integer, nullable=True)
+    # 1, 2, 3... per branch, set on insert from watchlist_versions
+    version = Column(BigInteger, nullable=True)
     created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
 
+    __table_args__ = (
+        Index("ix_blacklist_sent_logs_branch_created_at", "branch_id", "created_at"),
+        Index("ix_blacklist_sent_logs_created_at", "created_at"),
+        # test incidents are purged with their sent logs by app.jobs.retention
+        Index("ix_blacklist_sent_logs_incident_id", "incident_id"),
+        Index(
+            "ix_blacklist_sent_logs_branch_version",
+            "branch_id",
+            "version",
+            unique=True,
+        ),
+    )
+
+
+class WatchlistVersions(Base):
+    __tablename__ = "watchlist_versions"
+
+    branch_id = Column(BigInteger, primary_key=True)
+    # version of the last blacklist_sent_logs row of the branch
+    version = Column(BigInteger, nullable=False, default=0)
+
 
 class ErrorLogs(Base):
     __tablename__ = "error_logs"
@@ -292,7 +534,7 @@ class ErrorLogs(Base):
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     incident_id = Column(String)
     error_msg = Column(String)
-    created_at = Column(DateTime(timezone=True), default=func.now())
+    created_at = Column(DateTime(timezone=True), default=func.now(), index=True)
 
 
 class TestWatchlistedCustomers(Base):
@@ -313,15 +555,16 @@ class IncidentValidationMetrics(Base):
     __tablename__ = "incident_analyst_review_logs"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(
-        BigInteger, ForeignKey("incidents.id", ondelete="CASCADE"), nullable=False
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=False, index=True)
     user_id = Column(BigInteger, nullable=False)
     is_validated = Column(Boolean, nullable=False, default=False)
     opened_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
     closed_at = Column(DateTime(timezone=True), nullable=True)
     time_difference = Column(Interval, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, default=func.now(), index=True
+    )
     updated_at = Column(
         DateTime(timezone=True), nullable=False, default=func.now(), onupdate=func.now()
     )
@@ -336,9 +579,8 @@ class Evidence(Base):
         SYSTEM_TEST = 2
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    incident_id = Column(
-        BigInteger, ForeignKey("incidents.id", ondelete="CASCADE"), nullable=False
-    )
+    # not a foreign key, incidents is partitioned (see Incidents.__table_args__)
+    incident_id = Column(BigInteger, nullable=False, index=True)
     evidence_type = Column(Integer, nullable=False)
     property_details = Column(JSON, nullable=True)
     evidence_description = Column(String, nullable=True)
@@ -0,0 +1,513 @@
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from core.cache import Cache
+from core.config import config
+from core.library.logging import logger
+
+from .incidents import (
+    BlacklistSentLogs,
+    BranchIncidentDailyCounts,
+    Customers,
+    Customers_Audit,
+    Incidents,
+    Incidents_Audit,
+    Incidents_Blacklist,
+    IncidentViews,
+    WatchlistVersions,
+)
+
+COUNTER_FIELDS = (
+    "branch_id",
+    "incident_time",
+    "status",
+    "is_blacklisted",
+    "analyst_blacklisted",
+    "is_valid",
+    "is_test",
+)
+
+
+def _counter_key(values: dict) -> tuple | None:
+    """
+    Returns the (branch_id, day, category, is_test) row an incident is counted in.
+    """
+    if values["branch_id"] is None or values["incident_time"] is None:
+        return None
+
+    category = Incidents.get_category(
+        status=values["status"],
+        is_blacklisted=values["is_blacklisted"],
+        analyst_blacklisted=values["analyst_blacklisted"],
+        is_valid=values["is_valid"],
+    )
+
+    # the listings show incidents with a NULL is_test to test users only, so
+    # they are counted with the test incidents
+    return (
+        values["branch_id"],
+        values["incident_time"].date(),
+        category,
+        values["is_test"] is not False,
+    )
+
+
+def _current_values(incident: Incidents) -> dict:
+    return {field: getattr(incident, field) for field in COUNTER_FIELDS}
+
+
+def _previous_values(incident: Incidents) -> dict:
+    state = inspect(incident)
+    values = {}
+
+    for field in COUNTER_FIELDS:
+        history = state.attrs[field].history
+
+        if history.deleted:
+            values[field] = history.deleted[0]
+        elif history.unchanged:
+            values[field] = history.unchanged[0]
+        else:
+            values[field] = getattr(incident, field)
+
+    return values
+
+
+@event.listens_for(Session, "after_flush")
+def update_branch_incident_daily_counts(session: Session, flush_context) -> None:
+    """
+    Keeps branch_incident_daily_counts in step with every flushed change to
+    incidents, inside the same transaction as the change itself.
+    """
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Incidents):
+            key = _counter_key(_current_values(obj))
+            if key:
+                deltas[key] += 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Incidents):
+            previous_key = _counter_key(_previous_values(obj))
+            current_key = _counter_key(_current_values(obj))
+
+            if previous_key == current_key:
+                continue
+
+            if previous_key:
+                deltas[previous_key] -= 1
+            if current_key:
+                deltas[current_key] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Incidents):
+            key = _counter_key(_previous_values(obj))
+            if key:
+                deltas[key] -= 1
+
+    # sorted so concurrent transactions lock counter rows in the same order
+    rows = [
+        {
+            "branch_id": branch_id,
+            "day": day,
+            "category": category,
+            "is_test": is_test,
+            "count": delta,
+        }
+        for (branch_id, day, category, is_test), delta in sorted(deltas.items())
+        if delta != 0
+    ]
+
+    if not rows:
+        return
+
+    query = insert(BranchIncidentDailyCounts).values(rows)
+    query = query.on_conflict_do_update(
+        constraint="uq_branch_day_category_test",
+        set_={
+            "count": BranchIncidentDailyCounts.count + query.excluded.count,
+            "updated_at": func.now(),
+        },
+    )
+
+    session.connection().execute(query)
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_incident_views(session: Session, flush_context) -> None:
+    """
+    Clears the incident_views documents built from anything the flush changed,
+    inside the same transaction as the change. New incidents get an empty
+    view, so a document built before their audits or blacklist entry commit
+    is dropped as well (see IncidentViewsRepository.store).
+    """
+    if not config.INCIDENT_VIEWS_ENABLED:
+        return
+
+    incident_ids = set()
+    # documents of re-entries show the audits of their previous incident
+    previous_incident_ids = set()
+    # documents show their customer and the customer's other incidents
+    customer_ids = set()
+    new_views = []
+
+    for obj in session.new:
+        if isinstance(obj, Incidents):
+            new_views.append(
+                {
+                    "incident_id": obj.id,
+                    "customer_id": obj.customer_id,
+                    "previous_incident_id": obj.previous_incident_id,
+                }
+            )
+            customer_ids.add(obj.customer_id)
+
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Incidents):
+            incident_ids.add(obj.id)
+            customer_ids.add(obj.customer_id)
+            customer_ids.update(inspect(obj).attrs.customer_id.history.deleted)
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Incidents_Blacklist):
+            incident_ids.add(obj.incident_id)
+
+        elif isinstance(obj, Incidents_Audit):
+            incident_ids.add(obj.incident_id)
+            previous_incident_ids.add(obj.incident_id)
+
+        elif isinstance(obj, Customers):
+            customer_ids.add(obj.id)
+
+        elif isinstance(obj, Customers_Audit):
+            customer_ids.add(obj.customer_id)
+
+    customer_ids.discard(None)
+
+    conditions = []
+    if incident_ids:
+        conditions.append(IncidentViews.incident_id.in_(sorted(incident_ids)))
+    if previous_incident_ids:
+        conditions.append(
+            IncidentViews.previous_incident_id.in_(sorted(previous_incident_ids))
+        )
+    if customer_ids:
+        conditions.append(IncidentViews.customer_id.in_(sorted(customer_ids)))
+
+    if conditions:
+        query = update(IncidentViews).where(or_(*conditions))
+        query = query.values(document=None, version=IncidentViews.version + 1)
+        session.connection().execute(query)
+
+    if new_views:
+        query = insert(IncidentViews).values(new_views).on_conflict_do_nothing()
+        session.connection().execute(query)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_incidents_page_branches(session: Session, flush_context) -> None:
+    """
+    Records the branches whose incidents, or their blacklist entries and audits,
+    the flush changed. Their cached incidents pages are expired on commit.
+    """
+    if not config.INCIDENTS_PAGE_CACHE_ENABLED:
+        return
+
+    branch_ids = set()
+    flushed_incident_ids = set()
+    incident_ids = set()
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Incidents):
+            branch_ids.add(obj.branch_id)
+            flushed_incident_ids.add(obj.id)
+
+        elif isinstance(obj, (Incidents_Blacklist, Incidents_Audit)):
+            incident_ids.add(obj.incident_id)
+
+    incident_ids -= flushed_incident_ids
+    if incident_ids:
+        query = (
+            select(Incidents.branch_id)
+            .where(Incidents.id.in_(incident_ids))
+            .distinct()
+        )
+        branch_ids.update(session.connection().execute(query).scalars())
+
+    if branch_ids:
+        session.info.setdefault("incidents_page_branch_ids", set()).update(
+            branch_ids
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def expire_incidents_pages(session: Session) -> None:
+    """
+    Expires the cached incidents pages of the branches changed by the
+    committed transaction, after the commit so no page is rebuilt from the
+    data before it.
+    """
+    branch_ids = session.info.pop("incidents_page_branch_ids", None)
+    if not branch_ids:
+        return
+
+    try:
+        # listeners run inside the greenlet of the AsyncSession call
+        await_only(Cache.expire_incidents_pages(branch_ids))
+
+    except Exception as e:
+        logger.error(f"Failed to expire incidents pages of {branch_ids}: {str(e)}")
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_incidents_page_branches(session: Session) -> None:
+    session.info.pop("incidents_page_branch_ids", None)
+
+
+# the fields of the entries built by app.library.helpers.get_watchlist_entry
+WATCHLIST_ENTRY_CUSTOMER_FIELDS = (
+    "customer_id",
+    "company_id",
+    "branch_id",
+    "descriptor_1",
+    "descriptor_2",
+    "no_of_visits",
+)
+WATCHLIST_ENTRY_INCIDENT_FIELDS = (
+    "incident_id",
+    "company_id",
+    "branch_id",
+    "customer_id",
+    "incident_time",
+    "status",
+    "photo_url",
+    "no_of_visits",
+)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_watchlist_entry_customers(session: Session, flush_context) -> None:
+    """
+    Records the customers whose cached watchlist entries the flush may have
+    changed: the customers updated or deleted, and the customers of the
+    incidents updated or deleted, before and after. New rows have no entry yet.
+    """
+    if not config.WATCHLIST_ENTRY_CACHE_ENABLED:
+        return
+
+    customer_ids = set()
+
+    for objs, deleted in ((session.dirty, False), (session.deleted, True)):
+        for obj in objs:
+            if isinstance(obj, Customers):
+                fields = WATCHLIST_ENTRY_CUSTOMER_FIELDS
+                customer_id = "id"
+            elif isinstance(obj, Incidents):
+                fields = WATCHLIST_ENTRY_INCIDENT_FIELDS
+                customer_id = "customer_id"
+            else:
+                continue
+
+            state = inspect(obj)
+            if not deleted and not any(
+                state.attrs[field].history.has_changes() for field in fields
+            ):
+                continue
+
+            customer_ids.add(getattr(obj, customer_id))
+            customer_ids.update(state.attrs[customer_id].history.deleted)
+
+    customer_ids.discard(None)
+    if customer_ids:
+        session.info.setdefault("watchlist_entry_customer_ids", set()).update(
+            customer_ids
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def expire_watchlist_entries(session: Session) -> None:
+    """
+    Bumps the watchlist entry version of the customers changed by the committed
+    transaction, for their entries to be rebuilt from the data after it.
+    """
+    customer_ids = session.info.pop("watchlist_entry_customer_ids", None)
+    if not customer_ids:
+        return
+
+    try:
+        await_only(Cache.expire_watchlist_entries(customer_ids))
+
+    except Exception as e:
+        logger.error(
+            f"Failed to expire the watchlist entries of {customer_ids}: {str(e)}"
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_watchlist_entry_customers(session: Session) -> None:
+    session.info.pop("watchlist_entry_customer_ids", None)
+
+
+WATCHLIST_CUSTOMER_FIELDS = (
+    "branch_id",
+    "app_blacklisted",
+    "analyst_blacklisted",
+    "descriptor_1",
+    "descriptor_2",
+)
+WATCHLIST_INCIDENT_FIELDS = (
+    "branch_id",
+    "customer_id",
+    "incident_type",
+    "is_blacklisted",
+    "analyst_blacklisted",
+)
+
+
+def _watchlist_entries(obj, fields: tuple[str, ...], deleted: bool) -> set[tuple]:
+    """
+    Returns the (branch_id, customer id) pairs of the row before and after the
+    flush, or nothing when none of the fields of an updated row changed.
+    """
+    if obj.id is None:
+        return set()
+
+    state = inspect(obj)
+    if not deleted and not any(
+        state.attrs[field].history.has_changes() for field in fields
+    ):
+        return set()
+
+    customer_id = "id" if isinstance(obj, Customers) else "customer_id"
+    previous = {}
+
+    for field in ("branch_id", customer_id):
+        history = state.attrs[field].history
+        previous[field] = history.deleted[0] if history.deleted else getattr(obj, field)
+
+    return {
+        (obj.branch_id, getattr(obj, customer_id)),
+        (previous["branch_id"], previous[customer_id]),
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def collect_watchlist_customers(session: Session, flush_context) -> None:
+    """
+    Records the customers whose watchlist status or descriptors the flush may
+    have changed, by branch: their own and the branches of their blacklisted
+    incidents. The watchlist matchers reload them on commit.
+    """
+    if not config.WATCHLIST_MATCHER_ENABLED:
+        return
+
+    entries = set()
+
+    for obj in session.new:
+        if isinstance(obj, Customers):
+            if obj.app_blacklisted or obj.analyst_blacklisted:
+                entries.add((obj.branch_id, obj.id))
+
+        elif isinstance(obj, Incidents):
+            if obj.is_blacklisted and obj.analyst_blacklisted:
+                entries.add((obj.branch_id, obj.customer_id))
+
+    # customers are also watchlisted through their incidents, in the branches
+    # of those incidents
+    customer_ids = set()
+
+    for objs, deleted in ((session.dirty, False), (session.deleted, True)):
+        for obj in objs:
+            if isinstance(obj, Customers):
+                customer_entries = _watchlist_entries(
+                    obj, WATCHLIST_CUSTOMER_FIELDS, deleted=deleted
+                )
+                customer_ids.update(
+                    customer_id for _, customer_id in customer_entries
+                )
+                entries.update(customer_entries)
+
+            elif isinstance(obj, Incidents):
+                entries.update(
+                    _watchlist_entries(obj, WATCHLIST_INCIDENT_FIELDS, deleted=deleted)
+                )
+
+    customer_ids.discard(None)
+    if customer_ids:
+        query = (
+            select(Incidents.branch_id, Incidents.customer_id)
+            .where(
+                Incidents.customer_id.in_(sorted(customer_ids)),
+                Incidents.incident_type == Incidents.IncidentType.CUSTOMER_THEFT,
+                Incidents.is_blacklisted.is_(True),
+                Incidents.analyst_blacklisted.is_(True),
+            )
+            .distinct()
+        )
+        entries.update(
+            (branch_id, customer_id)
+            for branch_id, customer_id in session.connection().execute(query)
+        )
+
+    entries = {
+        (branch_id, customer_id)
+        for branch_id, customer_id in entries
+        if branch_id is not None and customer_id is not None
+    }
+    if not entries:
+        return
+
+    branch_customer_ids = session.info.setdefault("watchlist_customer_ids", {})
+    for branch_id, customer_id in entries:
+        branch_customer_ids.setdefault(branch_id, set()).add(customer_id)
+
+
+@event.listens_for(Session, "after_commit")
+def expire_watchlist_customers(session: Session) -> None:
+    """
+    Bumps the watchlist version of the branches changed by the committed
+    transaction, with the customers it changed.
+    """
+    branch_customer_ids = session.info.pop("watchlist_customer_ids", None)
+    if not branch_customer_ids:
+        return
+
+    try:
+        await_only(
+            Cache.expire_watchlist_customers(
+                branch_customer_ids, ttl=config.WATCHLIST_CHANGES_TTL
+            )
+        )
+
+    except Exception as e:
+        logger.error(
+            f"Failed to expire the watchlists of {set(branch_customer_ids)}: {str(e)}"
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_watchlist_customers(session: Session) -> None:
+    session.info.pop("watchlist_customer_ids", None)
+
+
+@event.listens_for(BlacklistSentLogs, "before_insert")
+def assign_watchlist_version(mapper, connection, target: BlacklistSentLogs) -> None:
+    """
+    Numbers the watchlist changes of each branch 1, 2, 3... The counter row of
+    the branch stays locked until the commit, so the changes of a branch commit
+    in version order and a client reading past a version never misses one.
+    """
+    query = insert(WatchlistVersions).values(branch_id=target.branch_id, version=1)
+    query = query.on_conflict_do_update(
+        index_elements=[WatchlistVersions.branch_id],
+        set_={"version": WatchlistVersions.version + 1},
+    )
+
+    target.version = connection.execute(
+        query.returning(WatchlistVersions.version)
+    ).scalar_one()
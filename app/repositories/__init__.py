@@ -9,3 +9,5 @@ from .incidents_analyst_audit import IncidentsAnalystAuditRepository
 from .incidents_audit import IncidentsAuditRepository
 from .incidents_blacklist import Incidents_Blacklist_Repository
 from .test_watchlist import TestWatchlistedRepository
+from .incident_daily_counts import IncidentDailyCountsRepository
+from .incident_views import IncidentViewsRepository
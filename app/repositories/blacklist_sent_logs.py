@@ -1,5 +1,14 @@
 from datetime import datetime
-from app.models import BlacklistSentLogs
+
+from sqlalchemy import Row, select
+
+from app.models import (
+    BlacklistSentLogs,
+    Customers,
+    Incidents,
+    Incidents_Blacklist,
+    WatchlistVersions,
+)
 from core.repository import BaseRepository
 
 
@@ -33,4 +42,72 @@ class BlacklistSentLogsRepository(BaseRepository[BlacklistSentLogs]):
             # Incidents.analyst_blacklisted.is_(True)
         )
         return await self._all(query)
-        
+
+    async def get_watchlist_version(self, branch_id: int) -> int:
+        """
+        Get the version of the last watchlist change of the branch.
+        """
+        query = select(WatchlistVersions.version).filter(
+            WatchlistVersions.branch_id == branch_id
+        )
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none() or 0
+
+    async def get_watchlist_changes(
+        self, branch_id: int, after_version: int
+    ) -> list[Row]:
+        """
+        Get the watchlist changes of the branch after a version, in order.
+        :return: rows of version, action_type, blacklist_id and incident_id.
+        """
+        query = select(
+            BlacklistSentLogs.version,
+            BlacklistSentLogs.action_type,
+            BlacklistSentLogs.blacklist_id,
+            BlacklistSentLogs.incident_id,
+        )
+        query = query.filter(
+            BlacklistSentLogs.branch_id == branch_id,
+            BlacklistSentLogs.version > after_version,
+        )
+
+        result = await self.session.execute(query.order_by(BlacklistSentLogs.version))
+        return result.fetchall()
+
+    async def get_watchlist_entries(
+        self, branch_id: int, blacklist_ids: list[int] | None = None
+    ) -> list[Row]:
+        """
+        Get the blacklisted incidents of the branch with their customer, all of
+        them or the ones of blacklist_ids.
+        :return: rows of Incidents and Customers.
+        """
+        if blacklist_ids is not None and not blacklist_ids:
+            return []
+
+        query = select(Incidents, Customers)
+        query = query.join(
+            Incidents_Blacklist, Incidents_Blacklist.incident_id == Incidents.id
+        )
+        query = query.join(Customers, Customers.id == Incidents.customer_id)
+        query = query.filter(Incidents.branch_id == branch_id)
+
+        if blacklist_ids is not None:
+            query = query.filter(Incidents_Blacklist.id.in_(blacklist_ids))
+
+        result = await self.session.execute(query.order_by(Incidents_Blacklist.id))
+        return result.fetchall()
+
+    async def get_removed_entries(self, incident_ids: list[int]) -> list[Row]:
+        """
+        Get the incident_id and the customer_id of incidents by primary key.
+        """
+        if not incident_ids:
+            return []
+
+        query = select(Incidents.incident_id, Customers.customer_id)
+        query = query.outerjoin(Customers, Customers.id == Incidents.customer_id)
+        query = query.filter(Incidents.id.in_(incident_ids))
+
+        result = await self.session.execute(query)
+        return result.fetchall()
@@ -39,6 +39,18 @@ class Customers_Blacklist_Repository(BaseRepository[Customers_Blacklist]):
         result = await self.session.execute(query)
         return result.fetchone()
 
+    async def get_customer_id(self, id: int) -> int | None:
+        """
+        Get the customer of a Customers_Blacklist.
+        :param id: Customers_Blacklist id.
+        :return: Customer id.
+        """
+        query = select(Customers_Blacklist.customer_id)
+        query = query.filter(Customers_Blacklist.id == id)
+
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none()
+
     async def get_by_customer_id(
         self, customer_id: int, join_: set[str] | None = None
     ) -> Customers_Blacklist | None:
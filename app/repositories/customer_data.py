@@ -1,10 +1,25 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import Row, and_, func, literal_column, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
 
-from app.models import Customers
+from app.models import Customers, Incidents
 from core.repository import BaseRepository
 
+CUSTOMER_EXPORT_FIELDS = (
+    Customers.id,
+    Customers.customer_id,
+    Customers.company_id,
+    Customers.branch_id,
+    Customers.camera_id,
+    Customers.no_of_visits,
+    Customers.analyst_blacklisted,
+    Customers.app_blacklisted,
+    Customers.visited_time,
+    Customers.pic_url,
+)
+
 
 class CustomerDataRepository(BaseRepository[Customers]):
     """
@@ -56,6 +71,48 @@ class CustomerDataRepository(BaseRepository[Customers]):
             return await self._all_unique(query)
         return await self._one_or_none(query)
 
+    async def get_by_customer_ids(self, customer_ids: list[str]) -> list[Customers]:
+        """
+        Get Customers by customer_ids.
+        :param customer_ids: Customer customer_ids.
+        :return: list[Customers].
+        """
+        query = await self._query()
+        query = query.filter(Customers.customer_id.in_(customer_ids))
+        return await self._all(query)
+
+    async def get_existing_customer_ids(self, customer_ids: list[str]) -> set[str]:
+        """
+        Get the customer_ids that are already stored.
+        :param customer_ids: Customer customer_ids.
+        :return: the stored customer_ids.
+        """
+        query = select(Customers.customer_id)
+        query = query.filter(Customers.customer_id.in_(customer_ids))
+
+        result = await self.session.execute(query)
+        return set(result.scalars())
+
+    async def create_many(self, customers: list[dict]) -> list[str]:
+        """
+        Inserts the customers in a single statement, skipping the ones whose
+        customer_id is already stored.
+        :param customers: Customers attributes, all with the same keys.
+        :return: the customer_ids that were inserted.
+        """
+        if not customers:
+            return []
+
+        query = (
+            insert(Customers)
+            .values(customers)
+            .on_conflict_do_nothing(index_elements=[Customers.customer_id])
+            .returning(Customers.customer_id)
+        )
+
+        result = await self.session.execute(query)
+        return list(result.scalars())
+
     async def get_customers(
         self,
         branch_id: int,
@@ -92,6 +149,74 @@ class CustomerDataRepository(BaseRepository[Customers]):
         result = await self.session.execute(query)
         return result.fetchall()
 
+    async def get_bucketed_customers(
+        self,
+        branch_id: int,
+        from_date: datetime,
+        to_date: datetime,
+        bucket: str,
+        is_blacklisted: bool | None,
+        offset: int | None,
+        limit: int | None,
+    ):
+        """
+        Get the customers visited between from_date and to_date, grouped in
+        hour or day buckets of visited_time, with offset and limit applied
+        within each bucket.
+        :param bucket: "hour" or "day".
+        :return: rows of (bucket, id, pic_url, analyst_blacklisted,
+            app_blacklisted, visited_time), ordered by bucket then visited_time.
+        """
+        bucket_start = func.date_trunc(
+            literal_column(f"'{bucket}'"), Customers.visited_time
+        )
+
+        query = select(
+            bucket_start.label("bucket"),
+            Customers.id,
+            Customers.pic_url,
+            Customers.analyst_blacklisted,
+            Customers.app_blacklisted,
+            Customers.visited_time,
+            func.row_number()
+            .over(
+                partition_by=bucket_start,
+                order_by=(Customers.visited_time.asc(), Customers.id.asc()),
+            )
+            .label("row_number"),
+        )
+
+        query = query.filter(
+            Customers.branch_id == branch_id,
+            Customers.visited_time >= from_date,
+            Customers.visited_time < to_date,
+        )
+
+        if is_blacklisted is not None:
+            query = query.filter(Customers.app_blacklisted == is_blacklisted)
+
+        customers = query.subquery()
+
+        query = select(
+            customers.c.bucket,
+            customers.c.id,
+            customers.c.pic_url,
+            customers.c.analyst_blacklisted,
+            customers.c.app_blacklisted,
+            customers.c.visited_time,
+        )
+
+        offset = offset or 0
+        query = query.filter(customers.c.row_number > offset)
+
+        if limit is not None:
+            query = query.filter(customers.c.row_number <= offset + limit)
+
+        query = query.order_by(customers.c.bucket, customers.c.row_number)
+
+        result = await self.session.execute(query)
+        return result.fetchall()
+
     async def get_customers_count(
         self,
         branch_id: int,
@@ -111,3 +236,231 @@ class CustomerDataRepository(BaseRepository[Customers]):
             query = query.filter(Customers.app_blacklisted == is_blacklisted)
 
         return await self._count(query)
+
+    async def stream_export_rows(
+        self,
+        company_id: int,
+        branch_ids: list[int] | None,
+        from_date: date,
+        to_date: date,
+        chunk_size: int,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Streams the CUSTOMER_EXPORT_FIELDS of the company customers visited from
+        from_date to to_date, both inclusive, in visited_time order. Rows are
+        fetched through a server-side cursor, chunk_size at a time.
+        """
+        from_datetime = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
+        to_datetime = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
+        to_datetime += timedelta(days=1)
+
+        query = select(*CUSTOMER_EXPORT_FIELDS)
+        query = query.filter(
+            Customers.company_id == company_id,
+            Customers.visited_time >= from_datetime,
+            Customers.visited_time < to_datetime,
+        )
+
+        if branch_ids:
+            query = query.filter(Customers.branch_id.in_(branch_ids))
+
+        query = query.order_by(Customers.visited_time.asc(), Customers.id.asc())
+        query = query.execution_options(yield_per=chunk_size)
+
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def get_watchlisted_customers(
+        self, branch_id: int, customer_ids: list[int] | None = None
+    ) -> list[Row]:
+        """
+        Get the descriptors of the customers on the branch watchlist: the branch
+        customers blacklisted from the app or by an analyst, and the customers of
+        the branch incidents blacklisted and confirmed by an analyst.
+        :param customer_ids: Only these customers, when given.
+        :return: rows of id, customer_id, descriptor_1 and descriptor_2.
+        """
+        watchlisted_incidents = select(Incidents.customer_id).filter(
+            Incidents.branch_id == branch_id,
+            Incidents.incident_type == Incidents.IncidentType.CUSTOMER_THEFT,
+            Incidents.is_blacklisted.is_(True),
+            Incidents.analyst_blacklisted.is_(True),
+            Incidents.customer_id.is_not(None),
+        )
+
+        query = select(
+            Customers.id,
+            Customers.customer_id,
+            Customers.descriptor_1,
+            Customers.descriptor_2,
+        )
+        query = query.filter(
+            or_(
+                and_(
+                    Customers.branch_id == branch_id,
+                    or_(
+                        Customers.app_blacklisted.is_(True),
+                        Customers.analyst_blacklisted.is_(True),
+                    ),
+                ),
+                Customers.id.in_(watchlisted_incidents),
+            )
+        )
+
+        if customer_ids is not None:
+            query = query.filter(Customers.id.in_(customer_ids))
+
+        result = await self.session.execute(query.order_by(Customers.id))
+        return result.fetchall()
+
+    async def get_descriptors(self, ids: list[int]) -> list[Row]:
+        """
+        Get the descriptors of customers by primary key.
+        :return: rows of id, customer_id, descriptor_1 and descriptor_2.
+        """
+        if not ids:
+            return []
+
+        query = select(
+            Customers.id,
+            Customers.customer_id,
+            Customers.descriptor_1,
+            Customers.descriptor_2,
+        )
+        query = query.filter(Customers.id.in_(ids))
+
+        result = await self.session.execute(query)
+        return result.fetchall()
+
+    async def get_descriptor_sample(self, company_id: int, size: int) -> list[Row]:
+        """
+        Get the descriptors of size random customers of the company.
+        :return: rows of descriptor_1 and descriptor_2.
+        """
+        query = select(Customers.descriptor_1, Customers.descriptor_2)
+        query = query.filter(Customers.company_id == company_id)
+        query = query.order_by(func.random()).limit(size)
+
+        result = await self.session.execute(query)
+        return result.fetchall()
+
+    async def stream_descriptors(
+        self, company_id: int, after_id: int, chunk_size: int
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Streams the descriptors of the company customers with an id above
+        after_id, in id order, chunk_size rows at a time.
+        :return: rows of id, descriptor_1 and descriptor_2.
+        """
+        query = select(Customers.id, Customers.descriptor_1, Customers.descriptor_2)
+        query = query.filter(
+            Customers.company_id == company_id, Customers.id > after_id
+        )
+        query = query.order_by(Customers.id).execution_options(yield_per=chunk_size)
+
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def get_unclustered_branch_ids(self, since: datetime) -> list[int]:
+        """
+        Get the branches with customers visiting since the given time that
+        have no visit group yet.
+        """
+        query = select(Customers.branch_id).distinct()
+        query = query.filter(
+            Customers.visit_group_id.is_(None), Customers.visited_time >= since
+        )
+
+        result = await self.session.execute(query.order_by(Customers.branch_id))
+        return result.scalars().all()
+
+    async def stream_visit_descriptors(
+        self, branch_id: int, since: datetime, chunk_size: int
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Streams the descriptors of the branch customers visiting since the given
+        time that have a visit group, in id order, chunk_size rows at a time.
+        :return: rows of id, visit_group_id, descriptor_1 and descriptor_2.
+        """
+        query = select(
+            Customers.id,
+            Customers.visit_group_id,
+            Customers.descriptor_1,
+            Customers.descriptor_2,
+        )
+        query = query.filter(
+            Customers.branch_id == branch_id,
+            Customers.visit_group_id.is_not(None),
+            Customers.visited_time >= since,
+        )
+        query = query.order_by(Customers.id).execution_options(yield_per=chunk_size)
+
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def get_unclustered_customers(
+        self, branch_id: int, since: datetime, after_id: int, limit: int
+    ) -> list[Row]:
+        """
+        Get the next branch customers visiting since the given time without a
+        visit group, in id order after after_id.
+        :return: rows of id, visit_group_id, descriptor_1 and descriptor_2.
+        """
+        query = select(
+            Customers.id,
+            Customers.visit_group_id,
+            Customers.descriptor_1,
+            Customers.descriptor_2,
+        )
+        query = query.filter(
+            Customers.branch_id == branch_id,
+            Customers.visit_group_id.is_(None),
+            Customers.visited_time >= since,
+            Customers.id > after_id,
+        )
+
+        result = await self.session.execute(query.order_by(Customers.id).limit(limit))
+        return result.fetchall()
+
+    async def set_visit_groups(
+        self, branch_id: int, groups: dict[int, int]
+    ) -> list[int]:
+        """
+        Stores the visit group of customers, then recounts the visits of every
+        customer of these groups. The caller commits.
+        :param groups: visit_group_id by customer id.
+        :return: the ids of the customers recounted.
+        """
+        if not groups:
+            return []
+
+        await self.session.execute(
+            update(Customers),
+            [{"id": id, "visit_group_id": group} for id, group in groups.items()],
+        )
+
+        visits = (
+            select(Customers.visit_group_id, func.count().label("visits"))
+            .filter(
+                Customers.branch_id == branch_id,
+                Customers.visit_group_id.in_(sorted(set(groups.values()))),
+            )
+            .group_by(Customers.visit_group_id)
+            .subquery()
+        )
+        query = (
+            update(Customers)
+            .filter(
+                Customers.branch_id == branch_id,
+                Customers.visit_group_id == visits.c.visit_group_id,
+            )
+            .values(no_of_visits=visits.c.visits)
+            .returning(Customers.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(query)
+
+        return result.scalars().all()
@@ -0,0 +1,103 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, cast, delete, func, insert, select, text
+
+from app.models import BranchIncidentDailyCounts, Incidents
+from core.repository import BaseRepository
+
+
+class IncidentDailyCountsRepository(BaseRepository[BranchIncidentDailyCounts]):
+    """
+    IncidentDailyCounts repository provides all the database operations for the
+    BranchIncidentDailyCounts rollup.
+    """
+
+    async def get_category_counts(
+        self,
+        branch_ids: list[int],
+        from_date: date | None,
+        to_date: date | None,
+        is_test_user: bool,
+    ):
+        """
+        Get incident counts per branch and category.
+        :param branch_ids: Branch ids.
+        :param from_date: First day to count, inclusive.
+        :param to_date: Last day to count, inclusive.
+        :param is_test_user: Whether test incidents are counted.
+        :return: rows of (branch_id, category, count)
+        """
+        query = select(
+            BranchIncidentDailyCounts.branch_id,
+            BranchIncidentDailyCounts.category,
+            func.sum(BranchIncidentDailyCounts.count).label("count"),
+        )
+        query = query.filter(BranchIncidentDailyCounts.branch_id.in_(branch_ids))
+
+        if not is_test_user:
+            query = query.filter(BranchIncidentDailyCounts.is_test.is_(False))
+
+        if from_date:
+            query = query.filter(BranchIncidentDailyCounts.day >= from_date)
+
+        if to_date:
+            query = query.filter(BranchIncidentDailyCounts.day <= to_date)
+
+        query = query.group_by(
+            BranchIncidentDailyCounts.branch_id,
+            BranchIncidentDailyCounts.category,
+        )
+
+        result = await self.session.execute(query)
+        return result.fetchall()
+
+    async def rebuild(self, from_date: date, to_date: date) -> None:
+        """
+        Recomputes the rollup rows of the given days from the incidents table.
+        The caller commits.
+        """
+        from_datetime = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
+        to_datetime = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
+        to_datetime += timedelta(days=1)
+
+        delete_query = delete(BranchIncidentDailyCounts).where(
+            BranchIncidentDailyCounts.day >= from_date,
+            BranchIncidentDailyCounts.day <= to_date,
+        )
+
+        day = cast(Incidents.incident_time, Date)
+        # NULL counts as test, as in _counter_key of app.models.listeners
+        is_test = Incidents.is_test.is_not(False)
+
+        counts_query = (
+            select(
+                Incidents.branch_id,
+                day,
+                Incidents.category,
+                is_test,
+                func.count(),
+            )
+            .where(
+                Incidents.incident_time >= from_datetime,
+                Incidents.incident_time < to_datetime,
+            )
+            .group_by(Incidents.branch_id, day, Incidents.category, is_test)
+        )
+
+        insert_query = insert(BranchIncidentDailyCounts).from_select(
+            ["branch_id", "day", "category", "is_test", "count"],
+            counts_query,
+        )
+
+        # Blocks incident writers until commit, so increments made by
+        # in-flight transactions are neither lost nor counted twice.
+        connection = await self.session.connection(
+            bind_arguments={"clause": delete_query}
+        )
+        await connection.execute(
+            text(
+                "LOCK TABLE branch_incident_daily_counts IN SHARE ROW EXCLUSIVE MODE"
+            )
+        )
+        await connection.execute(delete_query)
+        await connection.execute(insert_query)
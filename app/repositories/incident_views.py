@@ -0,0 +1,55 @@
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import IncidentViews
+from core.repository import BaseRepository
+
+
+class IncidentViewsRepository(BaseRepository[IncidentViews]):
+    """
+    IncidentViews repository provides all the database operations for the
+    IncidentViews documents.
+    """
+
+    async def get_by_incident_ids(
+        self, incident_ids: list[int]
+    ) -> dict[int, IncidentViews]:
+        """
+        Get the views of the incidents by primary key.
+        :return: views by incident id, incidents without a view are left out.
+        """
+        if not incident_ids:
+            return {}
+
+        query = select(IncidentViews).filter(
+            IncidentViews.incident_id.in_(incident_ids)
+        )
+        result = await self.session.execute(query)
+
+        return {view.incident_id: view for view in result.scalars()}
+
+    async def store(self, views: list[dict]) -> None:
+        """
+        Stores rebuilt documents. A document is dropped if its view was
+        invalidated after the version it was built from was read, as it may
+        miss the change. The caller commits.
+        :param views: incident_id, customer_id, previous_incident_id,
+            branch_timezone, document and the version read before building.
+        """
+        if not views:
+            return
+
+        query = insert(IncidentViews).values(views)
+        query = query.on_conflict_do_update(
+            index_elements=[IncidentViews.incident_id],
+            set_={
+                "customer_id": query.excluded.customer_id,
+                "previous_incident_id": query.excluded.previous_incident_id,
+                "branch_timezone": query.excluded.branch_timezone,
+                "document": query.excluded.document,
+                "updated_at": func.now(),
+            },
+            where=IncidentViews.version == query.excluded.version,
+        )
+
+        await self.session.execute(query)
@@ -1,14 +1,65 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import Select, bindparam, text
+from sqlalchemy import Row, Select, bindparam, func, lambda_stmt, text
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.sql.expression import and_, or_, select
-from sqlalchemy.types import Integer
+from sqlalchemy.orm import Bundle, aliased
+from sqlalchemy.sql.expression import column, select, true, tuple_, values
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlalchemy.types import BigInteger, Integer
 
-from app.models import Incidents, Incidents_Blacklist
-from core.config import config
+from app.models import Incidents, Incidents_Blacklist, IncidentViews
 from core.repository import BaseRepository
 
+# the incident fields the listing responses read, selected instead of whole
+# entities so pages skip the wide columns, the identity map and relationships
+INCIDENT_LIST_FIELDS = (
+    Incidents.id,
+    Incidents.incident_id,
+    Incidents.branch_id,
+    Incidents.customer_id,
+    Incidents.previous_incident_id,
+    Incidents.name,
+    Incidents.incident_type,
+    Incidents.incident_time,
+    Incidents.photo_url,
+    Incidents.video_url,
+    Incidents.thumbnail_url,
+    Incidents.status,
+    Incidents.comments,
+    Incidents.is_blacklisted,
+    Incidents.analyst_blacklisted,
+    Incidents.is_valid,
+    Incidents.match_score,
+)
+
+BLACKLIST_LIST_FIELDS = (
+    Incidents_Blacklist.id,
+    Incidents_Blacklist.created_at,
+    Incidents_Blacklist.related_incident_id,
+)
+
+INCIDENT_EXPORT_FIELDS = (
+    Incidents.id,
+    Incidents.incident_id,
+    Incidents.company_id,
+    Incidents.branch_id,
+    Incidents.camera_id,
+    Incidents.customer_id,
+    Incidents.incident_type,
+    Incidents.category,
+    Incidents.status,
+    Incidents.is_blacklisted,
+    Incidents.analyst_blacklisted,
+    Incidents.is_valid,
+    Incidents.match_score,
+    Incidents.no_of_visits,
+    Incidents.incident_time,
+    Incidents.photo_url,
+    Incidents.video_url,
+    Incidents.comments,
+)
+
 
 class IncidentsRepository(BaseRepository[Incidents]):
     """
@@ -43,7 +94,21 @@ class IncidentsRepository(BaseRepository[Incidents]):
         query = query.filter(Incidents.incident_id == incident_id)
         if join_ is not None:
             return await self._all_unique(query)
-        return await self._one_or_none(query)
+        # unique per incident_time only, the latest one if it was stored twice
+        query = query.order_by(Incidents.incident_time.desc(), Incidents.id.desc())
+        return await self._first(query)
+
+    async def get_incidents_by_incident_ids(
+        self, incident_ids: list[str]
+    ) -> list[Incidents]:
+        """
+        Get Incidents by incident_ids.
+        :param incident_ids: Incident incident_ids.
+        :return: list[Incidents].
+        """
+        query = await self._query()
+        query = query.filter(Incidents.incident_id.in_(incident_ids))
+        return await self._all(query)
 
     def _join_blacklists(self, query: Select) -> Select:
         """
@@ -55,17 +120,103 @@ class IncidentsRepository(BaseRepository[Incidents]):
             isouter=True,
         )
 
+    def _filter_incidents(
+        self,
+        statement: StatementLambdaElement,
+        branch_ids: list[int],
+        incident_filter: list[int] | None,
+        from_date: date | None,
+        to_date: date | None,
+        is_test_user: bool,
+    ) -> StatementLambdaElement:
+        """
+        Adds the listing filters to a cached statement. Each lambda is built
+        and compiled once, its closure values are bound as parameters.
+        Values of incident_filter that are not categories are ignored.
+        """
+        statement += lambda query: query.filter(Incidents.branch_id.in_(branch_ids))
+
+        if not is_test_user:
+            statement += lambda query: query.filter(Incidents.is_test.is_(False))
+
+        categories = [
+            category
+            for category in incident_filter or []
+            if category in Incidents.IncidentCategory.FILTERS
+        ]
+
+        if categories:
+            statement += lambda query: query.filter(Incidents.category.in_(categories))
+
+        if from_date:
+            from_datetime = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
+            statement += lambda query: query.filter(
+                Incidents.incident_time >= from_datetime
+            )
+
+        if to_date:
+            to_datetime = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
+            to_datetime = to_datetime.replace(hour=23, minute=59, second=59)
+            statement += lambda query: query.filter(
+                Incidents.incident_time <= to_datetime
+            )
+
+        return statement
+
     async def get_incidents_by_customer_id(
         self, incident: Incidents
     ) -> list[Incidents]:
-        query = select(self.model_class)
-        query = query.filter(
-            Incidents.customer_id == incident.customer_id, Incidents.id != incident.id
+        related_incidents = await self.get_related_incidents(incidents=[incident])
+        return related_incidents.get(incident.id, [])
+
+    async def get_related_incidents(
+        self, incidents: list[Incidents], limit: int = 5
+    ) -> dict[int, list[Incidents]]:
+        """
+        Get the latest incidents of the same customer for each of incidents,
+        in a single query.
+        :param incidents: Incidents, those without a customer are skipped.
+        :param limit: Related incidents per incident.
+        :return: related incidents by incident id, latest first.
+        """
+        pairs = [
+            (incident.id, incident.customer_id)
+            for incident in incidents
+            if incident.customer_id is not None
+        ]
+
+        if not pairs:
+            return {}
+
+        page = values(
+            column("incident_id", BigInteger),
+            column("customer_id", BigInteger),
+            name="page",
+        ).data(pairs)
+
+        # one index scan on (customer_id, incident_time) per page incident
+        related = (
+            select(Incidents)
+            .filter(
+                Incidents.customer_id == page.c.customer_id,
+                Incidents.id != page.c.incident_id,
+            )
+            .order_by(Incidents.incident_time.desc(), Incidents.id.desc())
+            .limit(limit)
+            .lateral("related")
         )
+        related_incident = aliased(Incidents, related)
 
-        query = query.limit(limit=5)
+        query = select(page.c.incident_id, related_incident)
+        query = query.select_from(page).join(related, true())
 
-        return await self._all(query)
+        result = await self.session.execute(query)
+
+        related_incidents = {}
+        for incident_id, incident in result:
+            related_incidents.setdefault(incident_id, []).append(incident)
+
+        return related_incidents
 
     async def get_incidents(
         self,
@@ -77,93 +228,90 @@ class IncidentsRepository(BaseRepository[Incidents]):
         from_date: date,
         to_date: date,
         is_test_user: bool,
+        cursor: tuple[datetime, int] | None = None,
         join_: set[str] | None = None,
-    ) -> list[Incidents] | None:
+    ) -> list[Row] | None:
         """
         Get incidents of a branch.
         :param branch_ids: Branch id.
-        :param join_: Join relations.
-        :return: list[Incidents]
+        :param cursor: (incident_time, id) of the last incident of the previous page.
+        :param join_: Join relations, views adds the version, document and
+            branch_timezone of the view of each incident, all None when it
+            has none.
+        :return: rows of (incident, blacklist[, view]), with the
+            INCIDENT_LIST_FIELDS and response of the incident and the
+            BLACKLIST_LIST_FIELDS of its blacklist, all None when it has none.
         """
-        query = select(self.model_class, Incidents_Blacklist)
-        query = self._maybe_join(query, join_)
-        query = query.filter(Incidents.branch_id.in_(branch_ids))
+        statement = lambda_stmt(
+            lambda: select(
+                Bundle("incident", *INCIDENT_LIST_FIELDS, Incidents.response),
+                Bundle("blacklist", *BLACKLIST_LIST_FIELDS),
+            )
+        )
 
-        if not is_test_user:
-            query = query.filter(Incidents.is_test.is_(False))
+        if join_ and "blacklists" in join_:
+            statement += lambda query: query.join(
+                Incidents_Blacklist,
+                Incidents.id == Incidents_Blacklist.incident_id,
+                isouter=True,
+            )
 
-        filters = []
-        if incident_filter:
-            if config.BLACKLISTED in incident_filter:
-                filters.append(
-                    and_(
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        Incidents.is_blacklisted.is_(True),
-                        Incidents.analyst_blacklisted.is_(True),
-                    )
+        if join_ and "views" in join_:
+            statement += lambda query: query.add_columns(
+                Bundle(
+                    "view",
+                    IncidentViews.version,
+                    IncidentViews.document,
+                    IncidentViews.branch_timezone,
                 )
+            ).join(
+                IncidentViews,
+                Incidents.id == IncidentViews.incident_id,
+                isouter=True,
+            )
 
-            if config.PREVIOUSLY_BLACKLISTED in incident_filter:
-                filters.append(
-                    and_(
-                        Incidents.is_blacklisted.is_(True),
-                        Incidents.status
-                        == Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                    )
-                )
+        statement = self._filter_incidents(
+            statement,
+            branch_ids=branch_ids,
+            incident_filter=incident_filter,
+            from_date=from_date,
+            to_date=to_date,
+            is_test_user=is_test_user,
+        )
 
-            if config.SENSITIVE in incident_filter:
-                filters.append(
-                    and_(
-                        or_(
-                            Incidents.is_blacklisted.is_not(True),
-                            Incidents.analyst_blacklisted.is_not(True),
-                        ),
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        or_(
-                            Incidents.is_valid
-                            != Incidents.AnalystValidationChoices.VALID,
-                            Incidents.is_valid.is_(None),
-                        ),
-                    )
+        if cursor:
+            # the plain incident_time bound lets the planner prune partitions,
+            # which it cannot do from the row comparison alone
+            cursor_time, cursor_id = cursor
+            if sort == "asc":
+                statement += lambda query: query.filter(
+                    Incidents.incident_time >= cursor_time,
+                    tuple_(Incidents.incident_time, Incidents.id)
+                    > tuple_(cursor_time, cursor_id),
                 )
-
-            if config.LIKELY_THEFT in incident_filter:
-                filters.append(
-                    and_(
-                        or_(
-                            Incidents.is_blacklisted.is_not(True),
-                            Incidents.analyst_blacklisted.is_not(True),
-                        ),
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        Incidents.is_valid == Incidents.AnalystValidationChoices.VALID,
-                    )
+            else:
+                statement += lambda query: query.filter(
+                    Incidents.incident_time <= cursor_time,
+                    tuple_(Incidents.incident_time, Incidents.id)
+                    < tuple_(cursor_time, cursor_id),
                 )
 
-        if filters:
-            query = query.filter(or_(*filters))
-
-        if from_date:
-            from_date = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
-            query = query.filter(Incidents.incident_time >= from_date)
-
-        if to_date:
-            to_date = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
-            to_date = to_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(Incidents.incident_time <= to_date)
+        else:
+            statement += lambda query: query.offset(skip)
 
-        query = query.offset(skip).limit(limit)
+        statement += lambda query: query.limit(limit)
 
         if sort == "asc":
-            query = query.order_by(Incidents.incident_time.asc())
+            statement += lambda query: query.order_by(
+                Incidents.incident_time.asc(), Incidents.id.asc()
+            )
 
         else:
-            query = query.order_by(Incidents.incident_time.desc())
+            statement += lambda query: query.order_by(
+                Incidents.incident_time.desc(), Incidents.id.desc()
+            )
 
-        result = await self.session.execute(query)
+        result = await self.session.execute(statement)
 
         return result.fetchall()
 
@@ -191,20 +339,15 @@ class IncidentsRepository(BaseRepository[Incidents]):
                         bl.branch_id AS id,
 
                         COUNT(CASE
-                            WHEN (i.is_blacklisted IS NOT true OR i.analyst_blacklisted IS NOT true)
-                                AND i.status != 4
-                                AND i.is_valid = 1
+                            WHEN i.category = :likely_theft
                             THEN 1 END) AS likely_theft_count,
 
                         COUNT(CASE
-                            WHEN (i.is_blacklisted IS NOT true OR i.analyst_blacklisted IS NOT true)
-                                AND i.status != 4
-                                AND (i.is_valid IS NULL OR i.is_valid != 1)
+                            WHEN i.category = :sensitive
                             THEN 1 END) AS sensitive_theft_count,
 
                         COUNT(CASE
-                            WHEN i.is_blacklisted IS true
-                                AND (i.analyst_blacklisted IS true OR i.status = 4)
+                            WHEN i.category IN (:blacklisted, :previously_blacklisted)
                             THEN 1 END) AS blacklist_count
 
                     FROM branch_list bl
@@ -228,22 +371,17 @@ class IncidentsRepository(BaseRepository[Incidents]):
                         bl.branch_id AS id,
 
                         COUNT(CASE
-                            WHEN (i.is_blacklisted IS NOT true OR i.analyst_blacklisted IS NOT true)
-                                AND i.status != 4
-                                AND i.is_valid = 1
+                            WHEN i.category = :likely_theft
                                 AND i.is_test is false
                             THEN 1 END) AS likely_theft_count,
 
                         COUNT(CASE
-                            WHEN (i.is_blacklisted IS NOT true OR i.analyst_blacklisted IS NOT true)
-                                AND i.status != 4
-                                AND (i.is_valid IS NULL OR i.is_valid != 1)
+                            WHEN i.category = :sensitive
                                 AND i.is_test is false
                             THEN 1 END) AS sensitive_theft_count,
 
                         COUNT(CASE
-                            WHEN i.is_blacklisted IS true
-                                AND (i.analyst_blacklisted IS true OR i.status = 4)
+                            WHEN i.category IN (:blacklisted, :previously_blacklisted)
                                 AND i.is_test is false
                             THEN 1 END) AS blacklist_count
 
@@ -266,7 +404,17 @@ class IncidentsRepository(BaseRepository[Incidents]):
 
         result = await self.session.execute(
             statement,
-            {"branch_ids": branch_ids, "start_date": from_date, "end_date": to_date},
+            {
+                "branch_ids": branch_ids,
+                "start_date": from_date,
+                "end_date": to_date,
+                "likely_theft": Incidents.IncidentCategory.LIKELY_THEFT,
+                "sensitive": Incidents.IncidentCategory.SENSITIVE,
+                "blacklisted": Incidents.IncidentCategory.BLACKLISTED,
+                "previously_blacklisted": (
+                    Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED
+                ),
+            },
         )
         return result.mappings().all()
 
@@ -279,87 +427,78 @@ class IncidentsRepository(BaseRepository[Incidents]):
         is_test_user: bool,
         join_: set[str] | None = None,
     ) -> int:
-        query = await self._query(join_)
-        query = query.filter(Incidents.branch_id.in_(branch_ids))
+        statement = lambda_stmt(lambda: select(func.count(Incidents.id)))
 
-        if not is_test_user:
-            query = query.filter(Incidents.is_test.is_(False))
+        if join_ and "blacklists" in join_:
+            statement += lambda query: query.join(
+                Incidents_Blacklist,
+                Incidents.id == Incidents_Blacklist.incident_id,
+                isouter=True,
+            )
 
-        filters = []
-        if incident_filter:
-            if config.BLACKLISTED in incident_filter:
-                filters.append(
-                    and_(
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        Incidents.is_blacklisted.is_(True),
-                        Incidents.analyst_blacklisted.is_(True),
-                    )
-                )
+        statement = self._filter_incidents(
+            statement,
+            branch_ids=branch_ids,
+            incident_filter=incident_filter,
+            from_date=from_date,
+            to_date=to_date,
+            is_test_user=is_test_user,
+        )
 
-            if config.PREVIOUSLY_BLACKLISTED in incident_filter:
-                filters.append(
-                    and_(
-                        Incidents.is_blacklisted.is_(True),
-                        Incidents.status
-                        == Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                    )
-                )
+        result = await self.session.execute(statement)
+        return result.scalar_one()
 
-            if config.SENSITIVE in incident_filter:
-                filters.append(
-                    and_(
-                        or_(
-                            Incidents.is_blacklisted.is_not(True),
-                            Incidents.analyst_blacklisted.is_not(True),
-                        ),
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        or_(
-                            Incidents.is_valid
-                            != Incidents.AnalystValidationChoices.VALID,
-                            Incidents.is_valid.is_(None),
-                        ),
-                    )
-                )
+    async def stream_export_rows(
+        self,
+        company_id: int,
+        branch_ids: list[int] | None,
+        from_date: date,
+        to_date: date,
+        is_test_user: bool,
+        chunk_size: int,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Streams the INCIDENT_EXPORT_FIELDS of the company incidents from
+        from_date to to_date, both inclusive, in incident_time order. Rows are
+        fetched through a server-side cursor, chunk_size at a time.
+        """
+        from_datetime = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
+        to_datetime = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
+        to_datetime += timedelta(days=1)
 
-            if config.LIKELY_THEFT in incident_filter:
-                filters.append(
-                    and_(
-                        or_(
-                            Incidents.is_blacklisted.is_not(True),
-                            Incidents.analyst_blacklisted.is_not(True),
-                        ),
-                        Incidents.status
-                        != Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
-                        Incidents.is_valid == Incidents.AnalystValidationChoices.VALID,
-                    )
-                )
+        query = select(*INCIDENT_EXPORT_FIELDS)
+        query = query.filter(
+            Incidents.company_id == company_id,
+            Incidents.incident_time >= from_datetime,
+            Incidents.incident_time < to_datetime,
+        )
 
-        if filters:
-            query = query.filter(or_(*filters))
+        if branch_ids:
+            query = query.filter(Incidents.branch_id.in_(branch_ids))
 
-        if from_date:
-            from_date = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
-            query = query.filter(Incidents.incident_time >= from_date)
+        if not is_test_user:
+            query = query.filter(Incidents.is_test.is_(False))
 
-        if to_date:
-            to_date = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
-            to_date = to_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(Incidents.incident_time <= to_date)
+        query = query.order_by(Incidents.incident_time.asc(), Incidents.id.asc())
+        query = query.execution_options(yield_per=chunk_size)
 
-        return await self._count(query)
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
 
     async def get_blacklisted_incidents(
         self,
         branch_id: int,
         join_ = None,
-    ):
-        query = await self._query(join_)
+    ) -> list[Row]:
+        query = select(*INCIDENT_LIST_FIELDS)
+        query = self._maybe_join(query, join_)
         query = query.filter(
             Incidents.branch_id == branch_id,
             Incidents.incident_type == Incidents.IncidentType.CUSTOMER_THEFT,
             Incidents.is_blacklisted.is_(True),
             Incidents.analyst_blacklisted.is_(True)
         )
-        return await self._all(query)
+
+        result = await self.session.execute(query)
+        return result.fetchall()
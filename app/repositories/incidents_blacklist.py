@@ -1,9 +1,11 @@
 from datetime import date, datetime
 
-from sqlalchemy import Select
-from sqlalchemy.sql.expression import or_, select
+from sqlalchemy import Row, Select
+from sqlalchemy.orm import Bundle
+from sqlalchemy.sql.expression import select, tuple_
 
 from app.models import Customers, Incidents, Incidents_Blacklist
+from app.repositories.incidents import BLACKLIST_LIST_FIELDS, INCIDENT_LIST_FIELDS
 from core.repository import BaseRepository
 
 
@@ -32,6 +34,20 @@ class Incidents_Blacklist_Repository(BaseRepository[Incidents_Blacklist]):
         result = await self.session.execute(query)
         return result.fetchone()
 
+    async def get_customer_id(self, id: int) -> int | None:
+        """
+        Get the customer of the incident of a Blacklist.
+        :param id: Blacklist id.
+        :return: Customer id.
+        """
+        query = select(Incidents.customer_id).join(
+            Incidents_Blacklist, Incidents.id == Incidents_Blacklist.incident_id
+        )
+        query = query.filter(Incidents_Blacklist.id == id)
+
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none()
+
     async def get_by_incident_id(
         self, incident_id: int, join_: set[str] | None = None
     ) -> Incidents_Blacklist | None:
@@ -76,29 +92,35 @@ class Incidents_Blacklist_Repository(BaseRepository[Incidents_Blacklist]):
         to_date: date | None,
         branch_id,
         is_test_user: bool,
+        cursor: tuple[datetime, int] | None = None,
         join_: set[str] | None = None,
-    ) -> list[Incidents_Blacklist] | None:
+    ) -> list[Row] | None:
         """
         Get Blacklisted incidents of a branch.
         :param branch_id: Branch id.
+        :param cursor: (incident_time, id) of the last incident of the previous page.
         :param join_: Join relations.
-        :return: list[Incidents_Blacklist]
+        :return: rows of (blacklist, incident) with the BLACKLIST_LIST_FIELDS
+            and INCIDENT_LIST_FIELDS.
         """
-        query = select(self.model_class, Incidents)
+        query = select(
+            Bundle("blacklist", *BLACKLIST_LIST_FIELDS),
+            Bundle("incident", *INCIDENT_LIST_FIELDS),
+        )
         query = self._maybe_join(query, join_)
         query = query.filter(Incidents.branch_id == branch_id)
-        query = query.filter(Incidents.is_blacklisted.is_(True))
-
-        if not is_test_user:
-            query = query.filter(Incidents.is_test.is_(False))
-
         query = query.filter(
-            or_(
-                Incidents.analyst_blacklisted.is_(True),
-                Incidents.status == Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
+            Incidents.category.in_(
+                (
+                    Incidents.IncidentCategory.BLACKLISTED,
+                    Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED,
+                )
             )
         )
 
+        if not is_test_user:
+            query = query.filter(Incidents.is_test.is_(False))
+
         if from_date:
             from_date = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
             query = query.filter(Incidents.incident_time >= from_date)
@@ -108,8 +130,17 @@ class Incidents_Blacklist_Repository(BaseRepository[Incidents_Blacklist]):
             to_date = to_date.replace(hour=23, minute=59, second=59)
             query = query.filter(Incidents.incident_time <= to_date)
 
-        query = query.offset(skip).limit(limit)
-        query = query.order_by(Incidents.incident_time.desc())
+        if cursor:
+            query = query.filter(Incidents.incident_time <= cursor[0])
+            query = query.filter(
+                tuple_(Incidents.incident_time, Incidents.id) < tuple_(*cursor)
+            )
+
+        else:
+            query = query.offset(skip)
+
+        query = query.limit(limit)
+        query = query.order_by(Incidents.incident_time.desc(), Incidents.id.desc())
 
         result = await self.session.execute(query)
         return result.fetchall()
@@ -125,18 +156,18 @@ class Incidents_Blacklist_Repository(BaseRepository[Incidents_Blacklist]):
         query = select(self.model_class, Incidents)
         query = self._maybe_join(query, join_)
         query = query.filter(Incidents.branch_id == branch_id)
-        query = query.filter(Incidents.is_blacklisted.is_(True))
-
-        if not is_test_user:
-            query = query.filter(Incidents.is_test.is_(False))
-
         query = query.filter(
-            or_(
-                Incidents.analyst_blacklisted.is_(True),
-                Incidents.status == Incidents.IncidentStatus.PREVIOUSLY_BLACKLISTED,
+            Incidents.category.in_(
+                (
+                    Incidents.IncidentCategory.BLACKLISTED,
+                    Incidents.IncidentCategory.PREVIOUSLY_BLACKLISTED,
+                )
             )
         )
 
+        if not is_test_user:
+            query = query.filter(Incidents.is_test.is_(False))
+
         if from_date:
             from_date = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
             query = query.filter(Incidents.incident_time >= from_date)
@@ -21,3 +21,15 @@ class TestWatchlistedRepository(BaseRepository[TestWatchlistedCustomers]):
         if join_ is not None:
             return await self._all_unique(query)
         return await self._all(query)
+
+    async def get_by_customer_ids(
+        self, customer_ids: list[int]
+    ) -> list[TestWatchlistedCustomers]:
+        """
+        Get TestWatchlistedCustomers of any of the customer_ids.
+        :param customer_ids: Customers ids.
+        :return: list[TestWatchlistedCustomers].
+        """
+        query = await self._query()
+        query = query.filter(TestWatchlistedCustomers.customer_id.in_(customer_ids))
+        return await self._all(query)
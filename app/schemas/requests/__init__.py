@@ -16,3 +16,5 @@ from .incidents import (
     ValidateIncidentTestRequest,
 )
 from .notifications import SendNotificationRequest
+from .watchlist import MatchWatchlistRequest
+from .customers import SearchCustomersRequest
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+from core.config import config
+
+from .watchlist import Descriptor
+
+
+class SearchCustomersRequest(BaseModel):
+    company_id: int = Field(ge=1, le=9223372036854775807)
+    descriptors: list[Descriptor] = Field(
+        min_length=1, max_length=config.CUSTOMER_SEARCH_BATCH_MAX_SIZE
+    )
+    k: int = Field(default=5, ge=1, le=config.CUSTOMER_SEARCH_MAX_K)
@@ -0,0 +1,18 @@
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
+
+from core.config import config
+from core.utils.descriptors import DESCRIPTOR_LENGTH
+
+Descriptor = Annotated[
+    list[float], Field(min_length=DESCRIPTOR_LENGTH, max_length=DESCRIPTOR_LENGTH)
+]
+
+
+class MatchWatchlistRequest(BaseModel):
+    descriptors: list[Descriptor] = Field(
+        min_length=1, max_length=config.WATCHLIST_MATCH_BATCH_MAX_SIZE
+    )
+    k: int = Field(default=5, ge=1, le=config.WATCHLIST_MATCH_MAX_K)
+    metric: Literal["cosine", "euclidean"] = "cosine"
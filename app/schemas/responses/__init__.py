@@ -1,13 +1,17 @@
-from .customers import CustomerData, GetCustomersResponse
+from .customers import CustomerData, CustomerMatchResponse, GetCustomersResponse
 from .incidents import (
     AddToBlacklistResponse,
     AuditResponse,
     BlacklistIncidentResponse,
+    BlacklistIncidentsPageResponse,
     BranchIncidentsCountResponse,
+    CreateIncidentBatchResponse,
     CreateIncidentResponse,
     IncidentResponse,
+    IncidentsPageResponse,
     RemoveBlacklistResponse,
     SuspiciousIncidentsResponse,
     UpdateIncidentResponse,
     UserResponse,
 )
+from .watchlist import WatchlistMatchResponse
@@ -13,3 +13,9 @@ class GetCustomersResponse(BaseModel):
     interval: str | None = None
     label: str | None = None
     data: list[CustomerData]
+
+
+class CustomerMatchResponse(BaseModel):
+    id: int
+    customer_id: str
+    distance: float
@@ -60,6 +60,11 @@ class IncidentResponse(BaseModel):
     response: str | None = None
 
 
+class IncidentsPageResponse(BaseModel):
+    data: list[IncidentResponse]
+    next_cursor: str | None = None
+
+
 class BranchIncidentsCountResponse(BaseModel):
     id: int
     branch_name: str | None
@@ -101,6 +106,11 @@ class BlacklistIncidentResponse(BaseModel):
     prev_duration: str | None = None
 
 
+class BlacklistIncidentsPageResponse(BaseModel):
+    data: list[BlacklistIncidentResponse]
+    next_cursor: str | None = None
+
+
 class BaseUpdateResponse(BaseModel):
     status: str = "success"
 
@@ -114,6 +124,13 @@ class CreateIncidentResponse(BaseUpdateResponse):
     message: str = " The incident is created successfully"
 
 
+class CreateIncidentBatchResponse(BaseModel):
+    inci_id: str | None = None
+    id: int | None = None
+    status: str
+    detail: str | None = None
+
+
 class RemoveBlacklistResponse(BaseUpdateResponse):
     message: str = "Removed from blacklist successfully"
 
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class WatchlistMatchResponse(BaseModel):
+    id: int
+    customer_id: str
+    # cosine similarity, or euclidean distance
+    score: float
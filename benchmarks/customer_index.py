@@ -0,0 +1,168 @@
+"""
+Compares the recall and the latency of the customer index with a brute force search.
+
+    python -m benchmarks.customer_index --customers 200000 --queries 200
+
+Generates clustered descriptors, two per customer, builds an index the way
+app.jobs.customer_index does, saves it and maps it back from disk. For each
+nprobe, the queries, new descriptors of known customers, are searched through
+the index with the candidates ranked again by their exact distance, as
+CustomerIndex.search does, and with an exact scan of every descriptor.
+Recall is the share of the brute force top k the index finds. No database is
+needed.
+"""
+
+import argparse
+import math
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from core.utils.descriptors import DESCRIPTOR_LENGTH
+from core.utils.ivfpq import IVFPQIndex, squared_distances
+
+
+def generate(
+    customers: int, queries: int, seed: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: the ids and the descriptors of the customers, then the queries and
+        the customer each of them was generated from.
+    """
+    rng = np.random.default_rng(seed)
+
+    # faces resemble each other in groups, customers are spread around them
+    groups = rng.normal(0, 0.3, (max(1, customers // 500), DESCRIPTOR_LENGTH))
+    faces = groups[rng.integers(len(groups), size=customers)]
+    faces += rng.normal(0, 0.1, faces.shape)
+
+    ids = np.repeat(np.arange(1, customers + 1), 2)
+    vectors = faces[ids - 1] + rng.normal(0, 0.03, (len(ids), DESCRIPTOR_LENGTH))
+
+    query_ids = rng.choice(np.arange(1, customers + 1), size=queries, replace=False)
+    query_vectors = faces[query_ids - 1] + rng.normal(
+        0, 0.03, (queries, DESCRIPTOR_LENGTH)
+    )
+
+    return (
+        ids,
+        vectors.astype(np.float32),
+        query_vectors.astype(np.float32),
+        query_ids,
+    )
+
+
+def closest_ids(distances: np.ndarray, ids: np.ndarray, k: int) -> np.ndarray:
+    """
+    The k closest ids, an id counting once with its closest descriptor.
+    """
+    order = np.argsort(distances, kind="stable")
+    _, first = np.unique(ids[order], return_index=True)
+    return ids[order[np.sort(first)][:k]]
+
+
+def brute_force(
+    ids: np.ndarray, vectors: np.ndarray, queries: np.ndarray, k: int
+) -> list[np.ndarray]:
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    return [
+        closest_ids(squared_distances(query[None, :], vectors, norms)[0], ids, k)
+        for query in queries
+    ]
+
+
+def rerank(
+    index: IVFPQIndex,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    nprobe: int,
+    rerank_factor: int,
+) -> list[np.ndarray]:
+    # descriptors by id, as CustomerIndex.search reads them from the database
+    starts = np.searchsorted(ids, np.arange(ids.max() + 2))
+    candidates, _ = index.search(queries, k * rerank_factor, nprobe)
+
+    results = []
+    for query, query_candidates in zip(queries, candidates):
+        query_candidates = query_candidates[query_candidates >= 0]
+        rows = np.concatenate(
+            [np.arange(starts[id], starts[id + 1]) for id in query_candidates]
+        )
+        distances = ((vectors[rows] - query) ** 2).sum(axis=1)
+        results.append(closest_ids(distances, ids[rows], k))
+
+    return results
+
+
+def run(customers: int, queries: int, k: int, nprobes: list[int], rerank_factor: int):
+    ids, vectors, query_vectors, query_ids = generate(customers, queries, seed=0)
+    print(f"{len(vectors)} descriptors of {customers} customers, {queries} queries")
+
+    started_at = time.perf_counter()
+    sample = vectors[np.random.default_rng(1).permutation(len(vectors))[:100000]]
+    nlist = max(1, min(len(sample) // 39, 4 * int(math.sqrt(len(sample)))))
+    index = IVFPQIndex.train(sample, nlist=nlist, m=16)
+    index.fill(ids, *index.encode(vectors))
+    print(f"built {nlist} lists in {time.perf_counter() - started_at:.1f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(Path(directory))
+        size = sum(path.stat().st_size for path in Path(directory).iterdir())
+        print(
+            f"index {size / 2**20:.1f} MiB on disk, "
+            f"descriptors {vectors.nbytes / 2**20:.1f} MiB"
+        )
+
+        started_at = time.perf_counter()
+        index = IVFPQIndex.load(Path(directory))
+        print(f"mapped in {(time.perf_counter() - started_at) * 1000:.1f} ms")
+
+        started_at = time.perf_counter()
+        expected = brute_force(ids, vectors, query_vectors, k)
+        brute_force_time = (time.perf_counter() - started_at) / queries
+        print(f"brute force: {brute_force_time * 1000:.2f} ms/query")
+
+        for nprobe in nprobes:
+            started_at = time.perf_counter()
+            found = rerank(
+                index, ids, vectors, query_vectors, k, nprobe, rerank_factor
+            )
+            index_time = (time.perf_counter() - started_at) / queries
+
+            recall = np.mean(
+                [
+                    len(np.intersect1d(result, truth)) / len(truth)
+                    for result, truth in zip(found, expected)
+                ]
+            )
+            hits = np.mean([result[0] == id for result, id in zip(found, query_ids)])
+            print(
+                f"nprobe {nprobe}: {index_time * 1000:.2f} ms/query, "
+                f"recall@{k} {recall:.3f}, same customer first {hits:.3f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--rerank-factor", type=int, default=10)
+    args = parser.parse_args()
+
+    run(
+        customers=args.customers,
+        queries=args.queries,
+        k=args.k,
+        nprobes=args.nprobes,
+        rerank_factor=args.rerank_factor,
+    )
+
+
+if __name__ == "__main__":
+    main()
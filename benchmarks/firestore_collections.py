@@ -0,0 +1,140 @@
+"""
+Compares the documents per second of the Firestore collection helpers.
+
+    export FIRESTORE_EMULATOR_HOST=localhost:8080
+    python -m benchmarks.firestore_collections --documents 20000 --page-size 1000
+
+Fills a collection of the emulator with documents shaped like the watchlist
+entries, then reads it whole with get_all_documents_from_collection and page by
+page with stream_collection, with and without a field mask, and deletes it
+document by document, the way delete_collection did, and with the BulkWriter
+of delete_collection. Needs the Firestore emulator, no Firebase credentials.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore import AsyncClient, Client
+
+from core.utils.firebase.firebase import FireStoreHandler
+
+
+def get_document(index: int) -> dict:
+    return {
+        "incident_id": str(uuid.uuid4()),
+        "customer_id": str(uuid.uuid4()),
+        "is_blacklisted": True,
+        "descriptor_1": ",".join(["0.0123456"] * 128),
+        "descriptor_2": ",".join(["0.0123456"] * 128),
+        "no_of_visits": index % 10,
+    }
+
+
+async def fill(handler: FireStoreHandler, collection: str, documents: int) -> None:
+    await asyncio.gather(
+        *(
+            handler.write_to_document(
+                collection, f"document-{index}", get_document(index)
+            )
+            for index in range(documents)
+        )
+    )
+
+
+def delete_one_by_one(handler: FireStoreHandler, collection: str) -> int:
+    deleted = 0
+    for document in handler.firestore_db.collection(collection).list_documents():
+        document.delete()
+        deleted += 1
+
+    return deleted
+
+
+async def count_streamed(
+    handler: FireStoreHandler, collection: str, page_size: int, fields: list[str] | None
+) -> int:
+    streamed = 0
+    async for page in handler.stream_collection(
+        collection, page_size=page_size, fields=fields
+    ):
+        streamed += len(page)
+
+    return streamed
+
+
+def report(name: str, documents: int, started_at: float) -> None:
+    elapsed = time.perf_counter() - started_at
+    print(f"{name}: {documents} documents, {documents / elapsed:.0f} documents/s")
+
+
+async def run(project: str, documents: int, page_size: int, max_ops_per_second: int):
+    handler = FireStoreHandler(
+        Client(project=project, credentials=AnonymousCredentials()),
+        async_client=AsyncClient(project=project, credentials=AnonymousCredentials()),
+    )
+    collection = f"benchmark-{uuid.uuid4()}"
+
+    started_at = time.perf_counter()
+    await fill(handler, collection, documents)
+    report("batched writes", documents, started_at)
+
+    started_at = time.perf_counter()
+    read = len(
+        await asyncio.to_thread(handler.get_all_documents_from_collection, collection)
+    )
+    report("get_all_documents_from_collection", read, started_at)
+
+    started_at = time.perf_counter()
+    read = await count_streamed(handler, collection, page_size, fields=None)
+    report(f"stream_collection, pages of {page_size}", read, started_at)
+
+    started_at = time.perf_counter()
+    read = await count_streamed(
+        handler, collection, page_size, fields=["incident_id", "customer_id"]
+    )
+    report("stream_collection, two fields", read, started_at)
+
+    half = f"{collection}-half"
+    await fill(handler, half, documents // 2)
+
+    started_at = time.perf_counter()
+    deleted = await asyncio.to_thread(delete_one_by_one, handler, half)
+    report("delete document by document", deleted, started_at)
+
+    started_at = time.perf_counter()
+    deleted = await asyncio.to_thread(
+        handler.delete_collection,
+        collection,
+        page_size,
+        max_ops_per_second,
+    )
+    report(f"delete_collection, {max_ops_per_second} ops/s", deleted, started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--project", default="demo-benchmark")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--max-ops-per-second", type=int, default=5000)
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        parser.error("FIRESTORE_EMULATOR_HOST is not set, start the emulator first")
+
+    asyncio.run(
+        run(
+            project=args.project,
+            documents=args.documents,
+            page_size=args.page_size,
+            max_ops_per_second=args.max_ops_per_second,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
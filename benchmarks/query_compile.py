@@ -0,0 +1,171 @@
+"""
+Compares the per-call compile cost of the plain and the cached incident queries.
+
+    python -m benchmarks.query_compile --calls 5000
+
+Builds the incidents listing and count statements the way get_incidents and
+get_incidents_count did with select() and the way they do with lambda_stmt,
+and times building plus compiling them through a compiled cache, as the
+engine does on every execute. No database is needed.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg
+from sqlalchemy.orm import Bundle
+from sqlalchemy.sql.expression import select
+
+from app.models import Incidents, Incidents_Blacklist
+from app.repositories import IncidentsRepository
+from app.repositories.incidents import BLACKLIST_LIST_FIELDS, INCIDENT_LIST_FIELDS
+
+FILTERS = {
+    "branch_ids": [1, 2, 3],
+    "incident_filter": [
+        Incidents.IncidentCategory.BLACKLISTED,
+        Incidents.IncidentCategory.LIKELY_THEFT,
+    ],
+    "from_date": date(2024, 1, 1),
+    "to_date": date(2024, 1, 31),
+    "is_test_user": False,
+    "join_": {"blacklists"},
+}
+
+
+def filter_incidents(
+    query, branch_ids, incident_filter, from_date, to_date, is_test_user
+):
+    query = query.filter(Incidents.branch_id.in_(branch_ids))
+
+    if not is_test_user:
+        query = query.filter(Incidents.is_test.is_(False))
+
+    query = query.filter(Incidents.category.in_(incident_filter))
+
+    from_date = datetime.strptime(from_date.isoformat(), "%Y-%m-%d")
+    to_date = datetime.strptime(to_date.isoformat(), "%Y-%m-%d")
+    to_date = to_date.replace(hour=23, minute=59, second=59)
+    return query.filter(
+        Incidents.incident_time >= from_date, Incidents.incident_time <= to_date
+    )
+
+
+def join_blacklists(query):
+    return query.join(
+        Incidents_Blacklist,
+        Incidents.id == Incidents_Blacklist.incident_id,
+        isouter=True,
+    )
+
+
+def build_incidents_query(cursor, limit, join_, **filters):
+    """The select() get_incidents built before it was cached."""
+    query = select(
+        Bundle("incident", *INCIDENT_LIST_FIELDS, Incidents.response),
+        Bundle("blacklist", *BLACKLIST_LIST_FIELDS),
+    )
+    query = filter_incidents(join_blacklists(query), **filters)
+    query = query.filter(
+        Incidents.incident_time <= cursor[0],
+        tuple_(Incidents.incident_time, Incidents.id) < tuple_(*cursor),
+    )
+    query = query.limit(limit)
+    return query.order_by(Incidents.incident_time.desc(), Incidents.id.desc())
+
+
+def build_count_query(join_, **filters):
+    """The select() get_incidents_count built before it was cached."""
+    query = filter_incidents(join_blacklists(select(Incidents)), **filters)
+    return select(func.count()).select_from(query.subquery())
+
+
+class CapturingSession:
+    """Keeps the statement instead of executing it."""
+
+    class Result:
+        def fetchall(self):
+            return []
+
+        def scalar_one(self):
+            return 0
+
+    def __init__(self):
+        self.statement = None
+
+    async def execute(self, statement):
+        self.statement = statement
+        return self.Result()
+
+
+def compile_statement(statement, dialect, compiled_cache) -> None:
+    statement._compile_w_cache(
+        dialect=dialect,
+        compiled_cache=compiled_cache,
+        column_keys=[],
+        for_executemany=False,
+        schema_translate_map=None,
+    )
+
+
+async def time_calls(build_statement, calls: int) -> float:
+    dialect = PGDialect_asyncpg()
+    compiled_cache = {}
+
+    started_at = time.perf_counter()
+    for call in range(calls):
+        statement = await build_statement(call)
+        compile_statement(statement, dialect, compiled_cache)
+
+    return (time.perf_counter() - started_at) / calls
+
+
+async def run(calls: int) -> None:
+    session = CapturingSession()
+    repository = IncidentsRepository(model=Incidents, db_session=session)
+
+    def get_cursor(call: int) -> tuple[datetime, int]:
+        # a different page on every call, as clients paging through would ask
+        return datetime(2024, 1, 31) - timedelta(minutes=call), 1000000 - call
+
+    async def plain_incidents(call):
+        return build_incidents_query(cursor=get_cursor(call), limit=20, **FILTERS)
+
+    async def cached_incidents(call):
+        await repository.get_incidents(
+            skip=0, limit=20, sort="desc", cursor=get_cursor(call), **FILTERS
+        )
+        return session.statement
+
+    async def plain_count(call):
+        return build_count_query(**FILTERS)
+
+    async def cached_count(call):
+        await repository.get_incidents_count(**FILTERS)
+        return session.statement
+
+    for label, plain, cached in (
+        ("get_incidents", plain_incidents, cached_incidents),
+        ("get_incidents_count", plain_count, cached_count),
+    ):
+        before = await time_calls(plain, calls)
+        after = await time_calls(cached, calls)
+        print(
+            f"{label}: select() {before * 1000000:.0f} us/call, "
+            f"lambda_stmt {after * 1000000:.0f} us/call"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    asyncio.run(run(calls=args.calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compares the per-incident and the batched suspicious incidents lookups.
+
+    python -m benchmarks.suspicious_incidents --customers 20000 --per-customer 25
+
+Seeds a throwaway "benchmark" schema of the configured database with a copy
+of the incidents table, then times the lookups for a page of incidents,
+without and with the (customer_id, incident_time) index. The per-incident
+lookup is the statement the listings ran for each incident before
+get_related_incidents, ordered like it so both return the same incidents.
+The schema is dropped afterwards.
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models import Incidents
+from app.repositories import IncidentsRepository
+from core.config import config
+
+SCHEMA = "benchmark"
+
+PER_INCIDENT_QUERY = text(
+    """
+    SELECT * FROM incidents
+    WHERE customer_id = :customer_id AND id != :id
+    ORDER BY incident_time DESC
+    LIMIT 5
+    """
+)
+
+
+async def seed(engine, customers: int, per_customer: int) -> None:
+    async with engine.begin() as connection:
+        await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await connection.execute(
+            text(
+                f"CREATE TABLE {SCHEMA}.incidents "
+                f"(LIKE public.incidents INCLUDING DEFAULTS INCLUDING GENERATED)"
+            )
+        )
+        await connection.execute(
+            text(
+                f"""
+                INSERT INTO {SCHEMA}.incidents (
+                    id, company_id, branch_id, name, incident_time,
+                    photo_url, video_url, customer_id, status
+                )
+                SELECT
+                    n,
+                    1,
+                    n % 50,
+                    'benchmark',
+                    now() - n * interval '1 minute',
+                    'photo_url',
+                    'video_url',
+                    n % :customers,
+                    0
+                FROM generate_series(1, :rows) AS n
+                """
+            ),
+            {"customers": customers, "rows": customers * per_customer},
+        )
+        await connection.execute(
+            text(f"ALTER TABLE {SCHEMA}.incidents ADD PRIMARY KEY (id)")
+        )
+        await connection.execute(text(f"ANALYZE {SCHEMA}.incidents"))
+
+
+async def add_customer_index(engine) -> None:
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                f"CREATE INDEX ON {SCHEMA}.incidents "
+                f"(customer_id, incident_time DESC)"
+            )
+        )
+        await connection.execute(text(f"ANALYZE {SCHEMA}.incidents"))
+
+
+async def time_lookups(engine, page_size: int, rounds: int) -> tuple[float, float]:
+    async with AsyncSession(engine) as session:
+        repository = IncidentsRepository(model=Incidents, db_session=session)
+
+        result = await session.execute(
+            text(f"SELECT id FROM {SCHEMA}.incidents ORDER BY id LIMIT :limit"),
+            {"limit": page_size},
+        )
+        page = [await session.get(Incidents, id) for id in result.scalars()]
+
+        started_at = time.perf_counter()
+        for _ in range(rounds):
+            for incident in page:
+                (
+                    await session.scalars(
+                        select(Incidents).from_statement(PER_INCIDENT_QUERY),
+                        {"customer_id": incident.customer_id, "id": incident.id},
+                    )
+                ).all()
+        per_incident = (time.perf_counter() - started_at) / rounds
+
+        started_at = time.perf_counter()
+        for _ in range(rounds):
+            await repository.get_related_incidents(incidents=page)
+        batched = (time.perf_counter() - started_at) / rounds
+
+    return per_incident, batched
+
+
+async def run(customers: int, per_customer: int, page_size: int, rounds: int):
+    engine = create_async_engine(
+        config.POSTGRES_URL.unicode_string(),
+        # the seeded incidents shadow public.incidents, the rest resolves to public
+        connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}},
+    )
+
+    try:
+        await seed(engine, customers=customers, per_customer=per_customer)
+        print(f"seeded {customers * per_customer} incidents")
+
+        for label in ("without index", "with index"):
+            if label == "with index":
+                await add_customer_index(engine)
+
+            per_incident, batched = await time_lookups(
+                engine, page_size=page_size, rounds=rounds
+            )
+            print(
+                f"{label}: per incident {per_incident * 1000:.1f} ms/page, "
+                f"batched {batched * 1000:.1f} ms/page"
+            )
+
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--per-customer", type=int, default=25)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(
+        run(
+            customers=args.customers,
+            per_customer=args.per_customer,
+            page_size=args.page_size,
+            rounds=args.rounds,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
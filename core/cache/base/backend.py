@@ -11,6 +11,34 @@ class BaseBackend(ABC):
     async def set(self, response: Any, key: str, ttl: int = 60) -> None:
         ...
 
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> list[Any]:
+        ...
+
+    @abstractmethod
+    async def get_bytes(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set_bytes(self, value: bytes, key: str, ttl: int = 60) -> None:
+        ...
+
+    @abstractmethod
+    async def increment(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    async def add_to_set(self, key: str, members: list[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def is_in_set(self, key: str, member: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def remove_from_set(self, key: str, members: list[str]) -> None:
+        ...
+
     @abstractmethod
     async def delete_startswith(self, value: str) -> None:
         ...
@@ -222,6 +222,185 @@ class CacheManager:
 
         return user_profile
 
+    async def get_incidents_page(
+        self,
+        branch_ids: list[int],
+        incident_filter: list[int] | None,
+        is_test_user: bool,
+        limit: int,
+    ) -> tuple[dict | None, str]:
+        """
+        Get the cached first incidents page of the branches
+        :return: the page, or None, and the key to cache it with. The key holds
+            the current version of each branch, so a page cached under it is
+            never read once one of the branches changed.
+        """
+        branch_ids = sorted(set(branch_ids))
+        versions = await self.backend.get_many(
+            keys=[f"incidents_page_version::{branch_id}" for branch_id in branch_ids]
+        )
+
+        branches = ",".join(
+            f"{branch_id}.{version or 0}"
+            for branch_id, version in zip(branch_ids, versions)
+        )
+        categories = ",".join(
+            str(category) for category in sorted(incident_filter or [])
+        )
+        key = f"incidents_page::{branches}::{categories}::{int(is_test_user)}::{limit}"
+
+        return await self.backend.get(key=key), key
+
+    async def cache_incidents_page(self, key: str, page: dict, ttl: int) -> None:
+        """
+        Caching the first incidents page of the branches
+        """
+        await self.backend.set(response=page, key=key, ttl=ttl)
+
+    async def expire_incidents_pages(self, branch_ids: set[int]) -> None:
+        """
+        Bump the version of the branches, for their cached pages to be rebuilt
+        """
+        for branch_id in sorted(branch_ids):
+            await self.backend.increment(key=f"incidents_page_version::{branch_id}")
+
+    async def get_watchlist_version(self, branch_id: int) -> int:
+        """
+        Get the version of the branch watchlist, bumped on every committed change
+        """
+        return await self.backend.get(key=f"watchlist_version::{branch_id}") or 0
+
+    async def get_watchlist_changes(
+        self, branch_id: int, from_version: int, to_version: int
+    ) -> list[list[int] | None]:
+        """
+        Get the customers changed by each version of the branch watchlist after
+        from_version, up to to_version. Expired versions are None.
+        """
+        return await self.backend.get_many(
+            keys=[
+                f"watchlist_changes::{branch_id}::{version}"
+                for version in range(from_version + 1, to_version + 1)
+            ]
+        )
+
+    async def expire_watchlist_customers(
+        self, branch_customer_ids: dict[int, set[int]], ttl: int
+    ) -> None:
+        """
+        Bump the version of the branch watchlists and record the customers the
+        version changed, for the loaded watchlists to only reload them
+        """
+        for branch_id, customer_ids in sorted(branch_customer_ids.items()):
+            version = await self.backend.increment(
+                key=f"watchlist_version::{branch_id}"
+            )
+            await self.backend.set(
+                response=sorted(customer_ids),
+                key=f"watchlist_changes::{branch_id}::{version}",
+                ttl=ttl,
+            )
+
+    async def get_watchlist_snapshot(
+        self, branch_id: int, version: int, dtype: str
+    ) -> bytes | None:
+        """
+        Get the compressed watchlist snapshot of the branch at a version
+        """
+        return await self.backend.get_bytes(
+            key=f"watchlist_snapshot::{branch_id}::{version}::{dtype}"
+        )
+
+    async def cache_watchlist_snapshot(
+        self, branch_id: int, version: int, dtype: str, snapshot: bytes, ttl: int
+    ) -> None:
+        """
+        Caching the compressed watchlist snapshot of the branch at a version
+        """
+        await self.backend.set_bytes(
+            value=snapshot,
+            key=f"watchlist_snapshot::{branch_id}::{version}::{dtype}",
+            ttl=ttl,
+        )
+
+    async def get_watchlist_entry_version(self, customer_id: int) -> int:
+        """
+        Get the version of the watchlist entries of the customer, bumped when
+        the customer or one of its incidents changes
+        """
+        return (
+            await self.backend.get(key=f"watchlist_entry_version::{customer_id}")
+            or 0
+        )
+
+    async def get_watchlist_entry(self, kind: str, blacklist_id: int) -> dict | None:
+        """
+        Get a cached watchlist entry, None once its customer changed
+        :param kind: incidents or customers, the table of the blacklist entry.
+        """
+        entry = await self.backend.get(
+            key=f"watchlist_entry::{kind}::{blacklist_id}"
+        )
+        if entry is None:
+            return None
+
+        version = await self.get_watchlist_entry_version(entry["customer_id"])
+        return entry if entry["version"] == version else None
+
+    async def cache_watchlist_entry(
+        self, kind: str, blacklist_id: int, entry: dict, ttl: int
+    ) -> None:
+        """
+        Caching a watchlist entry, with the customer_id and the version of the
+        customer it was built at
+        """
+        await self.backend.set(
+            response=entry, key=f"watchlist_entry::{kind}::{blacklist_id}", ttl=ttl
+        )
+
+    async def expire_watchlist_entries(self, customer_ids: set[int]) -> None:
+        """
+        Bump the version of the customers, for their watchlist entries to be
+        rebuilt
+        """
+        for customer_id in sorted(customer_ids):
+            await self.backend.increment(
+                key=f"watchlist_entry_version::{customer_id}"
+            )
+
+    async def is_watchlist_document_published(
+        self, company_id: str, branch_id: str, document: str
+    ) -> bool:
+        """
+        Whether the watchlist document is in the Firestore collection of the
+        branch
+        """
+        return await self.backend.is_in_set(
+            key=f"watchlist_published::{company_id}::{branch_id}", member=document
+        )
+
+    async def add_published_watchlist_documents(
+        self, company_id: str, branch_id: str, documents: list[str]
+    ) -> None:
+        """
+        Record watchlist documents written to the Firestore collection of the
+        branch
+        """
+        await self.backend.add_to_set(
+            key=f"watchlist_published::{company_id}::{branch_id}", members=documents
+        )
+
+    async def remove_published_watchlist_documents(
+        self, company_id: str, branch_id: str, documents: list[str]
+    ) -> None:
+        """
+        Forget watchlist documents deleted from the Firestore collection of the
+        branch
+        """
+        await self.backend.remove_from_set(
+            key=f"watchlist_published::{company_id}::{branch_id}", members=documents
+        )
+
     async def remove_by_tag(self, tag: CacheTag) -> None:
         await self.backend.delete_startswith(value=tag.value)
 
@@ -33,6 +33,30 @@ class RedisBackend(BaseBackend):
 
         await redis.set(name=key, value=response, ex=ttl)
 
+    async def get_many(self, keys: list[str]) -> list[Any]:
+        return [
+            None if result is None else ujson.loads(result.decode("utf8"))
+            for result in await redis.mget(keys)
+        ]
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        return await redis.get(key)
+
+    async def set_bytes(self, value: bytes, key: str, ttl: int = 60) -> None:
+        await redis.set(name=key, value=value, ex=ttl)
+
+    async def increment(self, key: str) -> int:
+        return await redis.incr(key)
+
+    async def add_to_set(self, key: str, members: list[str]) -> None:
+        await redis.sadd(key, *members)
+
+    async def is_in_set(self, key: str, member: str) -> bool:
+        return bool(await redis.sismember(key, member))
+
+    async def remove_from_set(self, key: str, members: list[str]) -> None:
+        await redis.srem(key, *members)
+
     async def delete_startswith(self, value: str) -> None:
         async for key in redis.scan_iter(f"{value}::*"):
             await redis.delete(key)
@@ -110,6 +110,7 @@ class Config(BaseConfig):
     FIREBASE_CAMERA_COLLECTION: str = "camera_incidents"
     FIREBASE_BLACKLIST_INCIDENTS_COLLECTION: str = "blacklisted_incidents"
     FIREBASE_CUSTOMER_DATA_COLLECTION: str = "customer_data"
+    FIRESTORE_WRITE_BATCH_DELAY_MS: int = 10
     SUPER_USER_ROLE_ID: int = 1
     ANALYST_ROLE_ID: int = 2
     COMPANY_ADMIN_ROLE_ID: int = 3
@@ -127,6 +128,32 @@ class Config(BaseConfig):
     TELEGRAM_SENSITIVE_ALERT_ENABLED: int = 0
     PROFILING_ENABLED: int = 0
     QUEUEING_ENABLED: int = 0
+    INCIDENT_COUNTS_ROLLUP_ENABLED: int = 1
+    CUSTOMERS_BATCH_SIZE: int = 500
+    INCIDENTS_BATCH_MAX_SIZE: int = 100
+    EXPORT_CHUNK_SIZE: int = 5000
+    INCIDENTS_PAGE_CACHE_ENABLED: int = 1
+    INCIDENTS_PAGE_CACHE_TTL: int = 300
+    INCIDENT_VIEWS_ENABLED: int = 1
+    BLACKLIST_SENT_LOGS_RETENTION_DAYS: int = 90
+    ERROR_LOGS_RETENTION_DAYS: int = 30
+    REVIEW_LOGS_RETENTION_DAYS: int = 180
+    TEST_DATA_RETENTION_DAYS: int = 30
+    WATCHLIST_MATCHER_ENABLED: int = 1
+    WATCHLIST_MATCH_BATCH_MAX_SIZE: int = 64
+    WATCHLIST_MATCH_MAX_K: int = 50
+    WATCHLIST_CHANGES_TTL: int = 86400
+    WATCHLIST_SNAPSHOT_TTL: int = 86400
+    WATCHLIST_ENTRY_CACHE_ENABLED: int = 1
+    WATCHLIST_ENTRY_TTL: int = 86400
+    CUSTOMER_INDEX_ENABLED: int = 1
+    CUSTOMER_INDEX_DIR: str = "customer_index"
+    CUSTOMER_INDEX_NPROBE: int = 32
+    CUSTOMER_INDEX_RERANK_FACTOR: int = 10
+    CUSTOMER_INDEX_SUBQUANTIZERS: int = 16
+    CUSTOMER_INDEX_TRAINING_SIZE: int = 100000
+    CUSTOMER_SEARCH_BATCH_MAX_SIZE: int = 64
+    CUSTOMER_SEARCH_MAX_K: int = 50
     FIREBASE_LISTENER_ENABLED: int = 0
     NOTIFICATION_GROUP_TYPE_BLACKLISTED_PERSON: str = "Watchlist alert"
     NOTIFICATION_GROUP_TYPE_LIKELY_THEFT: str = "Likely theft alerts"
@@ -1,8 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from enum import Enum
 from functools import wraps
 
 from core.database import session
 
+# the task that opened the unit_of_work scopes of the context and their depth.
+# A task created inside a scope copies it, but is not part of the scope and
+# starts a unit of work of its own.
+unit_of_work_scope: ContextVar[tuple[asyncio.Task | None, int]] = ContextVar(
+    "unit_of_work_scope", default=(None, 0)
+)
+
+
+def get_unit_of_work_depth() -> int:
+    task, depth = unit_of_work_scope.get()
+    return depth if task is asyncio.current_task() else 0
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """
+    Groups the writes made inside it, across controllers, into one transaction.
+    The outermost scope commits once or rolls back. Nested scopes and
+    @Transactional methods called inside run in a savepoint and only flush, so
+    ids are available; on error they roll back to it before raising, so an
+    outer scope that catches the error can go on with the session.
+    """
+    depth = get_unit_of_work_depth()
+    token = unit_of_work_scope.set((asyncio.current_task(), depth + 1))
+
+    try:
+        if depth == 0:
+            try:
+                yield session
+                await session.commit()
+
+            except Exception as exception:
+                await session.rollback()
+                raise exception
+
+        else:
+            async with session.begin_nested():
+                yield session
+                await session.flush()
+
+    finally:
+        unit_of_work_scope.reset(token)
+
 
 class Propagation(Enum):
     REQUIRED = "required"
@@ -16,36 +62,31 @@ class Transactional:
     def __call__(self, function):
         @wraps(function)
         async def decorator(*args, **kwargs):
-            try:
-                if self.propagation == Propagation.REQUIRED:
-                    result = await self._run_required(
-                        function=function,
-                        args=args,
-                        kwargs=kwargs,
-                    )
-                elif self.propagation == Propagation.REQUIRED_NEW:
+            if self.propagation == Propagation.REQUIRED_NEW:
+                try:
                     result = await self._run_required_new(
                         function=function,
                         args=args,
                         kwargs=kwargs,
                     )
-                else:
-                    result = await self._run_required(
-                        function=function,
-                        args=args,
-                        kwargs=kwargs,
-                    )
-            except Exception as exception:
-                await session.rollback()
-                raise exception
+                except Exception as exception:
+                    await session.rollback()
+                    raise exception
+
+            else:
+                result = await self._run_required(
+                    function=function,
+                    args=args,
+                    kwargs=kwargs,
+                )
 
             return result
 
         return decorator
 
     async def _run_required(self, function, args, kwargs) -> None:
-        result = await function(*args, **kwargs)
-        await session.commit()
+        async with unit_of_work():
+            result = await function(*args, **kwargs)
         return result
 
     async def _run_required_new(self, function, args, kwargs) -> None:
@@ -17,6 +17,7 @@ from app.controllers import (
 )
 from app.models import (
     BlacklistSentLogs,
+    BranchIncidentDailyCounts,
     Customers,
     Customers_Audit,
     Customers_Blacklist,
@@ -26,6 +27,7 @@ from app.models import (
     Incidents_Analyst_Audit,
     Incidents_Audit,
     Incidents_Blacklist,
+    IncidentViews,
 )
 from app.repositories import (
     BlacklistSentLogsRepository,
@@ -34,10 +36,12 @@ from app.repositories import (
     CustomersAuditRepository,
     ErrorLogsRepository,
     EvidenceDataRepository,
+    IncidentDailyCountsRepository,
     Incidents_Blacklist_Repository,
     IncidentsAnalystAuditRepository,
     IncidentsAuditRepository,
     IncidentsRepository,
+    IncidentViewsRepository,
 )
 from core.database import get_session
 from core.utils.firebase import CloudDBHandler, get_cloudDB_client
@@ -66,6 +70,10 @@ class Factory:
     )
     error_logs_repository = partial(ErrorLogsRepository, ErrorLogs)
     evidence_data_repository = partial(EvidenceDataRepository, Evidence)
+    daily_counts_repository = partial(
+        IncidentDailyCountsRepository, BranchIncidentDailyCounts
+    )
+    incident_views_repository = partial(IncidentViewsRepository, IncidentViews)
 
     def get_cloudDB_controller(self, client=Depends(get_cloudDB_client)):
         return CloudDBController(cloudDB_handler=self.cloudDB_handler(client))
@@ -80,6 +88,12 @@ class Factory:
     def get_incidents_controller(self, db_session=Depends(get_session)):
         return IncidentsController(
             incidents_repository=self.incidents_repository(db_session=db_session),
+            daily_counts_repository=self.daily_counts_repository(
+                db_session=db_session
+            ),
+            incident_views_repository=self.incident_views_repository(
+                db_session=db_session
+            ),
         )
 
     def get_audit_controller(self, db_session=Depends(get_session)):
@@ -95,6 +109,9 @@ class Factory:
     def get_blacklist_controller(self, db_session=Depends(get_session)):
         return Incidents_Blacklist_Controller(
             blacklist_repository=self.blacklist_repository(db_session=db_session),
+            daily_counts_repository=self.daily_counts_repository(
+                db_session=db_session
+            ),
         )
 
     def get_customer_data_controller(self, db_session=Depends(get_session)):
@@ -30,6 +30,19 @@ class BaseRepository(Generic[ModelType]):
         self.session.add(model)
         return model
 
+    async def create_all(self, attributes: list[dict[str, Any]]) -> list[ModelType]:
+        """
+        Creates the model instances, they are inserted together on flush.
+
+        :param attributes: The attributes of each model instance.
+        :return: The created model instances.
+        """
+        models = [
+            self.model_class(**model_attributes) for model_attributes in attributes
+        ]
+        self.session.add_all(models)
+        return models
+
     async def get_all(
         self, skip: int = 0, limit: int = 100, join_: set[str] | None = None
     ) -> list[ModelType]:
@@ -0,0 +1,86 @@
+import json
+import struct
+from typing import Iterable
+
+import numpy as np
+
+# face descriptors are stored as little endian float32, 512 bytes for the 128
+# values of a descriptor
+FLOAT32_SIZE = 4
+DESCRIPTOR_LENGTH = 128
+
+
+def encode_descriptor(descriptor: str | list[float] | bytes | None) -> bytes | None:
+    """
+    Packs a descriptor, given as the JSON text of its values or as a list of
+    them, into float32 bytes. Bytes are returned as they are.
+    :raises ValueError: if it is not DESCRIPTOR_LENGTH numbers.
+    """
+    if descriptor is None:
+        return None
+
+    if isinstance(descriptor, bytes):
+        if len(descriptor) != DESCRIPTOR_LENGTH * FLOAT32_SIZE:
+            raise ValueError(f"Descriptor of {len(descriptor)} bytes")
+
+        return descriptor
+
+    if isinstance(descriptor, str):
+        if not descriptor.strip():
+            return None
+
+        try:
+            descriptor = json.loads(descriptor)
+
+        except ValueError as e:
+            raise ValueError(f"Descriptor is not JSON: {str(e)}")
+
+    if not isinstance(descriptor, list) or len(descriptor) != DESCRIPTOR_LENGTH:
+        raise ValueError(f"Descriptor is not a list of {DESCRIPTOR_LENGTH} values")
+
+    try:
+        return struct.pack(f"<{DESCRIPTOR_LENGTH}f", *descriptor)
+
+    except struct.error as e:
+        raise ValueError(f"Descriptor values are not numbers: {str(e)}")
+
+
+def decode_descriptor(data: bytes | None) -> list[float] | None:
+    """
+    Unpacks float32 descriptor bytes into their values.
+    """
+    if data is None:
+        return None
+
+    return list(struct.unpack(f"<{len(data) // FLOAT32_SIZE}f", data))
+
+
+def descriptor_to_text(data: bytes | None) -> str | None:
+    """
+    Serializes float32 descriptor bytes as the JSON text descriptors were
+    stored as, for the clients that still parse it. 9 significant digits
+    round-trip a float32 exactly.
+    """
+    values = decode_descriptor(data)
+
+    if values is None:
+        return None
+
+    return "[" + ", ".join(f"{value:.9g}" for value in values) + "]"
+
+
+def descriptors_to_array(descriptors: Iterable[bytes | None]) -> np.ndarray:
+    """
+    Stacks float32 descriptor bytes into a (n, DESCRIPTOR_LENGTH) matrix,
+    leaving out the missing ones and the ones of another length.
+    """
+    vectors = [
+        np.frombuffer(descriptor, dtype="<f4")
+        for descriptor in descriptors
+        if descriptor and len(descriptor) == DESCRIPTOR_LENGTH * FLOAT32_SIZE
+    ]
+
+    if not vectors:
+        return np.empty((0, DESCRIPTOR_LENGTH), dtype=np.float32)
+
+    return np.stack(vectors).astype(np.float32)
@@ -0,0 +1,161 @@
+import csv
+import io
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy.types import Boolean, DateTime, Float, Integer, TypeEngine
+
+from core.exceptions import BadRequestException
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+ExportColumns = list[tuple[str, TypeEngine]]
+
+# pyarrow is an optional dependency, only the Parquet export needs it
+PYARROW_MISSING = (
+    "Parquet export needs the optional pyarrow package, "
+    "install it with pip install pyarrow"
+)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+
+    except ImportError:
+        raise BadRequestException(PYARROW_MISSING)
+
+    return pyarrow
+
+
+def check_export_format(export_format: str) -> None:
+    """
+    Raises BadRequestException if rows cannot be exported in export_format here.
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise BadRequestException(f"Unknown export format {export_format}")
+
+    if export_format == "parquet":
+        _import_pyarrow()
+
+
+async def stream_csv(
+    chunks: AsyncIterator[Sequence[tuple]], columns: ExportColumns
+) -> AsyncIterator[bytes]:
+    """
+    Encodes each chunk of rows as CSV, after a header line of the column names.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([name for name, _ in columns])
+
+    async for rows in chunks:
+        if not rows:
+            continue
+
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf8")
+
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf8")
+
+
+class _ParquetSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written so far. Parquet keeps the
+    file offsets of its row groups, so tell() counts every byte ever written.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _get_arrow_type(sql_type: TypeEngine):
+    pyarrow = _import_pyarrow()
+
+    if isinstance(sql_type, Boolean):
+        return pyarrow.bool_()
+
+    if isinstance(sql_type, Integer):
+        return pyarrow.int64()
+
+    if isinstance(sql_type, Float):
+        return pyarrow.float64()
+
+    if isinstance(sql_type, DateTime):
+        return pyarrow.timestamp("us", tz="UTC" if sql_type.timezone else None)
+
+    return pyarrow.string()
+
+
+async def stream_parquet(
+    chunks: AsyncIterator[Sequence[tuple]], columns: ExportColumns
+) -> AsyncIterator[bytes]:
+    """
+    Encodes each chunk of rows as a Parquet row group, the file footer is
+    yielded last.
+    """
+    pyarrow = _import_pyarrow()
+
+    schema = pyarrow.schema(
+        [(name, _get_arrow_type(sql_type)) for name, sql_type in columns]
+    )
+    sink = _ParquetSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+
+    try:
+        async for rows in chunks:
+            arrays = [
+                pyarrow.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            if not arrays:
+                continue
+
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            yield sink.pop()
+
+    finally:
+        writer.close()
+
+    yield sink.pop()
+
+
+def stream_export(
+    export_format: str,
+    chunks: AsyncIterator[Sequence[tuple]],
+    columns: ExportColumns,
+) -> AsyncIterator[bytes]:
+    """
+    Encodes chunks of rows into the bytes of an export_format file, one chunk
+    at a time, so only a chunk of rows is held in memory.
+    """
+    if export_format == "parquet":
+        return stream_parquet(chunks, columns)
+
+    return stream_csv(chunks, columns)
@@ -1,15 +1,22 @@
 import asyncio
 import json
+from typing import AsyncIterator
 
 import firebase_admin
-from firebase_admin import credentials, firestore, messaging
-from google.cloud.firestore import Client
+from firebase_admin import credentials, firestore, firestore_async, messaging
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import AsyncClient, Client
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
 from google.cloud.firestore_v1.document import DocumentReference
+from google.cloud.firestore_v1.field_path import FieldPath
 from google.cloud.firestore_v1.watch import Watch
 
 from app.library.entity_service import entity
+from core.config import config
 from core.library import logger
 
+from .write_batcher import WriteBatcher
+
 
 class FireBaseHandler:
     _instance = None
@@ -132,16 +139,28 @@ class FireBaseHandler:
 
 
 class FireStoreHandler:
+    """
+    Listens and reads single documents through the synchronous client.
+    Collections are streamed page by page, and writes are coalesced into
+    batched commits by a WriteBatcher, through an AsyncClient.
+    """
+
     _instance = None
 
+    # the most writes Firestore accepts in a single batch
+    WRITE_BATCH_SIZE = 500
+    STREAM_PAGE_SIZE = 500
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(FireStoreHandler, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, async_client: AsyncClient | None = None):
         if not hasattr(self, "_initialized"):
             self.firestore_db = client
+            self.async_client = async_client
+            self.write_batcher: WriteBatcher | None = None
             self._initialized = True
 
     def on_snapshot(self, col_snapshot, changes, read_time):
@@ -173,6 +192,61 @@ class FireStoreHandler:
 
         return documents
 
+    async def stream_collection(
+        self,
+        collection: str,
+        page_size: int = STREAM_PAGE_SIZE,
+        fields: list[str] | None = None,
+    ) -> AsyncIterator[dict[str, dict]]:
+        """
+        Streams the documents of the collection in document id order, one page
+        of page_size documents at a time, each page read with its own query.
+        :param fields: the only fields to read, when given.
+        :return: pages of document contents by document id.
+        """
+        query = self.get_async_client().collection(collection)
+        query = query.order_by(FieldPath.document_id()).limit(page_size)
+
+        if fields is not None:
+            query = query.select(fields)
+
+        page_query = query
+        while True:
+            documents = [document async for document in page_query.stream()]
+            if not documents:
+                return
+
+            yield {document.id: document.to_dict() for document in documents}
+
+            if len(documents) < page_size:
+                return
+
+            page_query = query.start_after(documents[-1])
+
+    async def stream_document_subcollections(
+        self,
+        collection: str,
+        document: str,
+        page_size: int = STREAM_PAGE_SIZE,
+        fields: list[str] | None = None,
+    ) -> AsyncIterator[tuple[str, dict[str, dict]]]:
+        """
+        Streams the subcollections of a document one after another, see
+        stream_collection.
+        :return: the subcollection id and a page of its documents.
+        """
+        document_reference = (
+            self.get_async_client().collection(collection).document(document)
+        )
+
+        async for subcollection in document_reference.collections():
+            async for page in self.stream_collection(
+                f"{collection}/{document}/{subcollection.id}",
+                page_size=page_size,
+                fields=fields,
+            ):
+                yield subcollection.id, page
+
     def get_document_reference(
         self, collection: str, document: str
     ) -> DocumentReference:
@@ -206,30 +280,109 @@ class FireStoreHandler:
     def create_document(self, collection: str, data: dict):
         return self.firestore_db.collection(collection).add(data)
 
-    def write_to_document(self, collection: str, document: str, data: dict):
-        document_reference = self.get_document_reference(collection, document)
-        document_reference.set(data)
+    def get_async_client(self) -> AsyncClient:
+        """
+        The AsyncClient given to the handler, or the one of the default Firebase
+        app.
+        """
+        return self.async_client or firestore_async.client()
+
+    def get_write_batcher(self) -> WriteBatcher:
+        """
+        The write batcher of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.write_batcher is None or self.write_batcher.loop is not loop:
+            self.write_batcher = WriteBatcher(
+                client=self.get_async_client(),
+                max_size=self.WRITE_BATCH_SIZE,
+                delay=config.FIRESTORE_WRITE_BATCH_DELAY_MS / 1000,
+            )
 
-    def update_document(self, collection: str, document: str, data: dict):
-        document_reference = self.get_document_reference(collection, document)
-        document_reference.update(data)
+        return self.write_batcher
+
+    async def batch_write(
+        self, operation: str, collection: str, document: str, *args
+    ) -> None:
+        """
+        Writes a document with the next batched commit.
+        :param operation: set, create, update or delete.
+        """
+        write_batcher = self.get_write_batcher()
+        document_reference = write_batcher.client.collection(collection).document(
+            document
+        )
 
-    def delete_document(self, collection: str, document: str):
-        document_reference = self.get_document_reference(collection, document)
-        document_reference.delete()
+        await write_batcher.write(operation, document_reference, *args)
 
-    def delete_collection(self, collection: str, batch_size: int):
-        if batch_size == 0:
-            return
+    async def create_document_if_absent(
+        self, collection: str, document: str, data: dict
+    ) -> bool:
+        """
+        Writes the document unless it exists, without reading it first.
+        :return: whether the document was created.
+        """
+        try:
+            await self.batch_write("create", collection, document, data)
 
-        collection_reference = self.firestore_db.collection(collection)
+        except AlreadyExists:
+            return False
 
-        docs = collection_reference.list_documents(page_size=batch_size)
+        return True
+
+    async def write_to_document(self, collection: str, document: str, data: dict):
+        await self.batch_write("set", collection, document, data)
+
+    async def update_document(self, collection: str, document: str, data: dict):
+        await self.batch_write("update", collection, document, data)
+
+    async def update_documents(self, collection: str, documents: dict[str, dict]):
+        """
+        Updates the documents of collection, keyed by document id. They are
+        committed together, WRITE_BATCH_SIZE documents per batch.
+        """
+        await asyncio.gather(
+            *(
+                self.update_document(collection, document, data)
+                for document, data in documents.items()
+            )
+        )
+
+    async def delete_document(self, collection: str, document: str):
+        await self.batch_write("delete", collection, document)
+
+    def delete_collection(
+        self,
+        collection: str,
+        batch_size: int = WRITE_BATCH_SIZE,
+        max_ops_per_second: int = 500,
+    ) -> int:
+        """
+        Deletes the documents of the collection, listed batch_size at a time and
+        deleted in parallel by a BulkWriter, at most max_ops_per_second. Blocks
+        until they are deleted, async callers run it with asyncio.to_thread.
+        :return: the number of documents deleted.
+        """
+        if batch_size == 0:
+            return 0
+
+        bulk_writer = self.firestore_db.bulk_writer(
+            options=BulkWriterOptions(
+                initial_ops_per_second=max_ops_per_second,
+                max_ops_per_second=max_ops_per_second,
+            )
+        )
         deleted = 0
 
-        for doc in docs:
-            doc.delete()
-            deleted += 1
+        try:
+            for document in self.firestore_db.collection(collection).list_documents(
+                page_size=batch_size
+            ):
+                bulk_writer.delete(document)
+                deleted += 1
+
+        finally:
+            bulk_writer.close()
 
-        if deleted >= batch_size:
-            return self.delete_collection(collection_reference, batch_size)
+        return deleted
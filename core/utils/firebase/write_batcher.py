@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any
+
+from google.cloud.firestore import AsyncClient
+from google.cloud.firestore_v1.async_document import AsyncDocumentReference
+
+
+class WriteBatcher:
+    """
+    Groups the Firestore writes made within delay seconds of each other into
+    batched commits of up to max_size operations. Each caller awaits its own
+    write: a batch that fails, for a single write of it or for the batch, is
+    committed again one write at a time, so only the failed writes raise.
+    """
+
+    def __init__(self, client: AsyncClient, max_size: int, delay: float):
+        self.client = client
+        self.max_size = max_size
+        self.delay = delay
+        self.loop = asyncio.get_running_loop()
+
+        # operation, reference, arguments and future of each write
+        self.pending: list[tuple] = []
+        self.flush_handle: asyncio.TimerHandle | None = None
+        # referenced until done, the event loop only keeps weak references
+        self.commits: set[asyncio.Task] = set()
+
+    async def write(
+        self, operation: str, reference: AsyncDocumentReference, *args: Any
+    ) -> None:
+        """
+        :param operation: the WriteBatch method, set, create, update or delete.
+        :param args: the arguments of the method after the document reference.
+        """
+        future = self.loop.create_future()
+        self.pending.append((operation, reference, args, future))
+
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.delay, self.flush)
+
+        await future
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        writes, self.pending = self.pending, []
+        if not writes:
+            return
+
+        task = self.loop.create_task(self.commit(writes))
+        self.commits.add(task)
+        task.add_done_callback(self.commits.discard)
+
+    async def commit(self, writes: list) -> None:
+        batch = self.client.batch()
+        for operation, reference, args, _ in writes:
+            getattr(batch, operation)(reference, *args)
+
+        try:
+            await batch.commit()
+
+        except Exception as e:
+            if len(writes) == 1:
+                self.set_exception(writes[0][3], e)
+                return
+
+            await asyncio.gather(*(self.commit([write]) for write in writes))
+            return
+
+        for *_, future in writes:
+            if not future.done():
+                future.set_result(None)
+
+    @staticmethod
+    def set_exception(future: asyncio.Future, exception: Exception) -> None:
+        # the caller may have been cancelled meanwhile
+        if not future.done():
+            future.set_exception(exception)
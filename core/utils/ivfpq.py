@@ -0,0 +1,331 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+# sub-centroids of each product quantizer, so a code fits in a byte
+CODEBOOK_SIZE = 256
+INDEX_ARRAYS = ("centroids", "codebooks", "ids", "codes", "offsets")
+APPENDED_FILE = "appended.bin"
+
+
+def squared_distances(
+    x: np.ndarray, y: np.ndarray, y_squared_norms: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Squared euclidean distances between the rows of x and the rows of y.
+    """
+    if y_squared_norms is None:
+        y_squared_norms = np.einsum("ij,ij->i", y, y)
+
+    distances = (
+        np.einsum("ij,ij->i", x, x)[:, None] + y_squared_norms[None, :] - 2 * (x @ y.T)
+    )
+    return np.maximum(distances, 0)
+
+
+def assign(x: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Index of the closest centroid to each row of x, chunk_size rows at a time.
+    """
+    norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    return np.concatenate(
+        [np.empty(0, dtype=np.int64)]
+        + [
+            squared_distances(x[start : start + chunk_size], centroids, norms).argmin(1)
+            for start in range(0, len(x), chunk_size)
+        ]
+    )
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means started from k distinct rows of x. Clusters left empty are
+    restarted from random rows.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        labels = assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+
+        order = np.argsort(labels, kind="stable")
+        filled = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[filled]
+        centroids[filled] = (
+            np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+        )
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Inverted file index with product quantization, for approximate euclidean
+    search over millions of vectors on CPU.
+
+    Each vector goes to the list of its closest coarse centroid, and its residual
+    to that centroid is cut into m subvectors, each stored as the byte of its
+    closest sub-centroid. A search only scans the lists of the nprobe centroids
+    closest to the query, scoring their entries with per-list lookup tables.
+
+    A built index is saved as .npy files loaded memory-mapped, the entries of
+    each list being contiguous. Vectors added afterwards are appended to a file
+    of fixed-size records, which every process reading the index picks up.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        ids: np.ndarray,
+        codes: np.ndarray,
+        offsets: np.ndarray,
+        path: Path | None = None,
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.ids = ids
+        self.codes = codes
+        self.offsets = offsets
+        self.path = path
+
+        self.centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        self.record = np.dtype(
+            [("list", "<i4"), ("id", "<i8"), ("codes", "u1", (self.m,))]
+        )
+        # ids, codes and list offsets of the appended entries, sorted by list
+        self.appended = (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, self.m), dtype=np.uint8),
+            np.zeros(self.nlist + 1, dtype=np.int64),
+        )
+        self.appended_count = 0
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def m(self) -> int:
+        return len(self.codebooks)
+
+    @property
+    def dimension(self) -> int:
+        return self.centroids.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.ids) + self.appended_count
+
+    @classmethod
+    def train(
+        cls, vectors: np.ndarray, nlist: int, m: int, iterations: int = 20
+    ) -> "IVFPQIndex":
+        """
+        Learns the coarse centroids and the sub-centroids from a sample of the
+        vectors. The index is empty, see fill.
+        """
+        dimension = vectors.shape[1]
+
+        if dimension % m:
+            raise ValueError(f"{dimension} dimensions cannot be cut in {m} parts")
+
+        if len(vectors) < max(nlist, CODEBOOK_SIZE):
+            raise ValueError(
+                f"{len(vectors)} vectors are too few to train {nlist} lists"
+            )
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        centroids = kmeans(vectors, nlist, iterations)
+        residuals = vectors - centroids[assign(vectors, centroids)]
+
+        width = dimension // m
+        codebooks = np.stack(
+            [
+                kmeans(
+                    residuals[:, part * width : (part + 1) * width].copy(),
+                    CODEBOOK_SIZE,
+                    iterations,
+                    seed=part + 1,
+                )
+                for part in range(m)
+            ]
+        )
+
+        return cls(
+            centroids=centroids,
+            codebooks=codebooks,
+            ids=np.empty(0, dtype=np.int64),
+            codes=np.empty((0, m), dtype=np.uint8),
+            offsets=np.zeros(nlist + 1, dtype=np.int64),
+        )
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: the list of each vector and its (m,) codes.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        lists = assign(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+
+        width = self.dimension // self.m
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for part in range(self.m):
+            codes[:, part] = assign(
+                residuals[:, part * width : (part + 1) * width], self.codebooks[part]
+            )
+
+        return lists, codes
+
+    def fill(self, ids: np.ndarray, lists: np.ndarray, codes: np.ndarray) -> None:
+        """
+        Sets the entries of the index, grouped by list.
+        """
+        order = np.argsort(lists, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.codes = codes[order]
+        self.offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(lists, minlength=self.nlist)))
+        ).astype(np.int64)
+
+    def save(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+
+        for name in INDEX_ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+
+        self.path = path
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFPQIndex":
+        """
+        Maps a saved index, its entries being read from disk when scanned.
+        """
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r") for name in INDEX_ARRAYS
+        }
+        # small and used by every search
+        arrays["centroids"] = np.array(arrays["centroids"])
+        arrays["codebooks"] = np.array(arrays["codebooks"])
+
+        index = cls(**arrays, path=path)
+        index.refresh()
+        return index
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Appends vectors to the saved index.
+        """
+        lists, codes = self.encode(vectors)
+        self.append_entries(ids, lists, codes)
+
+    def append_entries(
+        self, ids: np.ndarray, lists: np.ndarray, codes: np.ndarray
+    ) -> None:
+        """
+        Appends encoded entries to the saved index, with a single write so
+        concurrent appends do not interleave.
+        """
+        records = np.empty(len(ids), dtype=self.record)
+        records["list"] = lists
+        records["id"] = ids
+        records["codes"] = codes
+
+        descriptor = os.open(
+            self.path / APPENDED_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            os.write(descriptor, records.tobytes())
+        finally:
+            os.close(descriptor)
+
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Reads the entries appended since the last refresh, by any process.
+        """
+        path = self.path / APPENDED_FILE
+        count = path.stat().st_size // self.record.itemsize if path.exists() else 0
+
+        if count == self.appended_count:
+            return
+
+        records = np.fromfile(path, dtype=self.record, count=count)
+        order = np.argsort(records["list"], kind="stable")
+        offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(records["list"], minlength=self.nlist)))
+        )
+
+        # replaced at once, for searches running in other threads
+        self.appended = (records["id"][order], records["codes"][order], offsets)
+        self.appended_count = count
+
+    def search(
+        self, queries: np.ndarray, k: int, nprobe: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the approximate k nearest ids to each query, an id stored for
+        several vectors counting once with its closest.
+        :return: (len(queries), k) ids and squared distances from the closest,
+            padded with -1 and inf.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(
+            squared_distances(queries, self.centroids, self.centroid_norms),
+            nprobe - 1,
+            axis=1,
+        )[:, :nprobe]
+
+        appended_ids, appended_codes, appended_offsets = self.appended
+        width = self.dimension // self.m
+        parts = np.arange(self.m)
+
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+
+        for i, query in enumerate(queries):
+            ids = []
+            distances = []
+
+            for probe in probes[i]:
+                residual = (query - self.centroids[probe]).reshape(self.m, 1, width)
+                # (m, 256) squared distances of each residual part to its codebook
+                table = ((residual - self.codebooks) ** 2).sum(axis=2)
+
+                start, end = self.offsets[probe], self.offsets[probe + 1]
+                appended_start = appended_offsets[probe]
+                appended_end = appended_offsets[probe + 1]
+
+                for list_ids, codes in (
+                    (self.ids[start:end], self.codes[start:end]),
+                    (
+                        appended_ids[appended_start:appended_end],
+                        appended_codes[appended_start:appended_end],
+                    ),
+                ):
+                    if len(list_ids):
+                        ids.append(list_ids)
+                        distances.append(table[parts, codes].sum(axis=1))
+
+            if not ids:
+                continue
+
+            ids = np.concatenate(ids)
+            distances = np.concatenate(distances)
+
+            order = np.argsort(distances, kind="stable")
+            _, first = np.unique(ids[order], return_index=True)
+            closest = order[np.sort(first)][:k]
+
+            result_ids[i, : len(closest)] = ids[closest]
+            result_distances[i, : len(closest)] = distances[closest]
+
+        return result_ids, result_distances
@@ -0,0 +1,37 @@
+import base64
+import json
+from datetime import datetime
+
+from core.exceptions import BadRequestException
+
+
+def encode_cursor(incident_time: datetime, id: int) -> str:
+    """
+    Encodes the (incident_time, id) keyset of a row into an opaque cursor.
+    """
+    payload = json.dumps({"t": incident_time.isoformat(), "id": id})
+    return base64.urlsafe_b64encode(payload.encode("utf8")).decode("utf8")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes a cursor created by encode_cursor back into its keyset.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("utf8")))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+
+    except Exception:
+        raise BadRequestException("Invalid cursor")
+
+
+def get_next_cursor(rows: list, limit: int | None) -> str | None:
+    """
+    Returns the cursor of the page following rows, or None on the last page.
+    Rows need incident_time and id attributes.
+    """
+    if not rows or limit is None or len(rows) < limit:
+        return None
+
+    last_row = rows[-1]
+    return encode_cursor(last_row.incident_time, last_row.id)
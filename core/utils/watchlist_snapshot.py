@@ -0,0 +1,132 @@
+"""
+Binary snapshots of a branch watchlist, for devices to load without parsing.
+
+A snapshot is little endian and made of, in order:
+
+    header      32 bytes, see HEADER
+    ids         int64[rows], incidents.id of each descriptor row
+    customers   int64[rows], customers.id of each descriptor row
+    matrix      float32[rows, dimension], or int8[rows, dimension]
+    scales      float32[rows], int8 snapshots only, row = matrix row * scale
+    metadata    UTF-8 JSON {"incident_ids": [...], "customer_ids": [...]}, the
+                incident_id and customer_id strings of each row
+
+A customer with two descriptors takes two rows. Every section starts on a
+multiple of its item size, so each one can be read with numpy.frombuffer, or
+from a memory map of the file, at offsets computed from the header.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"WLS1"
+FORMAT_VERSION = 1
+# magic, format version, dtype, reserved, watchlist version, rows, dimension,
+# metadata size
+HEADER = struct.Struct("<4sHBBQIIQ")
+DTYPES = {"float32": 0, "int8": 1}
+
+
+def quantize(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric int8 quantization, with a scale per row.
+    :return: the int8 matrix and the scales.
+    """
+    scales = np.abs(matrix).max(axis=1, initial=0) / 127
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+
+def encode_watchlist_snapshot(
+    version: int,
+    ids: np.ndarray,
+    customer_ids: np.ndarray,
+    matrix: np.ndarray,
+    incident_uuids: list[str],
+    customer_uuids: list[str],
+    dtype: str = "float32",
+) -> bytes:
+    """
+    Serializes the descriptor rows of a watchlist at a version.
+    """
+    rows, dimension = matrix.shape
+    metadata = json.dumps(
+        {"incident_ids": incident_uuids, "customer_ids": customer_uuids},
+        separators=(",", ":"),
+    ).encode("utf8")
+
+    sections = [
+        HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            DTYPES[dtype],
+            0,
+            version,
+            rows,
+            dimension,
+            len(metadata),
+        ),
+        np.asarray(ids, dtype="<i8").tobytes(),
+        np.asarray(customer_ids, dtype="<i8").tobytes(),
+    ]
+
+    if dtype == "int8":
+        quantized, scales = quantize(matrix)
+        sections += [quantized.tobytes(), scales.astype("<f4").tobytes()]
+    else:
+        sections.append(np.asarray(matrix, dtype="<f4").tobytes())
+
+    sections.append(metadata)
+    return b"".join(sections)
+
+
+def decode_watchlist_snapshot(data: bytes) -> dict:
+    """
+    Reads a snapshot back, the way a device does. The arrays are views of data.
+    """
+    (
+        magic,
+        format_version,
+        dtype,
+        _,
+        version,
+        rows,
+        dimension,
+        metadata_size,
+    ) = HEADER.unpack_from(data)
+
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError("Not a watchlist snapshot")
+
+    offset = HEADER.size
+    ids = np.frombuffer(data, dtype="<i8", count=rows, offset=offset)
+    offset += ids.nbytes
+    customer_ids = np.frombuffer(data, dtype="<i8", count=rows, offset=offset)
+    offset += customer_ids.nbytes
+
+    if dtype == DTYPES["int8"]:
+        quantized = np.frombuffer(
+            data, dtype=np.int8, count=rows * dimension, offset=offset
+        ).reshape(rows, dimension)
+        offset += quantized.nbytes
+        scales = np.frombuffer(data, dtype="<f4", count=rows, offset=offset)
+        offset += scales.nbytes
+        matrix = quantized * scales[:, None]
+    else:
+        matrix = np.frombuffer(
+            data, dtype="<f4", count=rows * dimension, offset=offset
+        ).reshape(rows, dimension)
+        offset += matrix.nbytes
+
+    metadata = json.loads(data[offset : offset + metadata_size])
+
+    return {
+        "version": version,
+        "ids": ids,
+        "customer_ids": customer_ids,
+        "matrix": matrix,
+        **metadata,
+    }